@@ -14,6 +14,10 @@ const CONFIG = {
     api: {
         timeout: 30000, // 30 seconds
         retryAttempts: 3
+    },
+    ocr: {
+        // OCR service base URL for completion events (/events/{id}); empty = poll the database instead
+        url: ''
     }
 };
 
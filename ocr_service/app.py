@@ -1,12 +1,89 @@
-import io
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
 import os
-from fastapi import FastAPI, UploadFile, HTTPException
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from fastapi import Body, FastAPI, File, Form, Header, UploadFile, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
 
-app = FastAPI(title="PASecure OCR Service", docs_url="/docs", redoc_url="/redoc")
+# First, so the worker count and thread limits are pinned before Tesseract or TensorFlow load
+import concurrency
+import engines
+import storage
+import profiling
+from cache import MISS, ResultCache, cache_key
+from classify import Classifier, ClassifierUnavailable, classify_input, to_input
+from deadline import GRACE_SECONDS, Deadline, DeadlineReport, DeadlineTracker, budget_seconds
+from decode import ImageRejected, plan as plan_decode
+from events import CompletionBroker, TooManyConnections
+from jobs import JobRunner
+from pipeline import TIERS, OCROptions, OCROutput, ocr_bytes, ocr_decoded
+from pool import BACKFILL, INTERACTIVE, LANES, PoolFull, WorkerPool
+from quality import QualityRejected
+from slabs import SlabPool, SlabRef
+from telemetry import OCRMetrics, server_timing
+from tiers import TierGovernor
+import verify
+from warmup import Warmup, warm_workers
+
+logger = logging.getLogger("ocr_service")
+
+# Worker pool for decode/preprocess/OCR (sized via OCR_WORKERS, OCR_MAX_QUEUE, OCR_EXECUTOR)
+pool = WorkerPool.from_env(initializer=engines.warm)
+
+# Shared-memory slabs for uploads and decoded images sent to process workers (OCR_SLAB_POOL_MB)
+slabs = SlabPool.from_env(process=pool.kind == 'process')
+
+# Time budget per request (X-OCR-Deadline-Ms, OCR_DEADLINE_MS, OCR_DEADLINE_SHARES)
+deadlines = DeadlineTracker(process=pool.kind == 'process')
+
+# Quality tier per request from pool pressure (OCR_TIER, OCR_TIER_*_DEPTH, OCR_TIER_*_LATENCY_MS)
+governor = TierGovernor(pool)
+
+# OCR results keyed by image hash (sized via OCR_CACHE_SIZE, OCR_CACHE_DIR)
+cache = ResultCache.from_env()
+
+# ID card CNN, loaded once at startup (OCR_MODEL_DIR, OCR_CLASSIFY_MAX_BATCH, OCR_CLASSIFY_MAX_WAIT_MS)
+classifier = Classifier.from_env()
+
+# cProfile artifacts of requested and sampled jobs (OCR_PROFILE_SECRET, OCR_PROFILE_SAMPLE_RATE, OCR_PROFILE_MAX_MB)
+profiles = profiling.ProfileStore.from_env()
+
+# Engine and model warm-up behind /ready (OCR_WARMUP, OCR_WARMUP_TIMEOUT_SECONDS)
+warmup = Warmup()
+
+# Prometheus metrics for /metrics; gauges are registered below, once every component exists
+metrics = OCRMetrics()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Concurrency plan: %s", json.dumps({**concurrency.configure().to_dict(),
+                                                    'effective': concurrency.effective()}))
+    # Serve /health while warming; /ready turns 200 when every engine is loaded
+    steps = [("classifier", classifier.start)]
+    if warmup.enabled:
+        steps.append(("workers", lambda: warm_workers(pool)))
+    warming = asyncio.create_task(warmup.run(steps))
+    await jobs.start()
+    events.start()
+    yield
+    warming.cancel()
+    await events.close()
+    await jobs.close()
+    await classifier.close()
+    pool.shutdown()
+    slabs.close()
+    deadlines.close()
+
+
+app = FastAPI(title="PASecure OCR Service", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -15,8 +92,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the per-stage timings and how the result was served
+    expose_headers=["Server-Timing", "X-OCR-Cache", "X-OCR-Tier", "X-OCR-Profile-Id"],
 )
 
+@app.middleware("http")
+async def server_timing_total(request: Request, call_next):
+    """A ``Server-Timing`` total on every response; the OCR endpoints set their own, per stage.
+
+    For streamed responses (batch, events) this is the time to the first byte.
+    """
+    started = time.perf_counter()
+    response = await call_next(request)
+    if "server-timing" not in response.headers:
+        response.headers["Server-Timing"] = f"total;dur={(time.perf_counter() - started) * 1000:.2f}"
+    return response
+
+
 # Root route - redirect to health or return service info
 @app.get("/")
 async def root():
@@ -26,132 +118,786 @@ async def root():
         "status": "running",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "ocr": "/ocr",
+            "ocr_batch": "/ocr/batch",
+            "classify": "/classify",
+            "verify": "/verify",
+            "ingest": "/ingest",
+            "jobs": "/jobs/{id}",
+            "events": "/events/{id}",
+            "metrics": "/metrics",
+            "profiles": "/profiles/{id}",
             "docs": "/docs"
         }
     }
 
-# Configure Tesseract path (for Windows/local dev)
-if os.name == 'nt':  # Windows
-    tesseract_path = os.getenv('TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe')
-    if os.path.exists(tesseract_path):
-        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+
+class OCRFields(BaseModel):
+    id_type: str | None = None
+    id_number: str | None = None
+    holder_name: str | None = None
+    date_of_birth: str | None = None
+    date_of_issue: str | None = None
+    valid_until: str | None = None
+    # 0-1 per extracted field
+    confidence: dict[str, float] = {}
+
+
+class RectifyInfo(BaseModel):
+    found: bool
+    # Clockwise degrees the card was turned
+    rotation: int = 0
+    ms: float
+
+
+class QualityVerdict(BaseModel):
+    ok: bool
+    sharpness: float
+    glare: float
+    contrast: int
+    resolution: int
+    ms: float
+    reasons: list[str] = []
 
 
 class OCRResult(BaseModel):
     text: str
+    psm: int | None = None
+    confidence: float | None = None
+    estimated_peak_bytes: int | None = None
+    fields: OCRFields | None = None
+    # Layout key when template region OCR was used instead of full-page OCR
+    template: str | None = None
+    rectify: RectifyInfo | None = None
+    quality: QualityVerdict | None = None
+    # full, balanced or fast
+    tier: str | None = None
+    # Cut short by the request's deadline: the best partial result
+    truncated: bool = False
+    # Budget, time per stage, and what was skipped or stopped
+    deadline: dict | None = None
+
+
+async def run_in_pool(fn, *args, options: OCROptions, deadline: Deadline, cost: int, lane: str,
+                      profile: str | None = None) -> dict:
+    """``fn(*args, deadline)`` on the worker pool, as a result dict.
+
+    A job that has produced nothing shortly after its deadline (still queued,
+    or stuck in a stage that cannot be interrupted) is abandoned with an empty
+    truncated result. When the caller is cancelled, e.g. because the client
+    disconnected, the worker is told to skip whatever it has not started.
+    Large arguments travel through shared-memory slabs instead of pickling.
+    With a ``profile`` id, or when this job is sampled, the worker writes a
+    cProfile of the job to that artifact.
+    """
+    profile = profile or profiles.sample()
+    if profile:
+        fn, args = profiling.run, (str(profiles.path(profile)), fn, *args)
+    started = time.perf_counter()
+    try:
+        with slabs.share(fn, args) as (call, call_args):
+            output = await asyncio.wait_for(pool.run(call, *call_args, deadline, cost=cost, lane=lane),
+                                            max(0.0, deadline.remaining()) + GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        deadlines.expired_queued += 1
+        deadline.cancel.set()
+        report = DeadlineReport(deadline)
+        report.skip('ocr')
+        output = OCROutput(text='', tier=options.tier, truncated=True, deadline=report.to_dict())
+    except asyncio.CancelledError:
+        deadlines.cancel(deadline)
+        raise
+    finally:
+        if profile:
+            profiles.prune(keep=profile)
+    result = asdict(output)
+    seconds = time.perf_counter() - started
+    governor.observe(result, seconds)
+    deadlines.record(result)
+    # The round trip minus the worker's own time: waiting for a worker, plus the handoff to and from it
+    result['timings_ms']['queue'] = round(max(0.0, seconds * 1000 - result['timings_ms'].get('worker', 0)), 2)
+    metrics.computed(result)
+    return result
+
+
+def _complete(result: dict) -> bool:
+    return not result.get('truncated')
 
 
-def preprocess_image(image: Image.Image) -> Image.Image:
-    """Apply image preprocessing to improve OCR accuracy"""
-    # Convert to RGB if necessary
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    # Convert to grayscale for better contrast
-    image = image.convert('L')
-    
-    # Resize if too small (Tesseract works better with larger images)
-    # Do this early to improve subsequent processing
-    width, height = image.size
-    if width < 1200 or height < 900:
-        scale = max(1200 / width, 900 / height)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    
-    # Apply aggressive contrast enhancement
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(3.0)  # Increase contrast by 3x
-    
-    # Enhance brightness to make text more visible
-    enhancer = ImageEnhance.Brightness(image)
-    image = enhancer.enhance(1.2)  # Slightly brighter
-    
-    # Enhance sharpness
-    enhancer = ImageEnhance.Sharpness(image)
-    image = enhancer.enhance(3.0)  # Increase sharpness by 3x
-    
-    # Apply denoising (median filter)
-    image = image.filter(ImageFilter.MedianFilter(size=3))
-    
-    # Apply unsharp mask for better edge definition
-    image = image.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
-    
-    return image
+async def process_image(image_bytes: bytes, options: OCROptions, lane: str = INTERACTIVE,
+                        tier: str | None = None, deadline: Deadline | None = None,
+                        profile: str | None = None) -> tuple[dict, str]:
+    """Run one image through the cache and worker pool. Returns (result, cache status).
+
+    ``tier`` pins the quality tier; by default the governor picks it from the
+    current load. Without a ``deadline`` the default budget applies. Truncated
+    results are returned but never cached. A ``profile`` request skips the
+    cache, so there is always a run to profile.
+    """
+    # Header-only probe: rejects oversized images before any pixels are decoded
+    decode_plan = plan_decode(image_bytes)
+    metrics.image(len(image_bytes), decode_plan.size[0] * decode_plan.size[1])
+    options = governor.apply(options, tier)
+    deadline = deadline or deadlines.new(budget_seconds(None))
+
+    async def compute():
+        # Decode, preprocess and OCR on the worker pool, off the event loop
+        cost = decode_plan.estimated_peak_bytes(options.preprocess)
+        return await run_in_pool(ocr_bytes, image_bytes, options, options=options, deadline=deadline, cost=cost,
+                                 lane=lane, profile=profile)
+
+    if profile:
+        return await compute(), MISS
+    key = cache_key(image_bytes, options.fingerprint())
+    return await cache.get_or_compute(key, compute, cacheable=_complete)
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def until_disconnected(request: Request, coro):
+    """Await ``coro``, cancelling it if the client disconnects first"""
+    work = asyncio.ensure_future(coro)
+
+    async def disconnected():
+        # The body has been read, so the next message is the disconnect (or the end of the response)
+        while (await request.receive())['type'] != 'http.disconnect':
+            pass
+
+    watcher = asyncio.create_task(disconnected())
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not work.done():
+        work.cancel()
+        await asyncio.gather(work, return_exceptions=True)
+        raise ClientDisconnected()
+    return work.result()
+
+
+def _parse_options(**params) -> OCROptions:
+    try:
+        return OCROptions.create(**params)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _priority(header: str | None, default: str) -> str:
+    """Scheduler lane from the X-OCR-Priority header"""
+    lane = (header or default).strip().lower()
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"X-OCR-Priority must be one of {', '.join(LANES)}")
+    return lane
+
+
+def _budget(header: str | None) -> float:
+    """Seconds from the X-OCR-Deadline-Ms header, or the default budget"""
+    try:
+        return budget_seconds(header)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _profile(token: str | None) -> str | None:
+    """Artifact id for a request that asks to be profiled with the X-OCR-Profile header"""
+    try:
+        return profiles.request(token)
+    except PermissionError as exc:
+        raise HTTPException(status_code=401, detail=str(exc)) from exc
+
+
+def _tier(value: str | None) -> str | None:
+    """Pinned quality tier from the ``tier`` parameter; None lets the governor choose"""
+    if value is not None and value not in TIERS:
+        raise HTTPException(status_code=400, detail=f"tier must be one of {', '.join(TIERS)}")
+    return value
+
 
 @app.post("/ocr", response_model=OCRResult)
-async def run_ocr(file: UploadFile):
+async def run_ocr(
+    file: UploadFile,
+    request: Request,
+    response: Response,
+    strategy: str | None = None,
+    preprocess: str | None = None,
+    extract: bool = False,
+    template: str | None = None,
+    rectify: bool | None = None,
+    tier: str | None = None,
+    x_ocr_priority: str | None = Header(default=None),
+    x_ocr_deadline_ms: str | None = Header(default=None),
+    x_ocr_profile: str | None = Header(default=None),
+):
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing file")
+    started = time.perf_counter()
+
+    options = _parse_options(strategy=strategy, preprocess=preprocess, extract=extract, template=template,
+                             rectify=rectify)
+    lane = _priority(x_ocr_priority, INTERACTIVE)
+    tier = _tier(tier)
+    deadline = deadlines.new(_budget(x_ocr_deadline_ms))
+    profile = _profile(x_ocr_profile)
+
+    # Read image bytes
+    image_bytes = await file.read()
 
     try:
-        # Read image bytes
-        image_bytes = await file.read()
-        
-        # Open image with PIL
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Preprocess image for better OCR
-        processed_image = preprocess_image(image)
-        
-        # Try multiple OCR configurations for better results
-        texts = []
-        
-        # Configuration 1: Default with PSM 6 (uniform block of text)
-        try:
-            text1 = pytesseract.image_to_string(
-                processed_image, 
-                lang="eng",
-                config='--psm 6 --oem 3'
-            )
-            if text1.strip():
-                texts.append(text1)
-        except:
-            pass
-        
-        # Configuration 2: PSM 11 (sparse text - single text line)
+        result, cache_status = await until_disconnected(
+            request, process_image(image_bytes, options, lane, tier, deadline, profile)
+        )
+    except ClientDisconnected as exc:
+        metrics.failure('disconnected')
+        logger.info("OCR cancelled: client disconnected")
+        raise HTTPException(status_code=499, detail="Client closed request") from exc
+    except PoolFull as exc:
+        metrics.failure('pool_full')
+        raise HTTPException(
+            status_code=503,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except QualityRejected as exc:
+        metrics.failure('quality_rejected')
+        logger.info("OCR skipped: quality=%s", exc.verdict.to_dict())
+        raise HTTPException(
+            status_code=exc.status_code,
+            detail={"error": "retake_photo", "message": str(exc), "quality": exc.verdict.to_dict()},
+        ) from exc
+    except ImageRejected as exc:
+        metrics.failure('image_rejected')
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+    except Exception as exc:
+        metrics.failure('error')
+        raise HTTPException(status_code=500, detail=f"OCR failed: {str(exc)}") from exc
+
+    total_ms = round((time.perf_counter() - started) * 1000, 2)
+    metrics.served('ocr', result, cache_status, total_ms)
+    response.headers["X-OCR-Cache"] = cache_status
+    response.headers["X-OCR-Tier"] = result["tier"]
+    response.headers["Server-Timing"] = server_timing(result, cache_status, total_ms)
+    if profile:
+        response.headers["X-OCR-Profile-Id"] = profile
+    logger.info(
+        "OCR finished: tier=%s psm=%s template=%s rectify=%s confidence=%s chars=%d estimated_peak_bytes=%s cache=%s "
+        "quality=%s truncated=%s",
+        result["tier"], result["psm"], result["template"], result["rectify"], result["confidence"],
+        len(result["text"]), result["estimated_peak_bytes"], cache_status, result["quality"], result["truncated"],
+    )
+    return OCRResult(**result)
+
+
+BATCH_MAX_ITEMS = int(os.getenv('OCR_BATCH_MAX_ITEMS', '50'))
+BATCH_MAX_BYTES = int(os.getenv('OCR_BATCH_MAX_MB', '100')) * 2**20
+# Attempts per batch item when the pool is momentarily full
+BATCH_POOL_RETRIES = 5
+
+
+@app.post("/ocr/batch")
+async def run_ocr_batch(
+    files: list[UploadFile] = File(default=[]),
+    paths: list[str] = Form(default=[]),
+    strategy: str | None = None,
+    preprocess: str | None = None,
+    extract: bool = False,
+    template: str | None = None,
+    rectify: bool | None = None,
+    tier: str | None = None,
+    x_ocr_priority: str | None = Header(default=None),
+    x_ocr_deadline_ms: str | None = Header(default=None),
+    authorization: str | None = Header(default=None),
+):
+    """OCR many images in one request, streaming one JSON line per image as it finishes.
+
+    Images come from uploaded ``files`` and/or storage ``paths``; ``paths``
+    need the ingest secret, since they read private uploads. Each line is
+    ``{"index", "source", "status", "cache", "result"}`` on success or
+    ``{"index", "source", "status", "error"}`` for an item that failed.
+    Batches run in the ``backfill`` lane unless ``X-OCR-Priority`` says otherwise,
+    and each item gets the quality tier the load calls for when it starts unless
+    ``tier`` pins one. ``X-OCR-Deadline-Ms`` is a budget per item, starting
+    when the item starts.
+    """
+    options = _parse_options(strategy=strategy, preprocess=preprocess, extract=extract, template=template,
+                             rectify=rectify)
+    lane = _priority(x_ocr_priority, BACKFILL)
+    tier = _tier(tier)
+    budget = _budget(x_ocr_deadline_ms)
+
+    if not files and not paths:
+        raise HTTPException(status_code=400, detail="Provide files or paths")
+    if paths:
+        _require_ingest()
+        if not _has_secret(authorization):
+            raise HTTPException(status_code=401, detail="Storage paths need the ingest secret")
+    if len(files) + len(paths) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_ITEMS} images")
+
+    uploads = []
+    total_bytes = 0
+    for upload in files:
+        data = await upload.read()
+        total_bytes += len(data)
+        if total_bytes > BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_BYTES // 2**20} MB")
+        uploads.append((upload.filename or f"file-{len(uploads)}", data))
+
+    # Storage downloads share whatever is left of the byte budget
+    remaining = [BATCH_MAX_BYTES - total_bytes]
+    # Keep a batch from occupying more than the pool's workers, so it queues
+    # behind itself instead of filling the admission queue for everyone else
+    slots = asyncio.Semaphore(pool.workers)
+
+    async def load(source: str, data: bytes | None) -> bytes:
+        if data is not None:
+            return data
+        data = await storage.fetch(source, max(0, remaining[0]))
+        remaining[0] -= len(data)
+        return data
+
+    async def run_item(index: int, source: str, data: bytes | None) -> dict:
+        line = {"index": index, "source": source}
+        started = time.perf_counter()
         try:
-            text2 = pytesseract.image_to_string(
-                processed_image,
-                lang="eng",
-                config='--psm 11 --oem 3'
-            )
-            if text2.strip() and text2 not in texts:
-                texts.append(text2)
-        except:
-            pass
-        
-        # Configuration 3: PSM 3 (fully automatic page segmentation)
+            async with slots:
+                image_bytes = await load(source, data)
+                for attempt in range(BATCH_POOL_RETRIES):
+                    try:
+                        deadline = deadlines.new(budget)
+                        result, cache_status = await process_image(image_bytes, options, lane, tier, deadline)
+                        break
+                    except PoolFull as exc:
+                        if attempt == BATCH_POOL_RETRIES - 1:
+                            raise
+                        await asyncio.sleep(exc.retry_after)
+        except PoolFull as exc:
+            metrics.failure('pool_full')
+            return {**line, "status": 503, "error": str(exc)}
+        except QualityRejected as exc:
+            metrics.failure('quality_rejected')
+            return {**line, "status": exc.status_code, "error": str(exc), "quality": exc.verdict.to_dict()}
+        except (ImageRejected, storage.StorageError) as exc:
+            metrics.failure('storage' if isinstance(exc, storage.StorageError) else 'image_rejected')
+            return {**line, "status": exc.status_code, "error": str(exc)}
+        except Exception as exc:
+            metrics.failure('error')
+            return {**line, "status": 500, "error": f"OCR failed: {exc}"}
+        metrics.served('batch', result, cache_status, (time.perf_counter() - started) * 1000)
+        return {**line, "status": 200, "cache": cache_status, "result": result}
+
+    items = [(name, data) for name, data in uploads] + [(path, None) for path in paths]
+
+    async def stream():
+        tasks = [asyncio.create_task(run_item(i, source, data)) for i, (source, data) in enumerate(items)]
         try:
-            text3 = pytesseract.image_to_string(
-                processed_image,
-                lang="eng",
-                config='--psm 3 --oem 3'
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away or the stream finished: drop anything still pending
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+class ClassifyResult(BaseModel):
+    label: str
+    confidence: float
+    probabilities: dict[str, float]
+
+
+@app.post("/classify", response_model=ClassifyResult)
+async def run_classify(file: UploadFile):
+    """Genuine/counterfeit card classification with the server-side CNN"""
+    if not classifier.available:
+        raise HTTPException(status_code=503, detail=f"Classifier unavailable: {classifier.error}")
+    image_bytes = await file.read()
+    try:
+        array = await asyncio.to_thread(classify_input, image_bytes)
+        result = await classifier.classify(array)
+    except ImageRejected as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
+    except ClassifierUnavailable as exc:
+        raise HTTPException(status_code=503, detail=f"Classifier unavailable: {exc}") from exc
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Classification failed: {exc}") from exc
+    logger.info("Classified: label=%s confidence=%s", result["label"], result["confidence"])
+    return ClassifyResult(**result)
+
+
+class VerifyResult(BaseModel):
+    # Classifier verdict; None when the classifier is unavailable
+    label: str | None = None
+    confidence: float | None = None
+    probabilities: dict[str, float] = {}
+    classifier_error: str | None = None
+    ocr: OCRResult
+    # decode (shared), ocr, classify and total wall time
+    timings_ms: dict[str, float]
+
+
+@app.post("/verify", response_model=VerifyResult)
+async def run_verify(
+    file: UploadFile,
+    request: Request,
+    response: Response,
+    strategy: str | None = None,
+    preprocess: str | None = None,
+    template: str | None = None,
+    rectify: bool | None = None,
+    tier: str | None = None,
+    x_ocr_priority: str | None = Header(default=None),
+    x_ocr_deadline_ms: str | None = Header(default=None),
+    x_ocr_profile: str | None = Header(default=None),
+):
+    """Classify and OCR one card in a single call.
+
+    The image is decoded once; the OCR pipeline and the classifier then run
+    concurrently on that decode, so the call takes about max(OCR, CNN).
+    """
+    options = _parse_options(strategy=strategy, preprocess=preprocess, extract=True, template=template,
+                             rectify=rectify)
+    lane = _priority(x_ocr_priority, INTERACTIVE)
+    options = governor.apply(options, _tier(tier))
+    deadline = deadlines.new(_budget(x_ocr_deadline_ms))
+    profile = _profile(x_ocr_profile)
+    image_bytes = await file.read()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def timed(coro):
+        begun = loop.time()
+        result = await coro
+        return result, (loop.time() - begun) * 1000
+
+    async def ocr_prepared(prepared):
+        async def compute():
+            cost = prepared.decode_plan.estimated_peak_bytes(options.preprocess)
+            return await run_in_pool(
+                ocr_decoded, prepared.gray, prepared.decode_plan, options, prepared.quality, prepared.rectify,
+                options=options, deadline=deadline, cost=cost, lane=lane, profile=profile,
             )
-            if text3.strip() and text3 not in texts:
-                texts.append(text3)
-        except:
-            pass
-        
-        # Combine all results, prioritizing longer/more complete text
-        if texts:
-            # Use the text with most content
-            text = max(texts, key=len)
-        else:
-            # Fallback to basic OCR
-            text = pytesseract.image_to_string(processed_image, lang="eng")
-        
-        # Clean up whitespace
-        text = text.strip()
-        
+        if profile:
+            return await compute(), MISS
+        return await cache.get_or_compute(cache_key(image_bytes, options.fingerprint()), compute,
+                                          cacheable=_complete)
+
+    async def run_classifier(prepared):
+        if not classifier.available:
+            return None
+        small = prepared.thumbnail
+        return await classifier.classify(to_input(slabs.image(small) if isinstance(small, SlabRef) else small))
+
+    async def prepare(decode_plan, out):
+        # On the worker pool like OCR itself, so the decode is admitted, queued by lane and
+        # counted against the memory budget
+        args = (image_bytes, options, decode_plan, out, deadline)
+        with slabs.share(verify.prepare, args) as (call, call_args):
+            try:
+                return await pool.run(call, *call_args, cost=verify.estimated_peak_bytes(decode_plan, options),
+                                      lane=lane)
+            except asyncio.CancelledError:
+                deadlines.cancel(deadline)
+                raise
+
+    async def run_both():
+        decode_plan = plan_decode(image_bytes)
+        metrics.image(len(image_bytes), decode_plan.size[0] * decode_plan.size[1])
+        # The worker writes the page and the thumbnail here; both consumers read them from it
+        with slabs.output(verify.output_bytes(decode_plan, options)) as out:
+            prepared = await prepare(decode_plan, out)
+            ocr_task = asyncio.create_task(timed(ocr_prepared(prepared)))
+            cnn_task = asyncio.create_task(timed(run_classifier(prepared)))
+            try:
+                return prepared, *await asyncio.gather(ocr_task, cnn_task)
+            finally:
+                ocr_task.cancel()
+                cnn_task.cancel()
+
+    try:
+        prepared, ((result, cache_status), ocr_ms), (classification, cnn_ms) = await until_disconnected(
+            request, run_both()
+        )
+    except ClientDisconnected as exc:
+        metrics.failure('disconnected')
+        logger.info("Verify cancelled: client disconnected")
+        raise HTTPException(status_code=499, detail="Client closed request") from exc
+    except PoolFull as exc:
+        metrics.failure('pool_full')
+        raise HTTPException(
+            status_code=503,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except QualityRejected as exc:
+        metrics.failure('quality_rejected')
+        logger.info("Verify skipped: quality=%s", exc.verdict.to_dict())
+        raise HTTPException(
+            status_code=exc.status_code,
+            detail={"error": "retake_photo", "message": str(exc), "quality": exc.verdict.to_dict()},
+        ) from exc
+    except ImageRejected as exc:
+        metrics.failure('image_rejected')
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)) from exc
     except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"OCR failed: {str(exc)}") from exc
+        metrics.failure('error')
+        raise HTTPException(status_code=500, detail=f"Verification failed: {exc}") from exc
+
+    response.headers["X-OCR-Cache"] = cache_status
+    response.headers["X-OCR-Tier"] = result["tier"]
+    timings = {
+        "decode": round(prepared.seconds * 1000, 2),
+        "ocr": round(ocr_ms, 2),
+        "classify": round(cnn_ms, 2),
+        "total": round((loop.time() - started) * 1000, 2),
+    }
+    metrics.served('verify', result, cache_status, timings["total"])
+    response.headers["Server-Timing"] = server_timing(
+        result, cache_status, timings["total"], {"decode": timings["decode"], "classify": timings["classify"]}
+    )
+    if profile:
+        response.headers["X-OCR-Profile-Id"] = profile
+    logger.info(
+        "Verified: label=%s confidence=%s chars=%d cache=%s timings_ms=%s",
+        classification and classification["label"], classification and classification["confidence"],
+        len(result["text"]), cache_status, timings,
+    )
+    return VerifyResult(
+        **(classification or {"classifier_error": classifier.error or "classifier unavailable"}),
+        ocr=OCRResult(**result),
+        timings_ms=timings,
+    )
+
+
+# Shared secret the database webhook sends as "Authorization: Bearer <secret>". Unset
+# disables /ingest and /jobs: they would otherwise fetch and return any stored ID card.
+INGEST_SECRET = os.getenv('OCR_INGEST_SECRET', '')
+INGEST_OPTIONS = OCROptions.create(extract=True)
+
+
+async def run_job(image_bytes: bytes) -> dict:
+    # Someone has just uploaded and is waiting on the page. A truncated result is
+    # stored as it is, with ``truncated`` set: a retry would run into the same deadline.
+    result, _ = await process_image(image_bytes, INGEST_OPTIONS, INTERACTIVE)
+    return result
+
+
+def publish_completion(job) -> None:
+    events.publish(job)
+
+
+# Durable queue of pushed verifications (OCR_JOBS_DB), started as soon as they arrive
+jobs = JobRunner.from_env(run_job, concurrency=pool.workers, on_finish=publish_completion)
+
+# Server-sent completion events per verification (OCR_EVENTS_MAX_CONNECTIONS, OCR_EVENTS_TIMEOUT_SECONDS)
+events = CompletionBroker(jobs.queue.finished)
+
+
+def _ingest_record(payload: dict) -> dict | None:
+    """The new row from a Supabase database webhook, or a bare {id, file_path} notification"""
+    if 'record' not in payload:
+        return payload
+    if payload.get('table', 'verifications') != 'verifications' or payload.get('type') not in ('INSERT', 'UPDATE'):
+        return None
+    record = payload.get('record') or {}
+    # Updates only matter when a row is put back to pending, e.g. by an admin retry
+    if payload['type'] == 'UPDATE' and record.get('ocr_status') != 'pending':
+        return None
+    return record
 
-    return OCRResult(text=text)
+
+def job_token(job_id: str) -> str:
+    """Per-job token for ``GET /jobs/{id}``, so a caller can read one job without the secret"""
+    return hmac.new(INGEST_SECRET.encode(), f"job:{job_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def _require_ingest() -> None:
+    if not INGEST_SECRET:
+        raise HTTPException(status_code=503, detail="Push ingestion is disabled: OCR_INGEST_SECRET is not set")
+
+
+def _has_secret(authorization: str | None) -> bool:
+    return hmac.compare_digest(authorization or '', f"Bearer {INGEST_SECRET}")
+
+
+def _authorize_job(job_id: str, job, authorization: str | None, token: str | None) -> None:
+    """Let through the ingest secret, the job's token, or the key of the browser that uploaded it"""
+    if _has_secret(authorization) or hmac.compare_digest(token or '', job_token(job_id)):
+        return
+    if job is not None and job.key_hash and token is not None:
+        if hmac.compare_digest(hashlib.sha256(token.encode()).hexdigest(), job.key_hash):
+            return
+    raise HTTPException(status_code=401, detail="Invalid job token")
+
+
+class IngestResult(BaseModel):
+    id: str
+    status: str
+    # False when the job already existed (a webhook redelivery)
+    created: bool
+    # Pass as ?token= to GET /jobs/{id}
+    token: str
+
+
+@app.post("/ingest", status_code=202)
+async def ingest(payload: dict = Body(...), authorization: str | None = Header(default=None)):
+    """Queue OCR for a newly inserted verification; poll ``/jobs/{id}`` for the result"""
+    _require_ingest()
+    if not _has_secret(authorization):
+        raise HTTPException(status_code=401, detail="Invalid ingest secret")
+    record = _ingest_record(payload)
+    if record is None:
+        return {"ignored": True}
+    if not record.get('id') or not record.get('file_path'):
+        raise HTTPException(status_code=400, detail="Notification needs a verification id and file_path")
+    job, created = await jobs.enqueue(str(record['id']), record['file_path'], record.get('ocr_events_key_hash'))
+    logger.info("Ingested verification %s: status=%s created=%s", job.id, job.status, created)
+    return IngestResult(id=job.id, status=job.status, created=created, token=job_token(job.id))
+
+
+class JobStatus(BaseModel):
+    id: str
+    # queued, running, complete, failed, or skipped (the verification was no longer pending)
+    status: str
+    attempts: int
+    enqueued_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: OCRResult | None = None
+    error: str | None = None
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, token: str | None = None, authorization: str | None = Header(default=None)):
+    """The job's status and OCR result, for the ingest secret or the job's own token"""
+    _require_ingest()
+    job = await jobs.get(job_id)
+    _authorize_job(job_id, job, authorization, token)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return JobStatus(**job.to_dict())
+
+
+@app.get("/events/{verification_id}")
+async def verification_events(verification_id: str, token: str | None = None,
+                              authorization: str | None = Header(default=None)):
+    """Server-sent events: one ``complete`` event when OCR for the verification finishes.
+
+    The event data is ``{"id", "status", "fields", "truncated", "error", "finished_at"}``.
+    The stream sends ``: ping`` comments while waiting and ends with a
+    ``timeout`` event after ``OCR_EVENTS_TIMEOUT_SECONDS``. It needs the same
+    credentials as ``/jobs``; EventSource cannot send headers, so browsers
+    pass their key as ``?token=``.
+    """
+    _require_ingest()
+    job = await jobs.get(verification_id)
+    _authorize_job(verification_id, job, authorization, token)
+    try:
+        body = events.stream(verification_id, job)
+    except TooManyConnections as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "30"}) from exc
+    return StreamingResponse(body, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Keep reverse proxies from buffering the stream
+        "X-Accel-Buffering": "no",
+    })
+
+
+def _register_gauges() -> None:
+    r = metrics.registry
+    r.gauge('ocr_pool_workers', 'Worker processes or threads', lambda: pool.workers)
+    r.gauge('ocr_pool_in_flight', 'Jobs running on a worker', lambda: pool.in_flight)
+    r.gauge('ocr_pool_queue_depth', 'Jobs admitted and waiting for a worker', lambda: pool.queue_depth)
+    r.gauge('ocr_pool_free_workers', 'Workers not handed a job', lambda: pool.spare()['free_workers'])
+    r.gauge('ocr_ready', '1 once the warm-up has finished', lambda: int(warmup.ready))
+    r.gauge('ocr_lane_queued', 'Jobs waiting for a worker, by priority lane',
+            lambda: {name: lane.queued for name, lane in pool.lanes.items()}, 'lane')
+    r.gauge('ocr_lane_running', 'Jobs running on a worker, by priority lane',
+            lambda: {name: lane.running for name, lane in pool.lanes.items()}, 'lane')
+    r.gauge('ocr_lane_rejected_total', 'Jobs turned away with 503, by priority lane',
+            lambda: {name: lane.rejected for name, lane in pool.lanes.items()}, 'lane', kind='counter')
+    queue_wait = r.histogram('ocr_lane_queue_wait_ms', 'Wait from admission to a worker, by priority lane',
+                             (), ('lane',))
+    for name, lane in pool.lanes.items():
+        queue_wait.bind(lane.queue_wait_ms, lane=name)
+    r.gauge('ocr_tier_level', 'Quality tier the governor currently picks (0 full, 1 balanced, 2 fast)',
+            lambda: governor.level)
+    r.gauge('ocr_cache_entries', 'Results held in the memory cache', lambda: cache.stats()['entries'])
+    r.gauge('ocr_slab_allocated_bytes', 'Shared memory held for worker handoff', lambda: slabs.allocated)
+    r.gauge('ocr_event_connections', 'Open server-sent event streams', lambda: events.connections)
+    r.gauge('ocr_pass_timeouts_total', 'Tesseract passes stopped at the deadline', lambda: deadlines.pass_timeouts,
+            kind='counter')
+
+
+_register_gauges()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text exposition: stage and pass latency, failures, winning PSM, pool gauges, image sizes"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _authorize_profiles(token: str | None) -> None:
+    if not profiles.authorized(token):
+        raise HTTPException(status_code=401, detail="Invalid profile token")
+
+
+@app.get("/profiles")
+async def list_profiles(x_ocr_profile: str | None = Header(default=None)):
+    """Stored profile artifacts, newest first"""
+    _authorize_profiles(x_ocr_profile)
+    return {"profiles": profiles.list()}
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = 'pstats', x_ocr_profile: str | None = Header(default=None)):
+    """One profile: the ``pstats`` file (load with ``python -m pstats`` or snakeviz), or ``format=text``"""
+    _authorize_profiles(x_ocr_profile)
+    if format not in ('pstats', 'text'):
+        raise HTTPException(status_code=400, detail="format must be pstats or text")
+    path = profiles.path(profile_id)
+    if path is None or not path.exists():
+        # Not written yet (still running), pruned, or never existed
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    if format == 'text':
+        text = await asyncio.to_thread(profiles.text, profile_id)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Unknown profile")
+        return PlainTextResponse(text)
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+
+@app.get("/ready")
+async def readiness_check():
+    """200 once the warm-up has loaded every engine and model; 503 until then (or if it failed)"""
+    body = {"ready": warmup.ready, "warmup": warmup.stats(), "capacity": pool.spare()}
+    if not warmup.ready:
+        return JSONResponse(body, status_code=503, headers={"Retry-After": "5"})
+    return body
 
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "ok", "service": "PASecure OCR Service"}
+    """Liveness, plus the state of every component and the spare capacity"""
+    return {
+        "status": "ok",
+        "service": "PASecure OCR Service",
+        "ready": warmup.ready,
+        "capacity": pool.spare(),
+        "engine": engines.engine_name(),
+        "concurrency": {**concurrency.configure().to_dict(), "effective": concurrency.effective()},
+        "pool": pool.stats(),
+        "slabs": slabs.stats(),
+        "cache": cache.stats(),
+        "classifier": classifier.stats(),
+        "tiers": governor.stats(),
+        "deadlines": deadlines.stats(),
+        "warmup": warmup.stats(),
+        "profiles": profiles.stats(),
+        "jobs": jobs.stats(),
+        "events": events.stats(),
+    }
@@ -0,0 +1,155 @@
+"""Shared helpers for the OCR service benchmarks.
+
+Benchmarks are plain scripts, run from the ``ocr_service`` directory:
+
+    python benchmarks/engines_ab.py --iterations 20
+"""
+import io
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+REPO_ROOT = SERVICE_DIR.parent
+SAMPLE_IDS = REPO_ROOT / 'sample_data' / 'sample_ids.json'
+IMAGE_DIRS = (REPO_ROOT / 'ml' / 'data' / 'images', REPO_ROOT / 'ml' / 'data' / 'val')
+
+# Make the service modules importable from benchmarks/
+if str(SERVICE_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVICE_DIR))
+
+
+def load_records() -> list[dict]:
+    with open(SAMPLE_IDS, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def synthetic_card(record: dict | None = None, size: tuple[int, int] = (1012, 638), seed: int = 0) -> Image.Image:
+    """Render a plain ID-card-like image from a sample record"""
+    record = record or load_records()[0]
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, (236, 240, 232))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    title = 'Office of Senior Citizens Affairs' if record['id_type'] == 'senior_citizen' else 'Persons with Disability Affairs Office'
+    header = ['REPUBLIC OF THE PHILIPPINES', title, 'Pasig City']
+    # Label column on the left, values from 30% of the width
+    rows = [
+        ('Name:', (record.get('holder_name') or 'UNKNOWN').upper()),
+        ('Address:', record.get('address') or ''),
+        ('Date of Birth:', record.get('date_of_birth') or ''),
+        ('ID No.:', record.get('id_number') or ''),
+        ('Date of Issue:', record.get('date_of_issue') or ''),
+    ]
+    value_x = int(size[0] * 0.30)
+    y = 40
+    for line in header:
+        draw.text((60 + rng.randint(0, 8), y), line, fill=(20, 20, 20), font=font)
+        y += 60
+    for label, value in rows:
+        jitter = rng.randint(0, 8)
+        draw.text((60 + jitter, y), label, fill=(20, 20, 20), font=font)
+        draw.text((value_x + jitter, y), value, fill=(20, 20, 20), font=font)
+        y += 60
+    return image
+
+
+def _perspective_data(output: list, source: list) -> list[float]:
+    """Pillow PERSPECTIVE data sending each ``output`` point to its ``source`` point"""
+    rows, rhs = [], []
+    for (x, y), (u, v) in zip(output, source):
+        rows.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        rows.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+        rhs += [u, v]
+    return np.linalg.solve(np.array(rows, dtype=float), np.array(rhs, dtype=float)).tolist()
+
+
+def captured_card(card: Image.Image, scene_size: tuple[int, int] = (2400, 1800), angle: float = 0.0,
+                  tilt: float = 0.0, seed: int = 0) -> tuple[Image.Image, list[tuple[float, float]]]:
+    """Place ``card`` on a darker, noisy background as a camera would see it.
+
+    The card is rotated by ``angle`` degrees and its corners jittered by up to
+    ``tilt`` of its width for perspective. Returns the scene and the card's
+    corners in it (TL, TR, BR, BL of the card's own orientation).
+    """
+    rng = random.Random(seed)
+    sw, sh = scene_size
+    scene = Image.effect_noise(scene_size, 24).point(lambda v: 40 + v // 3).convert('RGB')
+    cw, ch = card.size
+    fit = 0.6 * min(sw / max(cw, ch), sh / max(cw, ch))
+    w, h = cw * fit, ch * fit
+    cx, cy = sw / 2 + rng.uniform(-0.05, 0.05) * sw, sh / 2 + rng.uniform(-0.05, 0.05) * sh
+    rad = math.radians(angle)
+    corners = []
+    for x, y in ((-w / 2, -h / 2), (w / 2, -h / 2), (w / 2, h / 2), (-w / 2, h / 2)):
+        x += rng.uniform(-tilt, tilt) * w
+        y += rng.uniform(-tilt, tilt) * w
+        corners.append((cx + x * math.cos(rad) - y * math.sin(rad), cy + x * math.sin(rad) + y * math.cos(rad)))
+    card_corners = [(0, 0), (cw, 0), (cw, ch), (0, ch)]
+    data = _perspective_data(corners, card_corners)
+    warped = card.convert('RGB').transform(scene_size, Image.Transform.PERSPECTIVE, data, Image.Resampling.BICUBIC)
+    mask = Image.new('L', card.size, 255).transform(scene_size, Image.Transform.PERSPECTIVE, data)
+    scene.paste(warped, mask=mask)
+    return scene, corners
+
+
+def corpus_images() -> list[tuple[str, bytes]]:
+    """Card images from the ML dataset, plus synthetic cards for every sample record"""
+    images = []
+    for directory in IMAGE_DIRS:
+        for path in sorted(directory.rglob('*')):
+            if path.suffix.lower() in ('.jpg', '.jpeg', '.png'):
+                images.append((str(path.relative_to(REPO_ROOT)), path.read_bytes()))
+    for i, record in enumerate(load_records()):
+        images.append((f"synthetic/{record['label']}_{i}.jpg", to_jpeg(synthetic_card(record, seed=i))))
+    return images
+
+
+def to_jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    image.convert('RGB').save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in milliseconds"""
+    ms = [s * 1000 for s in samples]
+    return {
+        'n': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else 0.0,
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+    }
+
+
+def timed(fn, iterations: int, warmup: int = 1) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def print_table(rows: list[dict], columns: list[str]) -> None:
+    widths = [max(len(col), *(len(str(row.get(col, ''))) for row in rows)) for col in columns]
+    print('  '.join(col.ljust(w) for col, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row.get(col, '')).ljust(w) for col, w in zip(columns, widths)))
@@ -0,0 +1,38 @@
+"""A/B latency of the pytesseract subprocess path vs. warm tesserocr handles.
+
+Usage (from ocr_service/):
+  python benchmarks/engines_ab.py --iterations 20
+"""
+import argparse
+
+from common import print_table, summarize, synthetic_card, timed
+
+import engines
+from pipeline import PSM_MODES
+from preprocess import preprocess_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    image = preprocess_image(synthetic_card())
+    candidates = ['pytesseract']
+    if engines.tesserocr is not None:
+        candidates.append('tesserocr')
+        # Handle creation is the startup cost being measured away, so do it first
+        engines.get_pool().warm(1)
+    else:
+        print('tesserocr is not installed, only measuring the pytesseract path')
+
+    rows = []
+    for engine in candidates:
+        for psm in PSM_MODES:
+            samples = timed(lambda: engines.image_to_text(image, psm, engine=engine), args.iterations)
+            rows.append({'engine': engine, 'psm': psm, **summarize(samples)})
+    print_table(rows, ['engine', 'psm', 'n', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+if __name__ == '__main__':
+    main()
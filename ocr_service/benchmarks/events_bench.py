@@ -0,0 +1,164 @@
+"""Load test for the /events completion stream.
+
+Opens many idle event streams plus ``--fanout`` subscribers on each of
+``--jobs`` verifications, then ingests those verifications and measures how
+long each subscriber takes to receive its completion after the job finished.
+Reports server memory per open connection, and the broker's publish cost,
+which stays flat however many subscribers share an ID.
+
+By default the service is started as a subprocess on a free port with a
+throwaway job queue and a synthetic card on disk. With ``--url`` it runs
+against a running service instead; ``--file-path`` must then name an image
+that service can read, and ``--secret`` its ``OCR_INGEST_SECRET``.
+
+Usage (from ocr_service/):
+  python benchmarks/events_bench.py --idle 5000 --fanout 200 --jobs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from common import SERVICE_DIR, print_table, summarize, synthetic_card, to_jpeg
+
+
+def get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.load(response)
+
+
+def post_json(url: str, body: dict, secret: str) -> dict:
+    headers = {'Content-Type': 'application/json', 'Authorization': f"Bearer {secret}"}
+    request = urllib.request.Request(url, json.dumps(body).encode(), headers)
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+
+def rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def start_server(tmp: Path, secret: str) -> tuple[subprocess.Popen, str]:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    (tmp / 'card.jpg').write_bytes(to_jpeg(synthetic_card()))
+    env = {**os.environ, 'OCR_JOBS_DB': str(tmp / 'jobs.db'), 'OCR_WORKER_FILES_DIR': str(tmp),
+           'OCR_EVENTS_MAX_CONNECTIONS': '1000000', 'OCR_INGEST_SECRET': secret}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--port', str(port), '--log-level', 'warning',
+         '--backlog', '4096'],
+        cwd=SERVICE_DIR, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            get_json(f"{url}/health")
+            return server, url
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("service did not start")
+
+
+async def subscribe(url: str, id: str, secret: str):
+    """Open one event stream; returns (event data, receive time) or None when it ended without one"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    writer.write(f"GET /events/{id} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: text/event-stream\r\n"
+                 f"Authorization: Bearer {secret}\r\n\r\n".encode())
+    await writer.drain()
+    event = None
+    try:
+        while line := await reader.readline():
+            if line.startswith(b'event: '):
+                event = line[7:].strip().decode()
+            elif line.startswith(b'data: ') and event == 'complete':
+                return json.loads(line[6:]), time.time()
+    finally:
+        writer.close()
+    return None
+
+
+async def run(args, url: str, server_pid: int | None):
+    resource.setrlimit(resource.RLIMIT_NOFILE, (resource.getrlimit(resource.RLIMIT_NOFILE)[1],) * 2)
+    stamp = int(time.time())
+    job_ids = [f"bench-{stamp}-{j}" for j in range(args.jobs)]
+    targets = [f"idle-{stamp}-{i}" for i in range(args.idle)] + [id for id in job_ids for _ in range(args.fanout)]
+    total = len(targets)
+    rss_before = rss_bytes(server_pid) if server_pid else 0
+
+    started = time.perf_counter()
+    tasks = []
+    # Connect in waves so the listen backlog is not overrun
+    for start in range(0, total, 500):
+        tasks += [asyncio.create_task(subscribe(url, id, args.secret)) for id in targets[start:start + 500]]
+        await asyncio.sleep(0.05)
+    # Wait until the service has registered every stream
+    while (await asyncio.to_thread(get_json, f"{url}/health"))['events']['connections'] < total:
+        await asyncio.sleep(0.1)
+    connect_seconds = time.perf_counter() - started
+    rss_open = rss_bytes(server_pid) if server_pid else 0
+
+    for id in job_ids:
+        await asyncio.to_thread(post_json, f"{url}/ingest", {'id': id, 'file_path': args.file_path}, args.secret)
+    results = await asyncio.gather(*tasks[args.idle:])
+    for task in tasks[:args.idle]:
+        task.cancel()
+    await asyncio.gather(*tasks[:args.idle], return_exceptions=True)
+
+    delays = [received - event['finished_at'] for event, received in filter(None, results)]
+    stats = (await asyncio.to_thread(get_json, f"{url}/health"))['events']
+    print(f"\n{total} streams open in {connect_seconds:.1f}s ({args.idle} idle, "
+          f"{args.jobs} jobs x {args.fanout} subscribers); peak {stats['peak_connections']}")
+    if server_pid:
+        per = (rss_open - rss_before) / total
+        print(f"server RSS {rss_before / 2**20:.0f} MB -> {rss_open / 2**20:.0f} MB "
+              f"({per / 1024:.1f} KB per connection)")
+    print(f"completions received: {len(delays)} of {args.jobs * args.fanout}")
+    publish = stats['publish_ms']
+    print(f"publishes: {publish['count']}, mean {publish['sum'] / max(1, publish['count']):.3f} ms each")
+    print_table([{'stat': 'finish -> receive', **summarize(delays)}],
+                ['stat', 'n', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='running service (default: start one)')
+    parser.add_argument('--file-path', default='card.jpg', help='image path to ingest (with --url)')
+    parser.add_argument('--secret', default=os.getenv('OCR_INGEST_SECRET', ''),
+                        help="the service's OCR_INGEST_SECRET (with --url)")
+    parser.add_argument('--idle', type=int, default=2000, help='streams on IDs that never complete')
+    parser.add_argument('--fanout', type=int, default=100, help='subscribers per completing ID')
+    parser.add_argument('--jobs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run(args, args.url.rstrip('/'), None))
+        return
+    args.secret = secrets.token_hex(16)
+    with tempfile.TemporaryDirectory() as tmp:
+        server, url = start_server(Path(tmp), args.secret)
+        try:
+            asyncio.run(run(args, url, server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
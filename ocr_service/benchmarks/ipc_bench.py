@@ -0,0 +1,78 @@
+"""Per-request IPC cost of handing images to process workers: pickling vs. shared-memory slabs.
+
+Sends the two payloads the service hands to its process pool: a camera
+upload (JPEG bytes, for /ocr) and a decoded grayscale page (a PIL image, for
+/verify). The job itself only touches the pixels, so the measured round trip
+is the handoff alone. With ``slab`` the payload goes through a recycled
+``SlabPool`` slab and the worker maps it in place.
+
+Usage (from ocr_service/):
+  python benchmarks/ipc_bench.py --iterations 200
+"""
+import argparse
+import asyncio
+import time
+from PIL import Image
+
+from common import captured_card, print_table, summarize, synthetic_card, to_jpeg
+
+from pool import WorkerPool
+from slabs import SlabPool
+
+
+def touch(payload) -> int:
+    """Read one byte per 4 KB page, as a decoder or filter would fault the buffer in"""
+    if isinstance(payload, Image.Image):
+        width, height = payload.size
+        return sum(payload.getpixel((i % width, i // width)) for i in range(0, width * height, 4096))
+    return sum(memoryview(payload)[::4096])
+
+
+async def measure(pool: WorkerPool, slabs: SlabPool | None, payload, iterations: int) -> list[float]:
+    samples = []
+    for i in range(iterations + 1):
+        started = time.perf_counter()
+        if slabs is None:
+            await pool.run(touch, payload)
+        else:
+            with slabs.share(touch, (payload,)) as (call, args):
+                await pool.run(call, *args)
+        if i:  # the first round trip starts the worker
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    scene, _ = captured_card(synthetic_card(), scene_size=(4000, 3000))
+    payloads = {
+        'upload (jpeg)': to_jpeg(scene, quality=95),
+        'decoded gray 2400px': scene.convert('L').resize((2400, 1800)),
+    }
+    pool = WorkerPool(1, 1, 'process')
+    slabs = SlabPool(256 * 2**20)
+
+    async def run() -> list[dict]:
+        rows = []
+        for name, payload in payloads.items():
+            size = len(payload) if isinstance(payload, bytes) else payload.width * payload.height
+            for path, pool_slabs in (('pickle', None), ('slab', slabs)):
+                samples = await measure(pool, pool_slabs, payload, args.iterations)
+                rows.append({'payload': name, 'MB': round(size / 2**20, 1), 'path': path, **summarize(samples)})
+        return rows
+
+    try:
+        rows = asyncio.run(run())
+    finally:
+        pool.shutdown()
+        stats = slabs.stats()
+        slabs.close()
+    print_table(rows, ['payload', 'MB', 'path', 'n', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+    print(f"slabs created {stats['created']}, reused {stats['reused']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Interactive latency under a backfill flood, with and without priority lanes.
+
+Fills the worker pool with backfill jobs, then submits interactive jobs at a
+steady rate and reports latency per class of job. Jobs are sleeps of
+``--job-ms`` on a thread pool, so this measures the scheduler alone, not
+OCR. The ``fifo`` run submits everything to one lane, which is how the pool
+behaved before lanes.
+
+Usage (from ocr_service/):
+  python benchmarks/lanes_bench.py --workers 4 --backfill 400 --interactive 40
+"""
+import argparse
+import asyncio
+import time
+
+from common import print_table, summarize
+
+from pool import BACKFILL, INTERACTIVE, LANES, WorkerPool
+
+
+async def flood(pool: WorkerPool, args, lanes: bool) -> dict[str, list[float]]:
+    async def submit(lane: str) -> float:
+        started = time.perf_counter()
+        await pool.run(time.sleep, args.job_ms / 1000, lane=lane if lanes else BACKFILL)
+        return time.perf_counter() - started
+
+    backfill = [asyncio.create_task(submit(BACKFILL)) for _ in range(args.backfill)]
+    await asyncio.sleep(0.01)
+    interactive = []
+    for _ in range(args.interactive):
+        interactive.append(asyncio.create_task(submit(INTERACTIVE)))
+        await asyncio.sleep(args.interval_ms / 1000)
+    return {INTERACTIVE: await asyncio.gather(*interactive), BACKFILL: await asyncio.gather(*backfill)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--backfill', type=int, default=400)
+    parser.add_argument('--interactive', type=int, default=40)
+    parser.add_argument('--interval-ms', type=float, default=50)
+    parser.add_argument('--job-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    queues = dict.fromkeys(LANES, args.backfill + args.interactive)
+    rows = []
+    for name, lanes in (('fifo', False), ('lanes', True)):
+        pool = WorkerPool(args.workers, 0, 'thread', lane_queues=queues,
+                          interactive_reserved=max(1, args.workers // 4))
+        try:
+            latencies = asyncio.run(flood(pool, args, lanes))
+        finally:
+            pool.shutdown()
+        for job, samples in latencies.items():
+            rows.append({'scheduler': name, 'jobs': job, **summarize(samples)})
+    print_table(rows, ['scheduler', 'jobs', 'n', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""End-to-end load test: replay card images against /ocr (or another upload endpoint).
+
+By default the service runs in this process, on uvicorn in a background
+thread on a free port, with a throwaway job queue. ``--env`` settings (e.g.
+``OCR_PASS_STRATEGY=first_good``) are applied before the app is imported.
+With ``--url`` the load goes to a running service instead. Either way the
+run starts once ``/ready`` says the service is warm.
+
+Two kinds of load, each at one or more levels:
+
+* closed loop (``--concurrency 1,4,8``): that many clients, each sending the
+  next image as soon as its previous request returns.
+* open loop (``--rate 2,5,10``): requests start at a fixed rate in requests
+  per second, or as a Poisson process with ``--poisson``, whether or not
+  earlier ones have returned. Latency counts from the scheduled start, so a
+  stalled server is not hidden by a client that waits for it.
+
+Each upload gets a few random bytes after the image data, which decoders
+ignore, so the result cache does not answer the replays (``--no-cache-bust``
+measures the cache instead). Every scenario reports p50/p95/p99 latency,
+throughput, error rate, status codes and the median of each stage the
+service reported in ``Server-Timing``. ``--out`` saves the report as JSON.
+
+``--compare BASE NEW`` compares two saved reports scenario by scenario and
+exits with status 1 when NEW regressed: a latency percentile up, or
+throughput down, by more than ``--threshold`` percent, or the error rate up
+by more than a percentage point.
+
+Usage (from ocr_service/):
+  python benchmarks/load_bench.py --concurrency 1,4 --rate 2 --requests 100 --out before.json
+  python benchmarks/load_bench.py --url http://localhost:8080 --rate 5 --duration 60 --out after.json
+  python benchmarks/load_bench.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from common import REPO_ROOT, corpus_images, percentile, print_table
+
+# Compared between reports; for throughput higher is better
+LATENCY_KEYS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_in_process(env: dict[str, str]):
+    """Import the app with ``env`` applied and serve it from a background thread"""
+    os.environ.update(env)
+    import uvicorn
+    from app import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='uvicorn', daemon=True)
+    thread.start()
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def wait_ready(url: str, timeout: float = 300) -> None:
+    """Wait until /ready answers 200 (or the service is too old to have it)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=10):
+                return
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready after {timeout:.0f} s")
+
+
+def multipart(name: str, data: bytes) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{Path(name).name}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def parse_server_timing(header: str) -> dict[str, float]:
+    stages = {}
+    for entry in header.split(','):
+        name, *params = entry.strip().split(';')
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'dur':
+                stages[name.strip()] = float(value)
+    return stages
+
+
+class Target:
+    """One upload endpoint, posted to over a fresh HTTP/1.1 connection per request"""
+
+    def __init__(self, url: str, endpoint: str, params: dict[str, str], headers: dict[str, str], timeout: float):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.tls = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.tls else 80)
+        self.netloc = parts.netloc
+        self.path = parts.path.rstrip('/') + endpoint + (f"?{urlencode(params)}" if params else '')
+        self.headers = headers
+        self.timeout = timeout
+
+    async def post(self, name: str, data: bytes) -> tuple[int, dict[str, float]]:
+        """(status, Server-Timing stages); raises on connection errors and timeouts"""
+        body, content_type = multipart(name, data)
+        head = [
+            f"POST {self.path} HTTP/1.1", f"Host: {self.netloc}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}", "Connection: close",
+            *(f"{key}: {value}" for key, value in self.headers.items()),
+        ]
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl.create_default_context() if self.tls else None),
+            self.timeout,
+        )
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), self.timeout)
+        finally:
+            writer.close()
+        header_block = response.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+        status = int(header_block[0].split(' ', 2)[1])
+        stages = {}
+        for line in header_block[1:]:
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'server-timing':
+                stages = parse_server_timing(value)
+        return status, stages
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.statuses: dict[str, int] = {}
+        self.stages: dict[str, list[float]] = {}
+        self.errors = 0
+
+    async def send(self, target: Target, image: tuple[str, bytes], started: float) -> None:
+        """One request; latency counts from ``started``, the time it was due to start"""
+        try:
+            status, stages = await target.post(*image)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError) as exc:
+            status, stages = type(exc).__name__, {}
+        self.latencies.append(time.perf_counter() - started)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors += 1
+        for stage, ms in stages.items():
+            self.stages.setdefault(stage, []).append(ms)
+
+    def summary(self, name: str, mode: str, level: float, seconds: float) -> dict:
+        ms = [s * 1000 for s in self.latencies]
+        n = len(ms)
+        return {
+            'scenario': name,
+            'mode': mode,
+            'level': level,
+            'requests': n,
+            'errors': self.errors,
+            'error_rate': round(self.errors / n, 4) if n else 0.0,
+            'seconds': round(seconds, 2),
+            'throughput_rps': round((n - self.errors) / seconds, 3) if seconds else 0.0,
+            'mean_ms': round(sum(ms) / n, 1) if n else 0.0,
+            'p50_ms': round(percentile(ms, 50), 1),
+            'p95_ms': round(percentile(ms, 95), 1),
+            'p99_ms': round(percentile(ms, 99), 1),
+            'max_ms': round(max(ms), 1) if ms else 0.0,
+            'statuses': self.statuses,
+            # Median per stage, as reported by the service
+            'stages_p50_ms': {stage: round(percentile(values, 50), 2) for stage, values in sorted(self.stages.items())},
+        }
+
+
+class Corpus:
+    """Images handed out round-robin, each with random trailing bytes when busting the cache"""
+
+    def __init__(self, images: list[tuple[str, bytes]], cache_bust: bool):
+        self.images = images
+        self.cache_bust = cache_bust
+        self.next = 0
+
+    def take(self) -> tuple[str, bytes]:
+        name, data = self.images[self.next % len(self.images)]
+        self.next += 1
+        if self.cache_bust:
+            data += os.urandom(16)
+        return name, data
+
+
+async def closed_loop(target: Target, corpus: Corpus, clients: int, args) -> Recorder:
+    recorder = Recorder()
+    sent = [0]
+    stop_at = None if args.duration is None else time.perf_counter() + args.duration
+
+    async def client():
+        while (stop_at is None and sent[0] < args.requests) or (stop_at is not None and time.perf_counter() < stop_at):
+            sent[0] += 1
+            await recorder.send(target, corpus.take(), time.perf_counter())
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return recorder
+
+
+async def open_loop(target: Target, corpus: Corpus, rate: float, args) -> Recorder:
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    tasks = []
+    start = time.perf_counter()
+    due = start
+    while True:
+        if args.duration is None and len(tasks) >= args.requests:
+            break
+        if args.duration is not None and due - start >= args.duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(recorder.send(target, corpus.take(), due)))
+        due += rng.expovariate(rate) if args.poisson else 1 / rate
+    await asyncio.gather(*tasks)
+    return recorder
+
+
+def run_scenarios(url: str, corpus: Corpus, args) -> list[dict]:
+    target = Target(url, args.endpoint, dict(p.split('=', 1) for p in args.param),
+                    dict((key.strip(), value.strip()) for key, value in (h.split(':', 1) for h in args.header)), args.timeout)
+    levels = [('closed', int(c)) for c in args.concurrency.split(',') if c] + \
+             [('open', float(r)) for r in args.rate.split(',') if r]
+
+    async def run() -> list[dict]:
+        if args.warmup:
+            await closed_loop(target, corpus, 1, argparse.Namespace(requests=args.warmup, duration=None))
+        results = []
+        for mode, level in levels:
+            started = time.perf_counter()
+            if mode == 'closed':
+                recorder = await closed_loop(target, corpus, level, args)
+                name = f"closed-c{level}"
+            else:
+                recorder = await open_loop(target, corpus, level, args)
+                name = f"open-{level:g}rps"
+            results.append(recorder.summary(name, mode, level, time.perf_counter() - started))
+            print(f"{name}: {results[-1]['requests']} requests, p95 {results[-1]['p95_ms']} ms", file=sys.stderr)
+        return results
+
+    return asyncio.run(run())
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_path: str, new_path: str, threshold: float) -> int:
+    base, new = (json.loads(Path(path).read_text()) for path in (base_path, new_path))
+    base_scenarios = {s['scenario']: s for s in base['scenarios']}
+    rows, regressions = [], 0
+    for scenario in new['scenarios']:
+        before = base_scenarios.get(scenario['scenario'])
+        if before is None:
+            continue
+        metrics = [(key, True) for key in LATENCY_KEYS] + [('throughput_rps', False), ('error_rate', True)]
+        for key, lower_is_better in metrics:
+            old, value = before[key], scenario[key]
+            if key == 'error_rate':
+                regressed = value - old > 0.01
+            elif lower_is_better:
+                regressed = old > 0 and value > old * (1 + threshold / 100)
+            else:
+                regressed = value < old * (1 - threshold / 100)
+            regressions += regressed
+            change = f"{(value - old) / old * 100:+.1f}%" if old else 'n/a'
+            rows.append({'scenario': scenario['scenario'], 'metric': key, 'base': old, 'new': value,
+                         'change': change, 'flag': 'REGRESSION' if regressed else ''})
+    print(f"base {base['meta'].get('git')} ({base['meta'].get('date')}) vs new {new['meta'].get('git')} "
+          f"({new['meta'].get('date')}), threshold {threshold:g}%")
+    print_table(rows, ['scenario', 'metric', 'base', 'new', 'change', 'flag'])
+    missing = sorted(set(base_scenarios) - {s['scenario'] for s in new['scenarios']})
+    if missing:
+        print(f"not in new report: {', '.join(missing)}")
+    print(f"{regressions} regression(s)")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='running service to load (default: start the app in this process)')
+    parser.add_argument('--endpoint', default='/ocr')
+    parser.add_argument('--param', action='append', default=[], help='query parameter, e.g. extract=true')
+    parser.add_argument('--header', action='append', default=[], help='request header, e.g. "X-OCR-Priority: worker"')
+    parser.add_argument('--env', action='append', default=[], help='KEY=VALUE for the in-process service')
+    parser.add_argument('--concurrency', default='', help='closed-loop client counts, e.g. 1,4,8')
+    parser.add_argument('--rate', default='', help='open-loop arrival rates in requests/s, e.g. 2,5')
+    parser.add_argument('--poisson', action='store_true', help='exponential gaps between open-loop arrivals')
+    parser.add_argument('--requests', type=int, default=50, help='requests per scenario')
+    parser.add_argument('--duration', type=float, help='seconds per scenario, instead of --requests')
+    parser.add_argument('--warmup', type=int, default=5, help='unrecorded requests before the first scenario')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--corpus', help='directory of images (default: the ML dataset and synthetic cards)')
+    parser.add_argument('--no-cache-bust', dest='cache_bust', action='store_false')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two reports and exit')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change counted as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+    if not args.concurrency and not args.rate:
+        args.concurrency = '1'
+
+    if args.corpus:
+        images = [(str(path), path.read_bytes()) for path in sorted(Path(args.corpus).rglob('*'))
+                  if path.suffix.lower() in ('.jpg', '.jpeg', '.png')]
+    else:
+        images = corpus_images()
+    if not images:
+        parser.error('the corpus has no images')
+    corpus = Corpus(images, args.cache_bust)
+
+    given_env = dict(item.split('=', 1) for item in args.env)
+    env = dict(given_env)
+    server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            env.setdefault('OCR_JOBS_DB', str(Path(tmp) / 'jobs.db'))
+            env.setdefault('OCR_PROFILE_DIR', str(Path(tmp) / 'profiles'))
+            server, thread, url = start_in_process(env)
+        try:
+            wait_ready(url)
+            scenarios = run_scenarios(url, corpus, args)
+        finally:
+            if server is not None:
+                server.should_exit = True
+                thread.join(timeout=30)
+
+    report = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'git': git_revision(),
+            'target': args.url or 'in-process',
+            'endpoint': args.endpoint,
+            'params': args.param,
+            'env': given_env,
+            'corpus_images': len(images),
+            'cache_bust': args.cache_bust,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'scenarios': scenarios,
+    }
+    print_table(scenarios, ['scenario', 'requests', 'errors', 'error_rate', 'throughput_rps', 'p50_ms', 'p95_ms',
+                            'p99_ms', 'max_ms'])
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"report written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
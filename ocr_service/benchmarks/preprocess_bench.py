@@ -0,0 +1,60 @@
+"""Latency and peak memory of the preprocessing engines.
+
+Each engine is measured in a fresh subprocess so the peak RSS growth of one
+call is not hidden by memory an earlier engine already reserved.
+
+Usage (from ocr_service/):
+  python benchmarks/preprocess_bench.py --iterations 10 --size 3000x1900
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+from common import print_table, summarize, synthetic_card, timed
+
+from preprocess import PREPROCESSORS, run_preprocess
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(engine: str, size: tuple[int, int], iterations: int) -> dict:
+    image = synthetic_card(size=size)
+    image.load()
+    before = _peak_rss_kb()
+    run_preprocess(image, engine)
+    peak_growth_kb = _peak_rss_kb() - before
+    samples = timed(lambda: run_preprocess(image, engine), iterations, warmup=0)
+    return {'engine': engine, 'size': f"{size[0]}x{size[1]}", 'peak_growth_mb': round(peak_growth_kb / 1024, 1),
+            **summarize(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--size', default='1012x638', help='WIDTHxHEIGHT of the synthetic card')
+    parser.add_argument('--engine', choices=PREPROCESSORS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+
+    if args.engine:
+        # Child mode: measure a single engine and print JSON
+        print(json.dumps(measure(args.engine, size, args.iterations)))
+        return
+
+    rows = []
+    for engine in PREPROCESSORS:
+        out = subprocess.run(
+            [sys.executable, __file__, '--engine', engine, '--size', args.size, '--iterations', str(args.iterations)],
+            check=True, capture_output=True, text=True,
+        )
+        rows.append(json.loads(out.stdout))
+    print_table(rows, ['engine', 'size', 'peak_growth_mb', 'n', 'mean_ms', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Card detection and rectification latency and corner accuracy.
+
+Synthetic cards are placed on a noisy background at a range of rotations and
+perspective tilts (see ``common.captured_card``). Reports detection rate,
+the worst corner error in scene pixels, rectification latency, and how much
+smaller the rectified image is than the capture.
+
+Usage (from ocr_service/):
+  python benchmarks/rectify_bench.py --iterations 5 --scene 2400x1800
+"""
+import argparse
+import math
+
+from common import captured_card, load_records, print_table, summarize, synthetic_card, timed
+
+from rectify import rectify
+
+ANGLES = (0, 7, -12, 90, 180, -90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--scene', default='2400x1800', help='WIDTHxHEIGHT of the captured frame')
+    parser.add_argument('--tilt', type=float, default=0.03, help='corner jitter as a fraction of card width')
+    args = parser.parse_args()
+    scene_size = tuple(int(v) for v in args.scene.lower().split('x'))
+
+    rows = []
+    records = load_records()
+    for i, angle in enumerate(ANGLES):
+        card = synthetic_card(records[i % len(records)], seed=i)
+        scene, truth = captured_card(card, scene_size, angle=angle, tilt=args.tilt, seed=i)
+        gray = scene.convert('L')
+        result = rectify(gray)
+        error = None
+        if result.found:
+            # Compare in whichever corner order the card was found in
+            error = min(
+                max(math.dist(found, truth[(k + j) % 4]) for j, found in enumerate(result.corners))
+                for k in range(4)
+            )
+        samples = timed(lambda: rectify(gray), args.iterations)
+        rows.append({
+            'angle': angle,
+            'found': result.found,
+            'rotation': result.rotation,
+            'corner_err_px': round(error, 1) if error is not None else '-',
+            'pixels_ratio': round(result.image.width * result.image.height / (gray.width * gray.height), 3),
+            **summarize(samples),
+        })
+    print_table(rows, ['angle', 'found', 'rotation', 'corner_err_px', 'pixels_ratio', 'n', 'mean_ms', 'p50_ms', 'p95_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""OCR throughput as the number of usable cores grows, with and without the concurrency plan.
+
+For each core count the benchmark starts a child process restricted to that
+many cores (CPU affinity, as a container CPU quota would do) that OCRs
+``--images`` synthetic cards through a process worker pool. Two children run
+per core count:
+
+* ``naive``: one worker per host CPU and OpenMP free to use every host core.
+  This is what a plain ``uvicorn app:app`` did before the launcher.
+* ``planned``: worker count and thread limits from ``concurrency.plan()``.
+  This is what ``launch.py`` does.
+
+Needs Tesseract installed. Usage (from ocr_service/):
+  python benchmarks/scaling_bench.py --cores 1,2,4,8 --images 48
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import SERVICE_DIR, load_records, print_table, synthetic_card, to_jpeg
+
+MODES = ('naive', 'planned')
+
+
+def child(images: int) -> dict:
+    # Imported here so the environment the parent chose is in place first
+    import concurrency
+    import engines
+    from pipeline import OCROptions, ocr_bytes
+    from pool import WorkerPool
+
+    records = load_records()
+    cards = [to_jpeg(synthetic_card(records[i % len(records)], seed=i)) for i in range(images)]
+    workers = int(os.environ['OCR_WORKERS'])
+    pool = WorkerPool(workers, images, 'process', initializer=engines.warm)
+    options = OCROptions.create()
+
+    async def run() -> float:
+        # Start every worker and warm its engines before timing
+        await asyncio.gather(*(pool.run(ocr_bytes, cards[0], options) for _ in range(workers)))
+        started = time.perf_counter()
+        await asyncio.gather(*(pool.run(ocr_bytes, card, options) for card in cards))
+        return time.perf_counter() - started
+
+    try:
+        seconds = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    return {
+        'workers': workers,
+        'omp': os.environ.get('OMP_THREAD_LIMIT', 'all'),
+        'cpus_seen': concurrency.available_cpus()[0],
+        'images_per_s': round(images / seconds, 2),
+    }
+
+
+def run_child(cores: list[int], mode: str, images: int) -> dict:
+    env = dict(os.environ)
+    for name in ('OCR_WORKERS', 'OMP_THREAD_LIMIT', 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        env.pop(name, None)
+    if mode == 'naive':
+        host = str(os.cpu_count() or 1)
+        env.update(OCR_WORKERS=host, OMP_THREAD_LIMIT=host, OMP_NUM_THREADS=host)
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', '--images', str(images)],
+        cwd=SERVICE_DIR, env=env, check=True, capture_output=True, text=True,
+        preexec_fn=lambda: os.sched_setaffinity(0, cores),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', default='', help='core counts to try (default: powers of two up to all)')
+    parser.add_argument('--images', type=int, default=48)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.images)))
+        return
+
+    usable = sorted(os.sched_getaffinity(0))
+    if args.cores:
+        counts = [int(n) for n in args.cores.split(',')]
+    else:
+        counts = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < len(usable)] + [len(usable)]
+    rows = []
+    baseline = {}
+    for count in counts:
+        if count > len(usable):
+            print(f"skipping {count} cores: only {len(usable)} available")
+            continue
+        for mode in MODES:
+            result = run_child(usable[:count], mode, args.images)
+            baseline.setdefault(mode, result['images_per_s'])
+            rows.append({'cores': count, 'mode': mode, **result,
+                         'speedup': round(result['images_per_s'] / baseline[mode], 2)})
+    print_table(rows, ['cores', 'mode', 'workers', 'omp', 'cpus_seen', 'images_per_s', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Batch worker throughput against the local SQLite + filesystem stand-in.
+
+Seeds a temporary SQLite verifications table with synthetic card images on
+disk, runs the worker until nothing is pending and reports rows per second.
+The cron-driven edge function manages 12 rows an hour.
+
+Usage (from ocr_service/):
+  python benchmarks/worker_bench.py --rows 200 --batch 16
+"""
+import argparse
+import asyncio
+import tempfile
+from pathlib import Path
+
+from common import load_records, synthetic_card, to_jpeg
+
+import engines
+from pool import WorkerPool
+from verifications import open_store
+from worker import BatchWorker, FileSource
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=None, help='OCR pool workers (default OCR_WORKERS)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        store = open_store(f"sqlite:///{root / 'verifications.db'}")
+        records = load_records()
+        rows = []
+        for i in range(args.rows):
+            # Distinct seeds so no two uploads are byte-identical
+            (root / f"{i}.jpg").write_bytes(to_jpeg(synthetic_card(records[i % len(records)], seed=i)))
+            rows.append((f"bench-{i}", f"{i}.jpg"))
+        store.add(rows)
+
+        pool = WorkerPool.from_env(initializer=engines.warm)
+        if args.workers:
+            pool = WorkerPool(args.workers, pool.max_queue, pool.kind, engines.warm, pool.memory_budget)
+        worker = BatchWorker(store, FileSource(tmp), pool, batch=args.batch)
+        try:
+            summary = asyncio.run(worker.run(drain=True))
+        finally:
+            pool.shutdown()
+        print(summary)
+        print('statuses:', store.counts())
+        print(f"rows/hour: {summary['per_second'] * 3600:,.0f} (cron edge function: 12)")
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
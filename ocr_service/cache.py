@@ -0,0 +1,154 @@
+"""Content-addressed OCR result cache.
+
+Results are keyed by a hash of the image bytes plus the OCR configuration, kept
+in a bounded in-memory LRU and, when ``OCR_CACHE_DIR`` is set, mirrored to JSON
+files on disk so they survive restarts. Identical requests that arrive while a
+computation is running share that computation instead of starting their own.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+HIT = 'hit'
+MISS = 'miss'
+COALESCED = 'coalesced'
+
+
+def cache_key(image_bytes: bytes, config: str) -> str:
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b'\0' + config.encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, disk_dir: str | None = None, disk_max_entries: int = 10000):
+        self.max_entries = max(0, max_entries)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = disk_max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> 'ResultCache':
+        return cls(
+            max_entries=int(os.getenv('OCR_CACHE_SIZE', '1024')),
+            disk_dir=os.getenv('OCR_CACHE_DIR') or None,
+            disk_max_entries=int(os.getenv('OCR_CACHE_DISK_MAX', '10000')),
+        )
+
+    def _remember(self, key: str, value: dict) -> None:
+        if self.max_entries == 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> dict | None:
+        path = self._disk_path(key)
+        try:
+            value = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # keep recently used entries from being pruned
+        return value
+
+    def _disk_put(self, key: str, value: dict) -> None:
+        path = self._disk_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(value), encoding='utf-8')
+        os.replace(tmp, path)
+        self._disk_prune()
+
+    def _disk_prune(self) -> None:
+        files = list(self.disk_dir.glob('*/*.json'))
+        excess = len(files) - self.disk_max_entries
+        if excess <= 0:
+            return
+        # Drop a tenth more than needed so pruning does not run on every write
+        excess += self.disk_max_entries // 10
+        files.sort(key=lambda p: p.stat().st_mtime)
+        for path in files[:excess]:
+            path.unlink(missing_ok=True)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute, cacheable=None) -> tuple[dict, str]:
+        """Return ``(value, status)``, running ``compute()`` at most once per key at a time.
+
+        Values for which ``cacheable(value)`` is false (e.g. results cut short
+        by a deadline) go to the callers waiting on this computation but are
+        not stored.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key], HIT
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending), COALESCED
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # The caller computing it went away; compute it for this caller instead
+            return await self.get_or_compute(key, compute, cacheable)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await asyncio.to_thread(self._disk_get, key) if self.disk_dir else None
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                status = HIT
+            else:
+                self.misses += 1
+                value = await compute()
+                status = MISS
+                if cacheable is not None and not cacheable(value):
+                    future.set_result(value)
+                    return value, status
+                if self.disk_dir:
+                    await asyncio.to_thread(self._disk_put, key, value)
+            self._remember(key, value)
+            future.set_result(value)
+            return value, status
+        except BaseException as exc:
+            # Failures are not cached; waiters see the same error
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk": str(self.disk_dir) if self.disk_dir else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,245 @@
+"""Server-side ID card classification with dynamic micro-batching.
+
+Loads the MobileNetV2 SavedModel produced by ``ml/train.py`` once, at
+startup, and answers concurrent requests with batched forward passes.
+Requests wait in a queue until ``OCR_CLASSIFY_MAX_BATCH`` images are pending
+or the oldest has waited ``OCR_CLASSIFY_MAX_WAIT_MS``, whichever comes
+first; one batch runs at a time while the next one fills.
+
+TensorFlow is optional. Without it, or without a model directory, the
+classifier reports itself unavailable and ``/classify`` returns 503.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+from decode import decode
+from metrics import Histogram
+
+try:
+    import tensorflow as tf
+except ImportError:  # optional: only needed for /classify
+    tf = None
+
+logger = logging.getLogger("ocr_service")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# ml/train.py writes saved_model/ and class_labels.txt to the directory it runs from
+MODEL_DIR = os.getenv('OCR_MODEL_DIR', str(REPO_ROOT / 'saved_model'))
+LABELS_PATH = os.getenv('OCR_MODEL_LABELS', str(Path(MODEL_DIR).parent / 'class_labels.txt'))
+# Class order ml/train.py trains with, used when class_labels.txt is missing
+CLASS_ORDER = ('senior_genuine', 'senior_counterfeit', 'pwd_genuine', 'pwd_counterfeit')
+
+INPUT_SIZE = int(os.getenv('OCR_CLASSIFY_INPUT_SIZE', '224'))
+# 'raw': 0-255 pixels (train.py puts mobilenet_v2.preprocess_input inside the model).
+# 'mobilenet': scaled to [-1, 1] first, as script.js does for the TF.js export.
+INPUT_SCALE = os.getenv('OCR_CLASSIFY_INPUT', 'raw')
+
+MAX_BATCH = int(os.getenv('OCR_CLASSIFY_MAX_BATCH', '16'))
+MAX_WAIT_MS = float(os.getenv('OCR_CLASSIFY_MAX_WAIT_MS', '10'))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class ClassifierUnavailable(Exception):
+    pass
+
+
+@dataclass
+class _Pending:
+    array: np.ndarray
+    future: asyncio.Future
+    enqueued: float
+
+
+def load_labels(path: str = LABELS_PATH) -> tuple[str, ...]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            labels = tuple(line.strip() for line in f if line.strip())
+    except OSError:
+        return CLASS_ORDER
+    return labels or CLASS_ORDER
+
+
+def thumbnail(image: Image.Image, size: int = INPUT_SIZE) -> Image.Image:
+    """The RGB image the model sees, before scaling to float"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    # Bilinear squash to a square, matching image_dataset_from_directory and resizeBilinear
+    return image.resize((size, size), Image.Resampling.BILINEAR)
+
+
+def to_input(image: Image.Image) -> np.ndarray:
+    """A thumbnail() as the model input, float32 HxWx3"""
+    array = np.asarray(image, dtype=np.float32)
+    if INPUT_SCALE == 'mobilenet':
+        array = array / 127.5 - 1.0
+    return array
+
+
+def prepare(image: Image.Image, size: int = INPUT_SIZE) -> np.ndarray:
+    """Resize a decoded image to the model input, as float32 HxWx3"""
+    return to_input(thumbnail(image, size))
+
+
+class Classifier:
+    def __init__(self, model_dir: str, labels: tuple[str, ...], max_batch: int = MAX_BATCH,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        self.model_dir = model_dir
+        self.labels = labels
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        # Set by load(); takes an NxHxWx3 float32 batch and returns NxC probabilities
+        self.predict = None
+        self._model = None
+        self.error: str | None = None
+        self._pending: deque[_Pending] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._filled: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        # One forward pass at a time; TensorFlow parallelizes inside it
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='classify')
+        self._batches = 0
+
+    @classmethod
+    def from_env(cls) -> 'Classifier':
+        return cls(MODEL_DIR, load_labels())
+
+    @property
+    def available(self) -> bool:
+        return self.predict is not None
+
+    def load(self) -> None:
+        """Load the SavedModel (blocking). Leaves the classifier unavailable on failure."""
+        if tf is None:
+            self.error = "tensorflow is not installed (requirements-classifier.txt)"
+            return
+        if not Path(self.model_dir, 'saved_model.pb').exists():
+            self.error = f"no SavedModel at {self.model_dir}"
+            return
+        # Before the first op creates the runtime; sized by concurrency.configure()
+        tf.config.threading.set_intra_op_parallelism_threads(int(os.getenv('TF_NUM_INTRAOP_THREADS', '0')))
+        tf.config.threading.set_inter_op_parallelism_threads(int(os.getenv('TF_NUM_INTEROP_THREADS', '0')))
+        model = tf.saved_model.load(self.model_dir)
+        infer = model.signatures['serving_default']
+        input_name = next(iter(infer.structured_input_signature[1]))
+
+        def predict(batch: np.ndarray) -> np.ndarray:
+            outputs = infer(**{input_name: tf.constant(batch)})
+            return next(iter(outputs.values())).numpy()
+
+        # Trace once now so the first request does not pay for it
+        predict(np.zeros((1, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32))
+        self._model = model
+        self.predict = predict
+
+    async def start(self) -> None:
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as exc:
+            self.error = f"failed to load model: {exc}"
+        if self.error:
+            logger.warning("Classifier unavailable: %s", self.error)
+        self._wakeup = asyncio.Event()
+        self._filled = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        for item in self._pending:
+            item.future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def classify(self, array: np.ndarray) -> dict:
+        """Class probabilities for one prepared image, batched with concurrent callers"""
+        if not self.available or self._task is None:
+            raise ClassifierUnavailable(self.error or "classifier is not started")
+        loop = asyncio.get_running_loop()
+        item = _Pending(array, loop.create_future(), loop.time())
+        self._pending.append(item)
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch:
+            self._filled.set()
+        probabilities = await item.future
+        best = int(np.argmax(probabilities))
+        return {
+            'label': self.labels[best] if best < len(self.labels) else str(best),
+            'confidence': round(float(probabilities[best]), 4),
+            'probabilities': {
+                (self.labels[i] if i < len(self.labels) else str(i)): round(float(p), 4)
+                for i, p in enumerate(probabilities)
+            },
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            if not self._pending:
+                self._wakeup.clear()
+                continue
+            # Wait for a full batch, but never keep the oldest request past max_wait
+            deadline = self._pending[0].enqueued + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._filled.clear()
+                try:
+                    await asyncio.wait_for(self._filled.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            if not self._pending:
+                self._wakeup.clear()
+            self._filled.clear()
+
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+            started = loop.time()
+            for item in batch:
+                self.queue_wait_ms.observe((started - item.enqueued) * 1000)
+            self.batch_size.observe(len(batch))
+            try:
+                probabilities = await loop.run_in_executor(
+                    self._executor, self.predict, np.stack([item.array for item in batch]))
+            except Exception as exc:
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(exc)
+                continue
+            self._batches += 1
+            for item, row in zip(batch, probabilities):
+                if not item.future.done():
+                    item.future.set_result(row)
+
+    def stats(self) -> dict:
+        return {
+            'available': self.available,
+            'error': self.error,
+            'labels': list(self.labels),
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'pending': len(self._pending),
+            'batches': self._batches,
+            'batch_size': self.batch_size.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot(),
+        }
+
+
+def classify_input(image_bytes: bytes) -> np.ndarray:
+    """Decode an upload straight to a small RGB image and prepare it (blocking)"""
+    image, _ = decode(image_bytes, mode='RGB', long_side=2 * INPUT_SIZE)
+    return prepare(image)
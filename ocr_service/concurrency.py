@@ -0,0 +1,150 @@
+"""CPU sizing for the OCR service.
+
+Tesseract is built with OpenMP and TensorFlow keeps its own intra- and
+inter-op thread pools. Left alone, each of them assumes it owns every core
+of the host. So a few overlapping requests start several times more runnable
+threads than there are cores, and throughput collapses. This module works out
+the cores the container may actually use, which is the smallest of:
+
+* the cgroup CPU quota (``cpu.max`` on v2, ``cpu.cfs_quota_us`` on v1)
+* the scheduler affinity mask
+* the host CPU count
+
+From that count it derives the limits:
+
+* one worker process per core, also capped by the memory limit
+* single-threaded OpenMP and BLAS in every worker, since the service
+  already runs passes and requests in parallel
+* a small TensorFlow pool for the classifier in the API process
+
+``configure()`` writes these into the environment without overriding
+variables that are already set. So the tesserocr and TensorFlow imports, and
+the ``tesseract`` processes pytesseract starts, all see the same limits.
+``launch.py`` runs it before starting uvicorn, and ``app`` imports this
+module first so running ``uvicorn app:app`` directly gets the same pinning.
+"""
+import math
+import os
+from dataclasses import asdict, dataclass
+
+# Approximate resident memory of one OCR worker process with warm engines
+WORKER_MEMORY_MB = int(os.getenv('OCR_WORKER_MEMORY_MB', '256'))
+
+# Variables that cap per-process thread pools, all set to the same value
+OMP_VARIABLES = ('OMP_THREAD_LIMIT', 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def _read(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpus() -> float | None:
+    """CPU quota of this container in cores, or None without one"""
+    v2 = _read('/sys/fs/cgroup/cpu.max')
+    if v2:
+        quota, _, period = v2.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'), _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory() -> int | None:
+    """Memory limit of this container in bytes, or None without one"""
+    limit = _read('/sys/fs/cgroup/memory.max') or _read('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+    if not limit or limit == 'max':
+        return None
+    limit = int(limit)
+    # cgroup v1 reports "unlimited" as a huge page-aligned number
+    return limit if limit < 2**60 else None
+
+
+def available_cpus() -> tuple[int, str]:
+    """Cores this process may use, and which limit decided it"""
+    host = os.cpu_count() or 1
+    limits = [(host, 'host')]
+    if hasattr(os, 'sched_getaffinity'):
+        limits.append((len(os.sched_getaffinity(0)), 'affinity'))
+    quota = cgroup_cpus()
+    if quota is not None:
+        # A fractional quota still gets at least one worker
+        limits.append((max(1, math.floor(quota)), 'cgroup'))
+    return min(limits, key=lambda limit: limit[0])
+
+
+@dataclass
+class Plan:
+    cpus: int
+    # host, affinity or cgroup
+    cpu_source: str
+    memory_limit_mb: int | None
+    workers: int
+    # Threads one Tesseract/BLAS call may use
+    omp_threads: int
+    tf_intra_op: int
+    tf_inter_op: int
+    # Variables already set to something else, which were left alone
+    overridden: tuple[str, ...] = ()
+
+    def environment(self) -> dict[str, str]:
+        env = {'OCR_WORKERS': str(self.workers)}
+        env.update(dict.fromkeys(OMP_VARIABLES, str(self.omp_threads)))
+        env['TF_NUM_INTRAOP_THREADS'] = str(self.tf_intra_op)
+        env['TF_NUM_INTEROP_THREADS'] = str(self.tf_inter_op)
+        return env
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'environment': self.environment()}
+
+
+def plan(cpus: int | None = None, memory_limit: int | None = None) -> Plan:
+    """Worker count and thread limits for ``cpus`` cores (default: detected)"""
+    source = 'given'
+    if cpus is None:
+        cpus, source = available_cpus()
+    if memory_limit is None:
+        memory_limit = cgroup_memory()
+    workers = cpus
+    if memory_limit:
+        # Keep half of the limit for the images the workers hold
+        workers = max(1, min(workers, memory_limit // 2 // (WORKER_MEMORY_MB * 2**20)))
+    return Plan(
+        cpus=cpus,
+        cpu_source=source,
+        memory_limit_mb=memory_limit // 2**20 if memory_limit else None,
+        workers=workers,
+        omp_threads=1,
+        # The classifier batches on one thread; it gets a share of the cores, not all of them
+        tf_intra_op=max(1, cpus // 4),
+        tf_inter_op=1,
+    )
+
+
+_current: Plan | None = None
+
+
+def configure() -> Plan:
+    """Detect, plan and export the limits once per process; explicit settings win"""
+    global _current
+    if _current is None:
+        chosen = plan()
+        for name, value in chosen.environment().items():
+            if os.environ.setdefault(name, value) != value:
+                chosen.overridden += (name,)
+        _current = chosen
+    return _current
+
+
+def effective() -> dict[str, str]:
+    """The limits actually in force, including the overridden ones"""
+    return {name: os.environ[name] for name in configure().environment()}
+
+
+configure()
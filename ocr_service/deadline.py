@@ -0,0 +1,263 @@
+"""Per-request time budgets for the OCR pipeline.
+
+Each request gets a budget from the ``X-OCR-Deadline-Ms`` header, or
+``OCR_DEADLINE_MS``. The budget is split across the pipeline stages by
+``OCR_DEADLINE_SHARES``: every stage has a checkpoint by which it should be
+done, and the OCR passes get whatever time is left before the deadline.
+
+* A stage that finishes after its checkpoint is counted as an overrun.
+* Preprocessing that starts after its checkpoint uses the cheap fast-tier
+  preparation, which leaves the time for OCR.
+* Tesseract passes still running at the deadline are killed. The result is
+  the best pass that finished, marked ``truncated``.
+* When the client goes away, ``cancel`` is set. Stages and passes that have
+  not started yet are then skipped.
+
+A ``Deadline`` is pickled into process-pool workers, so it uses wall-clock
+time. In process mode ``cancel`` is a ``CancelFlag``: a slot in one
+shared-memory segment that the API process creates at startup, so handing
+out a deadline costs no IPC.
+"""
+import atexit
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+
+import slabs
+from metrics import Histogram
+
+DEFAULT_MS = int(os.getenv('OCR_DEADLINE_MS', '30000'))
+MAX_MS = int(os.getenv('OCR_DEADLINE_MAX_MS', '120000'))
+STAGES = ('decode', 'preprocess', 'ocr')
+# Extra wait for a worker's partial result after the deadline, before giving up on it
+GRACE_SECONDS = 1.0
+
+BUDGET_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+# Cancel flags in process mode; a slot is reused after this many newer requests
+CANCEL_SLOTS = 65536
+
+
+def stage_shares(value: str) -> dict[str, float]:
+    """Parse ``decode=0.1,preprocess=0.2,ocr=0.7`` into shares that sum to 1"""
+    shares = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, number = item.partition('=')
+        if name.strip() not in STAGES:
+            raise ValueError(f"Unknown pipeline stage: {name}")
+        shares[name.strip()] = float(number)
+    total = sum(shares.get(stage, 0) for stage in STAGES)
+    if total <= 0:
+        raise ValueError("Deadline shares must add up to more than zero")
+    return {stage: shares.get(stage, 0) / total for stage in STAGES}
+
+
+SHARES = stage_shares(os.getenv('OCR_DEADLINE_SHARES', 'decode=0.1,preprocess=0.2,ocr=0.7'))
+
+
+@dataclass
+class Deadline:
+    # Seconds, from started_at (wall clock)
+    budget: float
+    started_at: float = field(default_factory=time.time)
+    shares: dict[str, float] = field(default_factory=lambda: SHARES)
+    # Event-like (``is_set()``) raised when the client gave up
+    cancel: object = None
+
+    @property
+    def expires_at(self) -> float:
+        return self.started_at + self.budget
+
+    def remaining(self) -> float:
+        return self.expires_at - time.time()
+
+    def cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+    def expired(self) -> bool:
+        return self.cancelled() or self.remaining() <= 0
+
+    def checkpoint(self, stage: str) -> float:
+        """Wall-clock time by which ``stage`` should be done"""
+        done = sum(self.shares[s] for s in STAGES[:STAGES.index(stage) + 1])
+        return self.started_at + self.budget * done
+
+    def behind(self, stage: str) -> bool:
+        return time.time() > self.checkpoint(stage)
+
+
+class DeadlineReport:
+    """What one request did with its budget; becomes ``OCROutput.deadline``"""
+
+    def __init__(self, deadline: Deadline):
+        self.deadline = deadline
+        self.stages_ms: dict[str, float] = {}
+        self.overran: list[str] = []
+        self.skipped: list[str] = []
+        self.timed_out: list[int] = []
+        # The first stage runs from when the deadline started
+        self._started = time.perf_counter() - max(0.0, time.time() - deadline.started_at)
+
+    def stage(self, name: str) -> None:
+        """Close ``name``, which ran from the previous call until now"""
+        now = time.perf_counter()
+        self.stages_ms[name] = round((now - self._started) * 1000, 2)
+        self._started = now
+        if self.deadline.behind(name):
+            self.overran.append(name)
+
+    def skip(self, name: str) -> None:
+        self.skipped.append(name)
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.skipped or self.timed_out)
+
+    def to_dict(self) -> dict:
+        return {
+            'budget_ms': round(self.deadline.budget * 1000),
+            'stages_ms': self.stages_ms,
+            'overran': self.overran,
+            'skipped': self.skipped,
+            'timed_out_psms': self.timed_out,
+            'cancelled': self.deadline.cancelled(),
+        }
+
+
+def budget_seconds(header: str | None) -> float:
+    """Budget from the X-OCR-Deadline-Ms header, capped at OCR_DEADLINE_MAX_MS. Raises ValueError."""
+    if header is None:
+        return DEFAULT_MS / 1000
+    try:
+        ms = int(header)
+    except ValueError:
+        ms = 0
+    if ms <= 0:
+        raise ValueError("X-OCR-Deadline-Ms must be a positive number of milliseconds")
+    return min(ms, MAX_MS) / 1000
+
+
+# Segments by name, as uint32 (generation, flag) pairs: the owner's, or a worker's mapping
+_flag_words: dict[str, memoryview] = {}
+# A worker's mappings, kept open for as long as their views
+_flag_segments: dict[str, shared_memory.SharedMemory] = {}
+
+
+@dataclass(frozen=True)
+class CancelFlag:
+    """Event-like cancel flag that works across processes; pickles to a few bytes"""
+    segment: str
+    slot: int
+    generation: int
+
+    def _words(self) -> memoryview:
+        words = _flag_words.get(self.segment)
+        if words is None:
+            segment = _flag_segments[self.segment] = slabs.attach(self.segment)
+            words = _flag_words[self.segment] = segment.buf.cast('I')
+        return words
+
+    def is_set(self) -> bool:
+        words = self._words()
+        return words[2 * self.slot] == self.generation and words[2 * self.slot + 1] == 1
+
+    def set(self) -> None:
+        words = self._words()
+        # A slot reused by a newer request keeps its own flag
+        if words[2 * self.slot] == self.generation:
+            words[2 * self.slot + 1] = 1
+
+
+@atexit.register
+def _release_flag_views() -> None:
+    # A mapping cannot be closed while a view of it is exported
+    for words in _flag_words.values():
+        words.release()
+
+
+class CancelFlags:
+    """Cancel flags for process workers, taken round robin from one segment.
+
+    Slots are never handed back. Each new deadline takes the next slot and
+    bumps its generation, so a late ``set`` on a slot that has since been
+    reused does not reach the newer request.
+    """
+
+    def __init__(self, slots: int = CANCEL_SLOTS):
+        self.slots = slots
+        self._segment = shared_memory.SharedMemory(create=True, size=slots * 8)
+        self._words = _flag_words[self._segment.name] = self._segment.buf.cast('I')
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def new(self) -> CancelFlag:
+        with self._lock:
+            slot, self._next = self._next, (self._next + 1) % self.slots
+            generation = (self._words[2 * slot] + 1) & 0xFFFFFFFF
+            self._words[2 * slot + 1] = 0
+            self._words[2 * slot] = generation
+        return CancelFlag(self._segment.name, slot, generation)
+
+    def close(self) -> None:
+        del _flag_words[self._segment.name]
+        self._words.release()
+        self._segment.close()
+        self._segment.unlink()
+
+
+class DeadlineTracker:
+    """Hands out deadlines for one worker pool and counts what happened to them"""
+
+    def __init__(self, process: bool):
+        self.process = process
+        # Created before the workers fork or spawn, never on a request
+        self._flags = CancelFlags() if process else None
+        self.requests = 0
+        self.truncated = 0
+        self.pass_timeouts = 0
+        self.expired_queued = 0
+        self.cancelled = 0
+        self.overruns = dict.fromkeys(STAGES, 0)
+        self.budget_ms = Histogram(BUDGET_BUCKETS_MS)
+
+    def _event(self):
+        return self._flags.new() if self._flags else threading.Event()
+
+    def new(self, budget: float) -> Deadline:
+        self.requests += 1
+        self.budget_ms.observe(budget * 1000)
+        return Deadline(budget, cancel=self._event())
+
+    def cancel(self, deadline: Deadline) -> None:
+        """The client went away: stop the work that has not started"""
+        if not deadline.cancelled():
+            self.cancelled += 1
+            deadline.cancel.set()
+
+    def record(self, result: dict) -> None:
+        report = result.get('deadline') or {}
+        if result.get('truncated'):
+            self.truncated += 1
+        self.pass_timeouts += len(report.get('timed_out_psms', ()))
+        for stage in report.get('overran', ()):
+            self.overruns[stage] += 1
+
+    def close(self) -> None:
+        if self._flags is not None:
+            self._flags.close()
+            self._flags = None
+
+    def stats(self) -> dict:
+        return {
+            'default_ms': DEFAULT_MS,
+            'max_ms': MAX_MS,
+            'shares': SHARES,
+            'requests': self.requests,
+            'truncated': self.truncated,
+            'pass_timeouts': self.pass_timeouts,
+            'expired_queued': self.expired_queued,
+            'cancelled': self.cancelled,
+            'overruns': self.overruns,
+            'budget_ms': self.budget_ms.snapshot(),
+        }
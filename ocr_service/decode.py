@@ -0,0 +1,191 @@
+"""Memory-bounded image decoding.
+
+Uploads are probed from their header before any pixels are decoded. Images
+over ``OCR_MAX_PIXELS`` are rejected, and large JPEGs are decoded with
+Pillow's draft mode straight to grayscale at a reduced scale, so a 48 MP phone
+photo never exists in memory as a full-resolution RGB bitmap. EXIF
+orientation is applied last, on the small grayscale image.
+
+The same plan also yields an estimate of the peak bytes a request will hold,
+which the worker pool uses to admit work against a memory budget.
+"""
+import io
+import math
+import os
+import warnings
+from dataclasses import dataclass
+from PIL import Image
+
+import preprocess
+
+MAX_UPLOAD_BYTES = int(os.getenv('OCR_MAX_UPLOAD_MB', '25')) * 2**20
+MAX_PIXELS = int(os.getenv('OCR_MAX_PIXELS', '50000000'))
+# Long side the decoder aims for; preprocessing still upscales small images
+TARGET_LONG_SIDE = int(os.getenv('OCR_DECODE_LONG_SIDE', '2400'))
+
+# Pillow's own bomb check (it raises above twice this) is a backstop for ours
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+_BANDS = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'PA': 2, 'I;16': 2, 'RGB': 3, 'YCbCr': 3,
+          'RGBA': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+# EXIF orientation -> transpose, as in ImageOps.exif_transpose
+_ORIENTATION = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+class ImageRejected(ValueError):
+    """The upload is not a decodable image or is too large to process"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Keep the status code when raised in a process pool worker
+        return self.__class__, (str(self), self.status_code)
+
+
+@dataclass
+class DecodePlan:
+    size: tuple[int, int]
+    format: str | None
+    mode: str
+    draft_scale: int  # JPEG DCT scaling (1, 2, 4 or 8)
+    reduce: int       # further integer box reduction after decoding
+    upload_bytes: int
+
+    @property
+    def decoded_size(self) -> tuple[int, int]:
+        w, h = self.size
+        return math.ceil(w / self.draft_scale), math.ceil(h / self.draft_scale)
+
+    @property
+    def output_size(self) -> tuple[int, int]:
+        w, h = self.decoded_size
+        # Image.reduce keeps the partial block at the edge
+        return math.ceil(w / self.reduce), math.ceil(h / self.reduce)
+
+    def decode_peak_bytes(self, mode: str = 'L') -> int:
+        """Estimated largest set of buffers alive at once while decoding to ``mode``"""
+        dw, dh = self.decoded_size
+        ow, oh = self.output_size
+        bands = _BANDS.get(mode, 4)
+        # JPEGs decode straight to ``mode``; everything else decodes in its own mode first
+        decoded = dw * dh * (bands if self.format == 'JPEG' else _BANDS.get(self.mode, 4))
+        converted = 0 if self.format == 'JPEG' or self.mode == mode else dw * dh * bands
+        reduced = ow * oh * bands if self.reduce > 1 else 0
+        return self.upload_bytes + max(decoded + converted, max(decoded, converted) + reduced)
+
+    def estimated_peak_bytes(self, preprocess_engine: str | None = None) -> int:
+        """Estimated largest set of buffers alive at once for this request"""
+        ow, oh = self.output_size
+        preprocessing = ow * oh + preprocess.working_set_bytes((ow, oh), preprocess_engine)
+        return max(self.decode_peak_bytes(), self.upload_bytes + preprocessing)
+
+
+class _ViewReader(io.RawIOBase):
+    """A read-only file over a memoryview: Pillow reads it in chunks, where
+    ``io.BytesIO`` would first copy the whole upload out of its slab"""
+
+    def __init__(self, view: memoryview):
+        self._view = view.cast('B')
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        n = len(chunk)
+        memoryview(buffer).cast('B')[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def _open(image_bytes: bytes | memoryview) -> Image.Image:
+    if len(image_bytes) > MAX_UPLOAD_BYTES:
+        raise ImageRejected(f"Upload exceeds {MAX_UPLOAD_BYTES // 2**20} MB", status_code=413)
+    if not image_bytes:
+        raise ImageRejected("Empty upload")
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            # BytesIO shares a bytes object's buffer but copies anything else
+            fp = _ViewReader(image_bytes) if isinstance(image_bytes, memoryview) else io.BytesIO(image_bytes)
+            return Image.open(fp)
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as exc:
+        raise ImageRejected(f"Image exceeds {MAX_PIXELS} pixels", status_code=413) from exc
+    except Exception as exc:
+        raise ImageRejected("Cannot read image: unsupported or corrupt file") from exc
+
+
+def _plan(image: Image.Image, upload_bytes: int, long_side: int = TARGET_LONG_SIDE) -> DecodePlan:
+    w, h = image.size
+    if w * h > MAX_PIXELS:
+        raise ImageRejected(f"Image is {w}x{h}, over the {MAX_PIXELS} pixel limit", status_code=413)
+
+    factor = max(w, h) / long_side
+    draft_scale = 1
+    if image.format == 'JPEG':
+        while draft_scale < 8 and draft_scale * 2 <= factor:
+            draft_scale *= 2
+    remaining = max(math.ceil(w / draft_scale), math.ceil(h / draft_scale)) / long_side
+    reduce = int(remaining) if remaining >= 2 else 1
+    return DecodePlan((w, h), image.format, image.mode, draft_scale, reduce, upload_bytes)
+
+
+def plan(image_bytes: bytes | memoryview) -> DecodePlan:
+    """Read only the header and work out how the image will be decoded"""
+    return _plan(_open(image_bytes), len(image_bytes))
+
+
+def decode(image_bytes: bytes | memoryview, mode: str = 'L', long_side: int = TARGET_LONG_SIDE,
+           decode_plan: DecodePlan | None = None) -> tuple[Image.Image, DecodePlan]:
+    """Decode to an upright image in ``mode`` (grayscale for OCR), no larger than needed.
+
+    ``long_side`` is the size the decoder aims for; the classifier asks for far
+    fewer pixels than OCR. A ``decode_plan`` already made by ``plan()`` for
+    these bytes is reused instead of being worked out again.
+    """
+    image = _open(image_bytes)
+    if decode_plan is None:
+        decode_plan = _plan(image, len(image_bytes), long_side)
+    orientation = image.getexif().get(0x0112)
+
+    if decode_plan.format == 'JPEG':
+        # Pillow picks the scale by floor division, so ask for the floored size;
+        # the ceiled decoded_size would fall back to half the scale when a side
+        # does not divide evenly
+        w, h = decode_plan.size
+        image.draft(mode, (w // decode_plan.draft_scale, h // decode_plan.draft_scale))
+    try:
+        image.load()
+    except Exception as exc:
+        raise ImageRejected(f"Cannot decode image: {exc}") from exc
+
+    if image.mode != mode:
+        image = image.convert(mode)
+    if decode_plan.reduce > 1:
+        image = image.reduce(decode_plan.reduce)
+    if orientation in _ORIENTATION:
+        image = image.transpose(_ORIENTATION[orientation])
+    return image, decode_plan
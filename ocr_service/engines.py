@@ -0,0 +1,268 @@
+"""Tesseract engines.
+
+With ``tesserocr`` installed, passes run against warm in-process
+``PyTessBaseAPI`` handles that are reused across requests and PSM modes, so
+``eng.traineddata`` is loaded once per handle instead of once per pass.
+Without it (or with ``OCR_ENGINE=pytesseract``) every pass forks the
+``tesseract`` binary through pytesseract, as before.
+
+A pass can be given a ``cancel`` flag (anything with ``is_set()``). A pass
+that has not started yet is skipped once the flag is set. A running
+pytesseract pass has its ``tesseract`` process killed, the same way
+pytesseract kills one at its timeout. A running tesserocr pass cannot be
+stopped from outside: ``Recognize`` only checks its own timeout.
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from PIL import Image
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # optional, falls back to the pytesseract subprocess path
+    tesserocr = None
+
+# Configure Tesseract path (for Windows/local dev)
+if os.name == 'nt':  # Windows
+    tesseract_path = os.getenv('TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe')
+    if os.path.exists(tesseract_path):
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+
+LANG = "eng"
+ENGINES = ('auto', 'tesserocr', 'pytesseract')
+ENGINE = os.getenv('OCR_ENGINE', 'auto')
+
+
+# How often a running tesseract process is checked for cancellation
+CANCEL_POLL_SECONDS = 0.05
+
+
+class PassTimeout(Exception):
+    """A recognition ran past its timeout, or was cancelled, and was stopped"""
+
+
+class EnginePool:
+    """Warm PyTessBaseAPI handles shared by the pass threads of one process"""
+
+    def __init__(self, size: int, lang: str = LANG, path: str | None = None):
+        self.size = max(1, size)
+        self.lang = lang
+        # tessdata directory, None for the default models
+        self.path = path
+        self.pid = os.getpid()
+        self._free: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._handles = []
+
+    def _new_handle(self):
+        if self.path:
+            api = tesserocr.PyTessBaseAPI(path=self.path, lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+        else:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+        self._handles.append(api)
+        return api
+
+    def warm(self, count: int | None = None) -> None:
+        """Initialize ``count`` handles (default: all of them) up front"""
+        target = self.size if count is None else min(count, self.size)
+        with self._lock:
+            while self._created < target:
+                self._created += 1
+                self._free.put(self._new_handle())
+
+    @contextmanager
+    def acquire(self):
+        try:
+            api = self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            api = self._new_handle() if create else self._free.get()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._free.put(api)
+
+    def close(self) -> None:
+        for api in self._handles:
+            api.End()
+        self._handles.clear()
+
+
+# One pool per tessdata directory (None = the default models)
+_pools: dict[str | None, EnginePool] = {}
+_pool_lock = threading.Lock()
+
+
+def engine_name(engine: str | None = None) -> str:
+    """Resolve 'auto' to the engine that will actually be used"""
+    engine = engine or ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown OCR engine: {engine}")
+    if engine == 'tesserocr' and tesserocr is None:
+        raise RuntimeError("OCR_ENGINE=tesserocr but the tesserocr package is not installed")
+    if engine == 'auto':
+        return 'tesserocr' if tesserocr is not None else 'pytesseract'
+    return engine
+
+
+def get_pool(tessdata: str | None = None) -> EnginePool:
+    """Per-process engine pool. Handles are never shared across a fork."""
+    with _pool_lock:
+        pool = _pools.get(tessdata)
+        if pool is None or pool.pid != os.getpid():
+            # Handles are created on demand, so this is only an upper bound
+            default = 3 * int(os.getenv('OCR_WORKERS', os.cpu_count() or 1))
+            pool = _pools[tessdata] = EnginePool(int(os.getenv('OCR_ENGINE_HANDLES', default)), path=tessdata)
+        return pool
+
+
+def warm(count: int = 3) -> None:
+    """Create engine handles for this process (used as a worker initializer)"""
+    if engine_name() == 'tesserocr':
+        get_pool().warm(count)
+
+
+def _config(psm: int, whitelist: str | None, tessdata: str | None = None) -> str:
+    config = f'--psm {psm} --oem 3'
+    if tessdata:
+        config += f' --tessdata-dir "{tessdata}"'
+    if whitelist:
+        config += f' -c tessedit_char_whitelist={whitelist}'
+    return config
+
+
+@contextmanager
+def _prepared_api(image: Image.Image, psm: int, whitelist: str | None, tessdata: str | None = None,
+                  timeout: float | None = None, cancel=None):
+    """Borrow a warm handle that has recognized ``image``, within ``timeout`` seconds"""
+    with get_pool(tessdata).acquire() as api:
+        if cancel is not None and cancel.is_set():
+            raise PassTimeout(f"PSM {psm} pass cancelled")
+        api.SetPageSegMode(psm)
+        if whitelist:
+            api.SetVariable('tessedit_char_whitelist', whitelist)
+        try:
+            api.SetImage(image)
+            # Tesseract checks the timeout between words and abandons the page
+            if not api.Recognize(max(1, int(timeout * 1000)) if timeout else 0) and timeout:
+                raise PassTimeout(f"PSM {psm} pass ran past {timeout:.1f}s")
+            yield api
+        finally:
+            if whitelist:
+                # Handles are shared, so never leave a whitelist behind
+                api.SetVariable('tessedit_char_whitelist', '')
+
+
+def _checked_timeout(timeout: float | None) -> float | None:
+    if timeout is not None and timeout <= 0:
+        raise PassTimeout("No time left for this pass")
+    return timeout
+
+
+# The cancel flag of the pytesseract pass running on this thread
+_local = threading.local()
+_timeout_manager = pytesseract.pytesseract.timeout_manager
+
+
+@contextmanager
+def _cancellable_timeout_manager(proc, seconds=None):
+    """pytesseract's timeout_manager, which also kills the process once its pass is cancelled"""
+    cancel = getattr(_local, 'cancel', None)
+    if cancel is None:
+        with _timeout_manager(proc, seconds) as error_string:
+            yield error_string
+        return
+    expires = time.monotonic() + seconds if seconds else None
+    try:
+        while True:
+            wait = CANCEL_POLL_SECONDS
+            if expires is not None:
+                wait = max(0.0, min(wait, expires - time.monotonic()))
+            try:
+                _, error_string = proc.communicate(timeout=wait)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel.is_set() or (expires is not None and time.monotonic() >= expires):
+                    pytesseract.pytesseract.kill(proc, -1)
+                    raise RuntimeError('Tesseract process timeout')
+        yield error_string
+    finally:
+        proc.stdin.close()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+# run_tesseract looks the manager up on every call
+pytesseract.pytesseract.timeout_manager = _cancellable_timeout_manager
+
+
+@contextmanager
+def _subprocess_timeout(timeout: float | None, cancel=None):
+    """pytesseract kills the tesseract process at its timeout, or on ``cancel``, and raises a bare RuntimeError"""
+    if cancel is not None and cancel.is_set():
+        raise PassTimeout("Pass cancelled")
+    _local.cancel = cancel
+    try:
+        yield
+    except pytesseract.TesseractError:
+        # Tesseract itself failed (a RuntimeError subclass)
+        raise
+    except RuntimeError as exc:
+        if cancel is not None and cancel.is_set():
+            raise PassTimeout("Pass cancelled") from exc
+        if timeout:
+            raise PassTimeout(f"Tesseract ran past {timeout:.1f}s") from exc
+        raise
+    finally:
+        _local.cancel = None
+
+
+def image_to_text(image: Image.Image, psm: int = 3, engine: str | None = None,
+                  whitelist: str | None = None, tessdata: str | None = None, timeout: float | None = None,
+                  cancel=None) -> str:
+    """``timeout`` is in seconds; a pass that runs past it, or is cancelled, raises PassTimeout"""
+    timeout = _checked_timeout(timeout)
+    if engine_name(engine) == 'tesserocr':
+        with _prepared_api(image, psm, whitelist, tessdata, timeout, cancel) as api:
+            return api.GetUTF8Text()
+    with _subprocess_timeout(timeout, cancel):
+        return pytesseract.image_to_string(image, lang=LANG, config=_config(psm, whitelist, tessdata),
+                                           timeout=timeout or 0)
+
+
+def image_to_text_with_confidence(image: Image.Image, psm: int, engine: str | None = None,
+                                  whitelist: str | None = None, tessdata: str | None = None,
+                                  timeout: float | None = None, cancel=None) -> tuple[str, float]:
+    """Text plus mean word confidence (0-100)"""
+    timeout = _checked_timeout(timeout)
+    if engine_name(engine) == 'tesserocr':
+        with _prepared_api(image, psm, whitelist, tessdata, timeout, cancel) as api:
+            text = api.GetUTF8Text()
+            return text, float(api.MeanTextConf())
+
+    with _subprocess_timeout(timeout, cancel):
+        data = pytesseract.image_to_data(
+            image, lang=LANG, config=_config(psm, whitelist, tessdata), output_type=pytesseract.Output.DICT,
+            timeout=timeout or 0,
+        )
+    lines: dict[tuple, list[str]] = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence
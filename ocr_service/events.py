@@ -0,0 +1,189 @@
+"""OCR completion events for browsers waiting on a verification.
+
+``GET /events/{id}`` is a server-sent events stream that delivers one
+``complete`` event when the job for that verification finishes, then closes.
+It replaces the browser polling ``verifications`` every few seconds.
+
+Idle connections are cheap: every subscriber to an ID awaits one shared
+future, so a completion is a single ``set_result`` however many tabs watch
+it, and nothing runs per connection except a heartbeat comment every
+``OCR_EVENTS_HEARTBEAT_SECONDS`` to keep proxies from closing the stream.
+Jobs finished by this process are published immediately. Jobs finished by
+another process sharing the job queue are found by one batched lookup per
+``OCR_EVENTS_POLL_SECONDS`` over all subscribed IDs.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import weakref
+
+from jobs import QUEUED, RUNNING, Job
+from metrics import Histogram
+
+logger = logging.getLogger("ocr_service")
+
+MAX_CONNECTIONS = int(os.getenv('OCR_EVENTS_MAX_CONNECTIONS', '10000'))
+HEARTBEAT_SECONDS = float(os.getenv('OCR_EVENTS_HEARTBEAT_SECONDS', '15'))
+# After this long the stream ends with a 'timeout' event and the client falls back to a DB read
+TIMEOUT_SECONDS = float(os.getenv('OCR_EVENTS_TIMEOUT_SECONDS', '600'))
+POLL_SECONDS = float(os.getenv('OCR_EVENTS_POLL_SECONDS', '1'))
+# IDs per lookup query
+LOOKUP_CHUNK = 500
+
+PUBLISH_BUCKETS_MS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50)
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+def completion(job: Job) -> dict:
+    """Event body: final status and the extracted fields"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'fields': (job.result or {}).get('fields'),
+        # Fields read before the deadline cut OCR short
+        'truncated': bool((job.result or {}).get('truncated')),
+        'error': job.error,
+        'finished_at': job.finished_at,
+    }
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class CompletionBroker:
+    def __init__(self, lookup, max_connections: int = MAX_CONNECTIONS, poll_seconds: float = POLL_SECONDS):
+        # lookup(ids) -> {id: Job} for the finished jobs among ids (blocking)
+        self.lookup = lookup
+        self.max_connections = max(1, max_connections)
+        self.poll_seconds = poll_seconds
+        self.connections = 0
+        self.peak_connections = 0
+        self.published = 0
+        self.delivered = 0
+        self.timeouts = 0
+        self.publish_ms = Histogram(PUBLISH_BUCKETS_MS)
+        self._waiters: dict[str, asyncio.Future] = {}
+        self._subscribers: dict[str, int] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._poll())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        for future in self._waiters.values():
+            future.cancel()
+
+    def publish(self, job: Job) -> None:
+        """Wake every subscriber to ``job.id``; a no-op when nobody is listening"""
+        future = self._waiters.get(job.id)
+        if future is None or future.done():
+            return
+        started = time.perf_counter()
+        future.set_result(completion(job))
+        self.published += 1
+        self.publish_ms.observe((time.perf_counter() - started) * 1000)
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            ids = [id for id, future in self._waiters.items() if not future.done()]
+            for start in range(0, len(ids), LOOKUP_CHUNK):
+                try:
+                    finished = await asyncio.to_thread(self.lookup, ids[start:start + LOOKUP_CHUNK])
+                except Exception:
+                    logger.exception("Completion lookup failed")
+                    break
+                for job in finished.values():
+                    self.publish(job)
+
+    def _subscribe(self, id: str) -> asyncio.Future:
+        future = self._waiters.get(id)
+        if future is None:
+            future = self._waiters[id] = asyncio.get_running_loop().create_future()
+        self._subscribers[id] = self._subscribers.get(id, 0) + 1
+        return future
+
+    def _unsubscribe(self, id: str) -> None:
+        self._subscribers[id] -= 1
+        if not self._subscribers[id]:
+            del self._subscribers[id]
+            del self._waiters[id]
+
+    def _reserve(self):
+        """Take a connection slot; returns its release callback, which is safe to call twice"""
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.connections -= 1
+        return release
+
+    def stream(self, id: str, job: Job | None, timeout: float = TIMEOUT_SECONDS):
+        """SSE body for one subscriber. Raises TooManyConnections before anything is sent.
+
+        The slot is taken here, with the check, rather than when the response
+        starts: otherwise every request of a burst would pass the check first.
+        """
+        if job is not None and job.status not in (QUEUED, RUNNING):
+            return self._finished(job)
+        if self.connections >= self.max_connections:
+            raise TooManyConnections(f"{self.connections} event streams are open")
+        release = self._reserve()
+        body = self._wait(id, timeout, release)
+        # A body that is never iterated never reaches its finally; dropping it frees the slot
+        weakref.finalize(body, release)
+        return body
+
+    async def _finished(self, job: Job):
+        self.delivered += 1
+        yield sse('complete', completion(job))
+
+    async def _wait(self, id: str, timeout: float, release):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # Subscribed once the response starts, so a stream that is never sent never leaks
+        future = self._subscribe(id)
+        try:
+            # Sent at once so clients and proxies see the stream is open
+            yield f"retry: 5000\n: subscribed {id}\n\n"
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    yield sse('timeout', {'id': id})
+                    return
+                try:
+                    event = await asyncio.wait_for(asyncio.shield(future), min(HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                self.delivered += 1
+                yield sse('complete', event)
+                return
+        finally:
+            self._unsubscribe(id)
+            release()
+
+    def stats(self) -> dict:
+        return {
+            'connections': self.connections,
+            'peak_connections': self.peak_connections,
+            'max_connections': self.max_connections,
+            'subscribed_ids': len(self._waiters),
+            'published': self.published,
+            'delivered': self.delivered,
+            'timeouts': self.timeouts,
+            'publish_ms': self.publish_ms.snapshot(),
+        }
@@ -0,0 +1,226 @@
+"""Structured field extraction from OCR text.
+
+A Python port of the parsing in ``supabase/functions/ocr-worker/index.ts``
+(ID type detection, ID number and holder name patterns, line-scanning
+fallbacks), extended with issue/expiry/birth dates and a confidence per field.
+
+All patterns and the stop-word set are compiled once at import. Extraction
+normalizes the text, then makes a single pass over its lines, collecting
+candidates for every field; the highest-ranked candidate per field wins.
+Unlike the edge worker, line breaks survive normalization, so the
+"value on the next line" fallbacks actually get to run.
+"""
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import date
+
+# Common OCR misreads, applied before anything else
+_FIXES = (
+    (re.compile(r'Narne', re.I), 'Name'),
+    (re.compile(r'_+'), ''),  # underscores printed on ID number lines
+    (re.compile(r'[ \t\f\v]+'), ' '),
+)
+
+_SENIOR = re.compile(r'Senior\s+Citizens?(?:\s+Affairs)?|\bOSCA\b', re.I)
+_PWD = re.compile(r'\bPWD\b|Persons?\s+with\s+Disabilit(?:y|ies)', re.I)
+
+# Field labels, matched anywhere on a line; the value is whatever follows
+_LABEL = re.compile(r'''
+    (?P<id_number>\bID\s*(?:No|Number|Num)\b\.?|\bID\b)
+  | (?P<holder_name>\bName\b)
+  | (?P<date_of_birth>\bDate\s+of\s+Birth\b|\bBirth\s*date\b|\bD\.?O\.?B\b\.?|\bBirthday\b)
+  | (?P<date_of_issue>\bDate\s+(?:of\s+)?Issued?\b|\bIssued(?:\s+on)?\b)
+  | (?P<valid_until>\bValid\s+(?:Until|Thru|Through)\b|\bExpir(?:y|ation|es)(?:\s+Date)?\b)
+''', re.I | re.X)
+
+_SEPARATORS = ' :.-#'
+
+# ID number values, best first: labelled digits, labelled alphanumerics,
+# prefixed serials anywhere (SC-2025-104392), standalone digit runs
+_ID_DIGITS = re.compile(r'^([0-9]{4,})')
+_ID_CODE = re.compile(r'^([A-Z0-9][A-Z0-9\-]{3,})', re.I)
+_ID_SERIAL = re.compile(r'\b((?:SC|OSCA|PWD)-?[0-9]{2,4}-?[0-9]{3,})\b', re.I)
+_ID_STANDALONE = re.compile(r'^([0-9]{4,})$')
+
+_NAME_VALUE = re.compile(r"^([A-Z][A-Za-z\s.',-]{4,})", re.I)
+_NAME_LINE = re.compile(r"^[A-Z][A-Z\s.',-]{5,}$", re.I)
+_GARBLED_NAME_LINE = re.compile(r'^[A-Z][A-Z\s]{4,}$', re.I)
+
+_MONTHS = {m: i for i, m in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1)}
+_DATE = re.compile(r'''
+    (?P<iso_y>\d{4})[-/.](?P<iso_m>\d{1,2})[-/.](?P<iso_d>\d{1,2})
+  | (?P<us_m>\d{1,2})[-/.](?P<us_d>\d{1,2})[-/.](?P<us_y>\d{4})
+  | (?P<mdy_m>[A-Za-z]{3,9})\.?\s+(?P<mdy_d>\d{1,2}),?\s+(?P<mdy_y>\d{4})
+  | (?P<dmy_d>\d{1,2})\s+(?P<dmy_m>[A-Za-z]{3,9})\.?,?\s+(?P<dmy_y>\d{4})
+''', re.X)
+
+# Words that show up in card headers and labels but never in a holder's name
+STOP_WORDS = frozenset(w.lower() for w in '''
+    republic philippines office pasig city date id no number address senior citizen citizens
+    affairs osca card pwd person persons disability disabilities birth issue issued valid until
+    signature of the with and ono vad address741 womalet reo te pp mae ve sex type name
+'''.split())
+
+# Confidence of each rule, before scaling by the OCR confidence
+_WEIGHTS = {
+    'label_same_line': 0.95,
+    'label_code': 0.85,
+    'label_next_line': 0.75,
+    'serial': 0.7,
+    'standalone': 0.45,
+    'garbled': 0.3,
+    'unlabelled_date': 0.3,
+    'keyword': 0.9,
+}
+
+
+@dataclass
+class ExtractedFields:
+    id_type: str | None = None
+    id_number: str | None = None
+    holder_name: str | None = None
+    date_of_birth: str | None = None
+    date_of_issue: str | None = None
+    valid_until: str | None = None
+    confidence: dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def normalize(text: str) -> str:
+    for pattern, replacement in _FIXES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def parse_date(text: str) -> str | None:
+    match = _DATE.search(text)
+    if not match:
+        return None
+    g = match.groupdict()
+    try:
+        if g['iso_y']:
+            y, m, d = int(g['iso_y']), int(g['iso_m']), int(g['iso_d'])
+        elif g['us_y']:
+            # Philippine IDs print month first
+            y, m, d = int(g['us_y']), int(g['us_m']), int(g['us_d'])
+        elif g['mdy_y']:
+            y, m, d = int(g['mdy_y']), _MONTHS[g['mdy_m'][:3].lower()], int(g['mdy_d'])
+        else:
+            y, m, d = int(g['dmy_y']), _MONTHS[g['dmy_m'][:3].lower()], int(g['dmy_d'])
+        return date(y, m, d).isoformat()
+    except (KeyError, ValueError):
+        return None
+
+
+def clean_id(value: str) -> str | None:
+    value = re.sub(r'[^A-Za-z0-9\-]', '', value).strip('-').upper()
+    return value if sum(c.isdigit() for c in value) >= 4 else None
+
+
+def clean_name(value: str) -> str | None:
+    value = ' '.join(value.split()).rstrip(' -,.')
+    words = value.split()
+    if len(value) < 5 or not 2 <= len(words) <= 6:
+        return None
+    if any(w.lower().strip(".,'-") in STOP_WORDS for w in words):
+        return None
+    return value
+
+
+class _Candidates:
+    """Best candidate per field, ranked by rule weight (first seen wins ties)"""
+
+    def __init__(self):
+        self.best: dict[str, tuple[float, str]] = {}
+
+    def offer(self, name: str, value: str | None, rule: str) -> None:
+        if not value:
+            return
+        weight = _WEIGHTS[rule]
+        if name not in self.best or weight > self.best[name][0]:
+            self.best[name] = (weight, value)
+
+
+def extract_fields(text: str, ocr_confidence: float | None = None) -> ExtractedFields:
+    """Parse OCR text into card fields. ``ocr_confidence`` (0-100) scales field confidence."""
+    text = normalize(text)
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    found = _Candidates()
+    unlabelled_dates = []
+
+    for i, line in enumerate(lines):
+        if _SENIOR.search(line):
+            found.offer('id_type', 'senior_citizen', 'keyword')
+        elif _PWD.search(line):
+            found.offer('id_type', 'pwd', 'keyword')
+
+        serial = _ID_SERIAL.search(line)
+        if serial:
+            found.offer('id_number', clean_id(serial.group(1)), 'serial')
+
+        label = _LABEL.search(line)
+        if label:
+            kind = label.lastgroup
+            value = line[label.end():].strip(_SEPARATORS)
+            following = lines[i + 1:i + 3]
+            if kind == 'id_number':
+                digits = _ID_DIGITS.match(value)
+                if digits:
+                    found.offer('id_number', clean_id(digits.group(1)), 'label_same_line')
+                else:
+                    code = _ID_CODE.match(value)
+                    if code:
+                        found.offer('id_number', clean_id(code.group(1)), 'label_code')
+                    elif following and _ID_STANDALONE.match(following[0]):
+                        found.offer('id_number', clean_id(following[0]), 'label_next_line')
+            elif kind == 'holder_name':
+                match = _NAME_VALUE.match(value)
+                name = clean_name(match.group(1)) if match else None
+                if name:
+                    found.offer('holder_name', name, 'label_same_line')
+                else:
+                    for candidate in following:
+                        if _NAME_LINE.match(candidate):
+                            name = clean_name(candidate)
+                            if name:
+                                found.offer('holder_name', name, 'label_next_line')
+                                break
+            else:
+                parsed = parse_date(value)
+                if parsed:
+                    found.offer(kind, parsed, 'label_same_line')
+                elif following:
+                    found.offer(kind, parse_date(following[0]), 'label_next_line')
+            continue
+
+        if _ID_STANDALONE.match(line):
+            found.offer('id_number', clean_id(line), 'standalone')
+            continue
+        parsed = parse_date(line)
+        if parsed:
+            unlabelled_dates.append(parsed)
+            continue
+        if _GARBLED_NAME_LINE.match(line):
+            found.offer('holder_name', clean_name(line), 'garbled')
+
+    # The earliest date nobody claimed is most likely the birth date
+    if unlabelled_dates:
+        found.offer('date_of_birth', min(unlabelled_dates), 'unlabelled_date')
+    # A serial prefix still tells the card type when no header survived OCR
+    if 'id_type' not in found.best and 'id_number' in found.best:
+        prefix = found.best['id_number'][1]
+        if prefix.startswith(('SC', 'OSCA')):
+            found.offer('id_type', 'senior_citizen', 'serial')
+        elif prefix.startswith('PWD'):
+            found.offer('id_type', 'pwd', 'serial')
+
+    scale = 1.0 if ocr_confidence is None else max(0.0, min(ocr_confidence, 100.0)) / 100
+    fields = ExtractedFields()
+    for name, (weight, value) in found.best.items():
+        setattr(fields, name, value)
+        fields.confidence[name] = round(weight * scale, 3)
+    return fields
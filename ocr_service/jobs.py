@@ -0,0 +1,367 @@
+"""Durable OCR job queue fed by insert notifications.
+
+``POST /ingest`` accepts a Supabase database webhook (or any notification
+carrying a verification ``id`` and ``file_path``) and persists a job to a
+SQLite file in WAL mode before answering, so an accepted job survives a
+restart. The runner is woken by every enqueue and starts the job at once
+instead of waiting for the next cron tick; a one-second tick picks up
+retries and jobs enqueued by other processes sharing the file.
+
+Jobs are keyed by verification ID, so webhook redeliveries collapse into one
+job and ``GET /jobs/{id}`` takes the ID the browser already has. Running jobs
+hold a lease like verification rows do (see ``verifications.py``), so a job
+whose process died is started again. With ``OCR_WORKER_DB`` set, results are
+also written back to the ``verifications`` row.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+import storage
+from decode import MAX_UPLOAD_BYTES
+from metrics import Histogram
+from verifications import COMPLETE, FAILED, Outcome, open_store
+from worker import FileSource, is_transient
+
+logger = logging.getLogger("ocr_service")
+
+QUEUE_PATH = os.getenv('OCR_JOBS_DB', 'ocr_jobs.db')
+MAX_ATTEMPTS = int(os.getenv('OCR_JOBS_MAX_ATTEMPTS', '3'))
+LEASE_SECONDS = float(os.getenv('OCR_JOBS_LEASE_SECONDS', '300'))
+# Finished jobs are kept this long for GET /jobs/{id}
+RETENTION_SECONDS = float(os.getenv('OCR_JOBS_RETENTION_HOURS', '24')) * 3600
+RETRY_BASE_SECONDS = float(os.getenv('OCR_JOBS_RETRY_BASE', '2'))
+TICK_SECONDS = 1.0
+
+QUEUED = 'queued'
+RUNNING = 'running'
+# The verification row was already taken by the batch worker or the edge function
+SKIPPED = 'skipped'
+
+LAG_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+@dataclass
+class Job:
+    id: str
+    file_path: str
+    status: str
+    attempts: int
+    enqueued_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: dict | None = None
+    error: str | None = None
+    # SHA-256 of the key the uploading browser holds for /events (ocr_events_key_hash)
+    key_hash: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'enqueued_at': self.enqueued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobQueue:
+    SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT '{QUEUED}',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at REAL NOT NULL,
+            available_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            lease_until REAL,
+            result TEXT,
+            error TEXT,
+            key_hash TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+    """
+    COLUMNS = 'id, file_path, status, attempts, enqueued_at, started_at, finished_at, result, error, key_hash'
+
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # WAL keeps committed jobs through a process crash at this level
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(self.SCHEMA)
+        # Queue files from before key_hash
+        if 'key_hash' not in {row[1] for row in self._db.execute('PRAGMA table_info(jobs)')}:
+            self._db.execute('ALTER TABLE jobs ADD COLUMN key_hash TEXT')
+        # Calls arrive on worker threads; one connection runs one transaction at a time
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _job(row) -> Job:
+        job = Job(*row)
+        if job.result is not None:
+            job.result = json.loads(job.result)
+        return job
+
+    def enqueue(self, id: str, file_path: str, key_hash: str | None = None) -> tuple[Job, bool]:
+        """Queue a job, or return the existing one. A failed job is queued again."""
+        now = time.time()
+        with self._lock, self._db:
+            created = self._db.execute(
+                "INSERT INTO jobs (id, file_path, enqueued_at, available_at, key_hash) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET status = ?, file_path = excluded.file_path, attempts = 0, "
+                "  enqueued_at = excluded.enqueued_at, available_at = excluded.available_at, "
+                "  started_at = NULL, finished_at = NULL, result = NULL, error = NULL, "
+                "  key_hash = excluded.key_hash "
+                "WHERE jobs.status = ?",
+                (id, file_path, now, now, key_hash, QUEUED, FAILED),
+            ).rowcount
+            row = self._db.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (id,)).fetchone()
+        return self._job(row), bool(created)
+
+    def take(self, limit: int) -> list[Job]:
+        """Start up to ``limit`` ready jobs, oldest first, including ones whose lease expired"""
+        now = time.time()
+        db = self._db
+        with self._lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = 'lease expired', finished_at = ?, lease_until = NULL "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, now, RUNNING, now, MAX_ATTEMPTS),
+                )
+                rows = db.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE id IN (SELECT id FROM jobs "
+                    "             WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?) "
+                    "             ORDER BY available_at LIMIT ?) "
+                    f"RETURNING {self.COLUMNS}",
+                    (RUNNING, now, now + LEASE_SECONDS, QUEUED, now, RUNNING, now, limit),
+                ).fetchall()
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return sorted((self._job(row) for row in rows), key=lambda job: job.enqueued_at)
+
+    def finish(self, id: str, status: str, result: dict | None = None, error: str | None = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ?",
+                (status, None if result is None else json.dumps(result), error, time.time(), id),
+            )
+
+    def retry(self, id: str, delay: float, error: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, error = ?, lease_until = NULL WHERE id = ?",
+                (QUEUED, time.time() + delay, error, id),
+            )
+
+    def get(self, id: str) -> Job | None:
+        with self._lock:
+            row = self._db.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (id,)).fetchone()
+        return self._job(row) if row else None
+
+    def finished(self, ids: list[str]) -> dict[str, Job]:
+        """The jobs among ``ids`` that are no longer queued or running"""
+        if not ids:
+            return {}
+        marks = ','.join('?' * len(ids))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE id IN ({marks}) AND status NOT IN (?, ?)",
+                (*ids, QUEUED, RUNNING),
+            ).fetchall()
+        return {job.id: job for job in map(self._job, rows)}
+
+    def prune(self, older_than: float = RETENTION_SECONDS) -> int:
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND finished_at < ?",
+                (QUEUED, RUNNING, time.time() - older_than),
+            ).rowcount
+
+    def depth(self) -> dict:
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute('SELECT status, count(*) FROM jobs GROUP BY status'))
+            oldest = self._db.execute(
+                "SELECT min(available_at) FROM jobs WHERE status = ? AND available_at <= ?", (QUEUED, now),
+            ).fetchone()[0]
+        return {
+            'counts': counts,
+            # Seconds the oldest startable job has been waiting: the queue lag
+            'oldest_ready_seconds': round(now - oldest, 3) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class JobRunner:
+    """Runs queued jobs through ``process(image_bytes) -> result dict``"""
+
+    def __init__(self, queue: JobQueue, process, source=storage, store=None, store_url: str = '',
+                 concurrency: int = 1, on_finish=None):
+        self.queue = queue
+        self.process = process
+        # Called with each finished Job, on the event loop
+        self.on_finish = on_finish
+        self.source = source
+        # Verifications store to write results back to (opened by start() from store_url), or None
+        self.store = store
+        self.store_url = store_url
+        self.concurrency = max(1, concurrency)
+        self.id = f"ingest-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.running = 0
+        # Enqueue to start, and enqueue to finish
+        self.queue_wait_ms = Histogram(LAG_BUCKETS_MS)
+        self.latency_ms = Histogram(LAG_BUCKETS_MS)
+        self.counters = {'enqueued': 0, 'duplicates': 0, 'complete': 0, 'failed': 0, 'skipped': 0, 'retries': 0,
+                         'truncated': 0}
+        # Last queue depth read by the runner, so stats() never touches SQLite on the event loop
+        self.depth: dict = {'counts': {}, 'oldest_ready_seconds': 0.0}
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._jobs: set[asyncio.Task] = set()
+        self._pruned = 0.0
+
+    @classmethod
+    def from_env(cls, process, concurrency: int, on_finish=None) -> 'JobRunner':
+        files_dir = os.getenv('OCR_WORKER_FILES_DIR')
+        return cls(
+            JobQueue(QUEUE_PATH),
+            process,
+            source=FileSource(files_dir) if files_dir else storage,
+            store_url=os.getenv('OCR_WORKER_DB', os.getenv('DATABASE_URL', '')),
+            concurrency=concurrency,
+            on_finish=on_finish,
+        )
+
+    async def enqueue(self, id: str, file_path: str, key_hash: str | None = None) -> tuple[Job, bool]:
+        job, created = await asyncio.to_thread(self.queue.enqueue, id, file_path, key_hash)
+        self.counters['enqueued' if created else 'duplicates'] += 1
+        if created and self._wakeup:
+            self._wakeup.set()
+        return job, created
+
+    async def get(self, id: str) -> Job | None:
+        return await asyncio.to_thread(self.queue.get, id)
+
+    async def start(self) -> None:
+        if self.store is None and self.store_url:
+            self.store = await asyncio.to_thread(open_store, self.store_url)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        # Jobs cut off here keep their lease and run again after it expires
+        for task in list(self._jobs):
+            task.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        self.queue.close()
+        if self.store:
+            self.store.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), TICK_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if self.running < self.concurrency:
+                    for job in await asyncio.to_thread(self.queue.take, self.concurrency - self.running):
+                        self.running += 1
+                        task = asyncio.create_task(self._execute(job))
+                        self._jobs.add(task)
+                        task.add_done_callback(self._jobs.discard)
+                self.depth = await asyncio.to_thread(self.queue.depth)
+                if time.monotonic() - self._pruned > 60:
+                    self._pruned = time.monotonic()
+                    await asyncio.to_thread(self.queue.prune)
+            except Exception:
+                logger.exception("Job queue poll failed")
+
+    async def _execute(self, job: Job) -> None:
+        self.queue_wait_ms.observe(max(0.0, job.started_at - job.enqueued_at) * 1000)
+        try:
+            await self._attempt(job)
+        except Exception:
+            logger.exception("Job %s could not be recorded", job.id)
+        finally:
+            self.running -= 1
+            # A slot is free: look for the next job now rather than at the next tick
+            self._wakeup.set()
+
+    async def _attempt(self, job: Job) -> None:
+        if self.store and not await asyncio.to_thread(self.store.lease, self.id, job.id, LEASE_SECONDS):
+            await self._finish(job, SKIPPED, error="verification is not pending")
+            return
+        try:
+            data = await self.source.fetch(job.file_path, MAX_UPLOAD_BYTES)
+            result = await self.process(data)
+        except Exception as exc:
+            if is_transient(exc) and job.attempts < MAX_ATTEMPTS:
+                self.counters['retries'] += 1
+                delay = RETRY_BASE_SECONDS * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+                logger.info("Job %s retrying in %.1fs: %s", job.id, delay, exc)
+                # The verification lease expires on its own if the retry never runs
+                await asyncio.to_thread(self.queue.retry, job.id, delay, str(exc)[:500])
+                return
+            logger.warning("Job %s failed: %s", job.id, exc)
+            await self._write_back(Outcome(job.id, FAILED, error=str(exc)[:500]))
+            await self._finish(job, FAILED, error=str(exc)[:500])
+            return
+        if result.get('truncated'):
+            # Out of time: keep the best partial read rather than paying for it again
+            self.counters['truncated'] += 1
+        fields = result.get('fields') or {}
+        await self._write_back(Outcome(
+            job.id, COMPLETE, result['text'],
+            id_number=fields.get('id_number'),
+            holder_name=fields.get('holder_name'),
+            id_type=fields.get('id_type'),
+        ))
+        await self._finish(job, COMPLETE, result=result)
+
+    async def _write_back(self, outcome: Outcome) -> None:
+        if self.store:
+            await asyncio.to_thread(self.store.finish, self.id, [outcome])
+
+    async def _finish(self, job: Job, status: str, result: dict | None = None, error: str | None = None) -> None:
+        await asyncio.to_thread(self.queue.finish, job.id, status, result, error)
+        job.status, job.result, job.error, job.finished_at = status, result, error, time.time()
+        self.counters[status] += 1
+        self.latency_ms.observe(max(0.0, job.finished_at - job.enqueued_at) * 1000)
+        if self.on_finish:
+            self.on_finish(job)
+
+    def stats(self) -> dict:
+        return {
+            **self.depth,
+            'running': self.running,
+            'concurrency': self.concurrency,
+            'write_back': self.store is not None,
+            **self.counters,
+            'queue_wait_ms': self.queue_wait_ms.snapshot(),
+            'latency_ms': self.latency_ms.snapshot(),
+        }
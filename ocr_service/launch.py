@@ -0,0 +1,44 @@
+"""Start the OCR service sized to the cores this container may use.
+
+Detects the CPU quota (cgroup-aware), chooses the worker count and the
+OpenMP/Tesseract/TensorFlow thread limits (see ``concurrency``), logs the
+decision as one JSON line, and replaces itself with uvicorn so every process
+starts with the same environment.
+
+Usage (from ocr_service/):
+  python launch.py              # serve on $PORT (default 8080)
+  python launch.py --dry-run    # print the plan and exit
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import concurrency
+
+logger = logging.getLogger("ocr_service")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', default=os.getenv('PORT', '8080'))
+    parser.add_argument('--dry-run', action='store_true', help='print the plan and exit')
+    args = parser.parse_args()
+
+    plan = concurrency.configure()
+    if args.dry_run:
+        print(json.dumps({**plan.to_dict(), 'effective': concurrency.effective()}, indent=2))
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger.info("Concurrency plan: %s", json.dumps({**plan.to_dict(), 'effective': concurrency.effective()}))
+    # One uvicorn process: the app runs its own worker pool, so more would multiply it
+    os.execvp(sys.executable, [
+        sys.executable, '-m', 'uvicorn', 'app:app', '--host', args.host, '--port', str(args.port), '--workers', '1',
+    ])
+
+
+if __name__ == '__main__':
+    main()
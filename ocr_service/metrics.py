@@ -0,0 +1,187 @@
+"""In-process metrics.
+
+Histograms use fixed upper bounds, like Prometheus: each observation is
+counted in the first bucket whose bound it does not exceed, and ``+Inf``
+catches the rest. Percentiles are estimated from the buckets, so they are
+only as precise as the bucket bounds around them.
+
+``Registry`` renders counters, histograms and read-on-scrape gauges in the
+Prometheus text format for ``/metrics``, without the client library.
+"""
+import bisect
+import threading
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def snapshot(self) -> dict:
+        """Count, sum and cumulative count per bucket bound"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = {}, 0
+        for bound, n in zip((*self.buckets, float('inf')), counts):
+            running += n
+            cumulative['+Inf' if bound == float('inf') else f"{bound:.12g}"] = running
+        return {'count': running, 'sum': round(total, 3), 'buckets': cumulative}
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile by interpolating inside its bucket, like histogram_quantile()"""
+        with self._lock:
+            counts = list(self._counts)
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        running, lower = 0, 0.0
+        for bound, n in zip(self.buckets, counts):
+            if running + n >= rank:
+                return round(lower + (bound - lower) * (rank - running) / n, 3) if n else lower
+            running += n
+            lower = bound
+        # In the +Inf bucket: the highest finite bound is the best estimate
+        return float(self.buckets[-1])
+
+    def percentiles(self) -> dict:
+        return {'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # Without labels the one series exists, at 0, from the start
+        self._values: dict[tuple, float] = {} if labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, key)} {value:g}" for key, value in values]
+        return lines
+
+
+class HistogramFamily:
+    """A Histogram per label combination"""
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...], labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._children: dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels) -> Histogram:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = Histogram(self.buckets)
+            return child
+
+    def observe(self, value: float, **labels) -> None:
+        self.labels(**labels).observe(value)
+
+    def bind(self, histogram: Histogram, **labels) -> None:
+        """Export a Histogram another component already keeps"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._children[key] = histogram
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, histogram in children:
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot['buckets'].items():
+                labels = _labels((*self.labelnames, 'le'), (*key, bound))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {snapshot['sum']:g}")
+            lines.append(f"{self.name}_count{labels} {snapshot['count']}")
+        return lines
+
+
+class Gauge:
+    """Read when scraped: ``fn()`` returns a number, or ``{label value: number}`` with one label"""
+
+    def __init__(self, name: str, help: str, fn, labelname: str | None = None, kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelname = labelname
+        # 'counter' for totals kept elsewhere, e.g. a component's own stats
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.fn()
+        if self.labelname is None:
+            lines.append(f"{self.name} {value:g}")
+        else:
+            lines += [f"{self.name}{_labels((self.labelname,), (key,))} {v:g}" for key, v in sorted(value.items())]
+        return lines
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...],
+                  labelnames: tuple[str, ...] = ()) -> HistogramFamily:
+        return self.register(HistogramFamily(name, help, buckets, labelnames))
+
+    def gauge(self, name: str, help: str, fn, labelname: str | None = None, kind: str = 'gauge') -> Gauge:
+        return self.register(Gauge(name, help, fn, labelname, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,476 @@
+"""CPU-bound OCR pipeline.
+
+Everything in here is synchronous and runs inside the worker pool, never on
+the event loop. Functions must stay importable at module level so they can be
+shipped to a process pool.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
+from PIL import Image
+
+import engines
+import profiling
+import quality
+import templates
+from deadline import Deadline, DeadlineReport
+from decode import DecodePlan, decode
+from extract import ExtractedFields, clean_id, clean_name, extract_fields, parse_date
+from preprocess import PREPROCESS, PREPROCESSORS, preprocess_fast, preprocess_region, run_preprocess
+from rectify import RECTIFY, rectify
+
+# Page segmentation modes tried on every image, in order of preference
+PSM_MODES = tuple(int(psm) for psm in os.getenv('OCR_PSM_ORDER', '6,11,3').split(','))
+# Tesseract's default mode, run once when every pass comes back blank
+FALLBACK_PSM = 3
+
+# Bump whenever preprocessing or pass selection changes output, so cached
+# results computed by older code are not served
+PIPELINE_VERSION = '3'
+
+# How the passes are combined: 'longest' runs them all, 'first_good' exits early
+STRATEGIES = ('longest', 'first_good')
+PASS_STRATEGY = os.getenv('OCR_PASS_STRATEGY', 'longest')
+CONFIDENCE_THRESHOLD = float(os.getenv('OCR_CONFIDENCE_THRESHOLD', '70'))
+
+# Quality tiers, most to least expensive: every PSM pass on the full preprocess
+# chain, one pass on that chain, or one pass on a downscaled image
+FULL = 'full'
+BALANCED = 'balanced'
+FAST = 'fast'
+TIERS = (FULL, BALANCED, FAST)
+# Directory holding tessdata_fast models for the fast tier (unset = the default models)
+FAST_TESSDATA = os.getenv('OCR_FAST_TESSDATA') or None
+
+# Region-of-interest OCR: 'off', 'auto' (pick a template from the header) or a template key
+TEMPLATE = os.getenv('OCR_TEMPLATE', 'off')
+
+# Tesseract releases the GIL (and pytesseract runs a subprocess), so threads overlap passes.
+# Sized for the jobs this process runs at once: one per process worker, or
+# every worker when OCR_EXECUTOR=thread puts them all in the API process.
+_JOBS_PER_PROCESS = int(os.getenv('OCR_WORKERS', os.cpu_count() or 1)) if os.getenv('OCR_EXECUTOR') == 'thread' else 1
+_pass_executor = ThreadPoolExecutor(max_workers=len(PSM_MODES) * _JOBS_PER_PROCESS, thread_name_prefix='psm')
+
+
+@dataclass
+class PassResult:
+    psm: int | None
+    text: str
+    confidence: float | None = None
+    # Passes stopped at the deadline
+    timed_out: list[int] = field(default_factory=list)
+    ms: float | None = None
+
+
+@dataclass
+class OCROutput:
+    """What /ocr returns for one image"""
+    text: str
+    psm: int | None = None
+    confidence: float | None = None
+    estimated_peak_bytes: int | None = None
+    fields: dict | None = None
+    template: str | None = None
+    # Card detection result and its own latency, when rectification ran
+    rectify: dict | None = None
+    # Quality gate verdict, when the gate ran
+    quality: dict | None = None
+    # Quality tier the image was read at
+    tier: str | None = None
+    # Work was cut short by the deadline or a disconnect; see ``deadline`` for what was dropped
+    truncated: bool = False
+    deadline: dict | None = None
+    # Milliseconds per stage in the worker: decode, preprocess, one per PSM pass
+    # ('psm6'), select, ... and 'worker' for the whole job
+    timings_ms: dict = field(default_factory=dict)
+
+
+@dataclass
+class RegionResult:
+    """Template OCR output: the matched layout, synthesized text and validated fields"""
+    template: str
+    text: str
+    confidence: float | None
+    fields: ExtractedFields
+
+
+@dataclass(frozen=True)
+class OCROptions:
+    """Per-request pipeline settings. Anything that changes the output goes in fingerprint()."""
+    strategy: str = PASS_STRATEGY
+    preprocess: str = PREPROCESS
+    extract: bool = False
+    template: str = TEMPLATE
+    rectify: bool = RECTIFY
+    tier: str = FULL
+    # The single PSM used by the balanced and fast tiers (default: the first of PSM_MODES)
+    psm: int | None = None
+
+    @classmethod
+    def create(cls, **overrides) -> 'OCROptions':
+        """Build options from request parameters, keeping defaults for the ones left as None"""
+        options = cls(**{k: v for k, v in overrides.items() if v is not None})
+        options.validate()
+        return options
+
+    def validate(self) -> None:
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+        if self.preprocess not in PREPROCESSORS:
+            raise ValueError(f"preprocess must be one of {', '.join(PREPROCESSORS)}")
+        if self.template not in ('off', 'auto'):
+            templates.get(self.template)
+        if self.tier not in TIERS:
+            raise ValueError(f"tier must be one of {', '.join(TIERS)}")
+        if self.psm is not None and not 0 <= self.psm <= 13:
+            raise ValueError("psm must be between 0 and 13")
+
+    def fingerprint(self) -> str:
+        """Everything that changes the OCR output for identical image bytes.
+
+        ``psm`` is left out: the governor moves it as it learns which PSM wins,
+        and a result read at any PSM is a valid read at its tier, so a change
+        of PSM should not empty the cache for the balanced and fast tiers.
+        """
+        return ':'.join([
+            f"v{PIPELINE_VERSION}",
+            engines.engine_name(),
+            ','.join(str(psm) for psm in PSM_MODES),
+            str(CONFIDENCE_THRESHOLD),
+            quality.fingerprint(),
+            str(FAST_TESSDATA if self.tier == FAST else None),
+            *(str(getattr(self, f.name)) for f in fields(self) if f.name != 'psm'),
+        ])
+
+
+def _timeout(deadline: Deadline | None) -> float | None:
+    """Seconds a pass starting now may run; PassTimeout right away when cancelled"""
+    if deadline is None:
+        return None
+    if deadline.cancelled():
+        raise engines.PassTimeout("Request cancelled")
+    return deadline.remaining()
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _run_pass(image: Image.Image, psm: int, with_confidence: bool, tessdata: str | None = None,
+              deadline: Deadline | None = None, cancel=None) -> PassResult:
+    """Run a single Tesseract pass. Confidence is only computed when needed."""
+    timeout = _timeout(deadline)
+    started = time.perf_counter()
+    if with_confidence:
+        text, confidence = engines.image_to_text_with_confidence(image, psm, tessdata=tessdata, timeout=timeout,
+                                                                 cancel=cancel)
+        return PassResult(psm, text, confidence, ms=_ms(started))
+    text = engines.image_to_text(image, psm, tessdata=tessdata, timeout=timeout, cancel=cancel)
+    return PassResult(psm, text, ms=_ms(started))
+
+
+class _PassCancel:
+    """Set once the caller has the pass it wants; also set while the request is cancelled"""
+
+    def __init__(self, deadline: Deadline | None):
+        self.deadline = deadline
+        self._event = threading.Event()
+
+    def set(self) -> None:
+        self._event.set()
+
+    def is_set(self) -> bool:
+        return self._event.is_set() or (self.deadline is not None and self.deadline.cancelled())
+
+
+def _passes(image: Image.Image, with_confidence: bool, deadline: Deadline | None):
+    """Yield ``(psm, PassResult or exception)`` for each pass, as each finishes.
+
+    Every pass runs at once on the pass threads. When the caller stops
+    iterating, passes that have not started are dropped and running ones are
+    cancelled (see ``engines``), so they stop using the CPU.
+    """
+    cancel = _PassCancel(deadline)
+    run_pass = profiling.bind(_run_pass)
+    futures = {_pass_executor.submit(run_pass, image, psm, with_confidence, None, deadline, cancel): psm
+               for psm in PSM_MODES}
+    try:
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as exc:
+                yield futures[future], exc
+    finally:
+        cancel.set()
+        for future in futures:
+            future.cancel()
+
+
+def ocr_image(processed_image: Image.Image, strategy: str | None = None,
+              deadline: Deadline | None = None, timings: dict | None = None) -> PassResult:
+    """Run the PSM passes on a preprocessed image.
+
+    Both strategies run the passes concurrently. ``longest`` waits for every
+    one and keeps the longest text. ``first_good`` scores each by mean word
+    confidence and takes the first to finish at CONFIDENCE_THRESHOLD or
+    above; the passes still running are cancelled, and are not counted as
+    timed out. Passes still running at the ``deadline`` are stopped and listed in
+    ``timed_out``; the best of the passes that finished is returned.
+    The time of each finished pass and of the selection goes into ``timings``.
+    """
+    strategy = strategy or PASS_STRATEGY
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown OCR strategy: {strategy}")
+    early_exit = strategy == 'first_good'
+    timings = {} if timings is None else timings
+
+    results = []
+    timed_out = []
+    for psm, outcome in _passes(processed_image, early_exit, deadline):
+        if isinstance(outcome, engines.PassTimeout):
+            timed_out.append(psm)
+            continue
+        if isinstance(outcome, Exception):
+            continue
+        timings[f'psm{psm}'] = outcome.ms
+        if not outcome.text.strip():
+            continue
+        if early_exit and outcome.confidence >= CONFIDENCE_THRESHOLD:
+            return _finish(outcome)
+        results.append(outcome)
+
+    if results:
+        started = time.perf_counter()
+        if early_exit:
+            # Nothing reached the threshold, keep the most confident pass
+            best = max(results, key=lambda r: r.confidence)
+        else:
+            # Use the text with most content (first in PSM order on ties)
+            best = max(sorted(results, key=lambda r: PSM_MODES.index(r.psm)), key=lambda r: len(r.text))
+        best.timed_out = timed_out
+        timings['select'] = _ms(started)
+        return _finish(best)
+
+    if timed_out:
+        # Out of time: no fallback pass
+        return _finish(PassResult(None, '', timed_out=timed_out))
+
+    # Fallback to basic OCR, unless every pass came back blank right at the deadline
+    started = time.perf_counter()
+    try:
+        text = engines.image_to_text(processed_image, FALLBACK_PSM, timeout=_timeout(deadline))
+    except engines.PassTimeout:
+        return _finish(PassResult(None, '', timed_out=[FALLBACK_PSM]))
+    timings['fallback'] = _ms(started)
+    return _finish(PassResult(None, text))
+
+
+def ocr_single(processed_image: Image.Image, psm: int | None = None, tessdata: str | None = None,
+               deadline: Deadline | None = None, timings: dict | None = None) -> PassResult:
+    """One pass at ``psm`` (default: the first of PSM_MODES), for the degraded tiers.
+
+    Runs on the calling thread and computes confidence, which field extraction
+    uses. There is no fallback pass: under pressure an empty read is returned
+    as is rather than paying for a second pass.
+    """
+    psm = psm or PSM_MODES[0]
+    try:
+        result = _run_pass(processed_image, psm, True, tessdata, deadline)
+    except engines.PassTimeout:
+        return PassResult(psm, '', timed_out=[psm])
+    except Exception:
+        # A failed pass reads as blank, as it does among the full tier's passes
+        return PassResult(psm, '')
+    if timings is not None:
+        timings[f'psm{psm}'] = result.ms
+    return _finish(result)
+
+
+def _finish(result: PassResult) -> PassResult:
+    # Clean up whitespace
+    result.text = result.text.strip()
+    return result
+
+
+# How each template field is validated, and the label it gets in synthesized text
+_FIELD_PARSERS = {
+    'holder_name': ('Name', clean_name),
+    'id_number': ('ID No.', clean_id),
+    'date_of_birth': ('Date of Birth', parse_date),
+    'date_of_issue': ('Date of Issue', parse_date),
+    'valid_until': ('Valid Until', parse_date),
+}
+
+
+def _run_region(image: Image.Image, box: templates.Box, deadline: Deadline | None = None) -> PassResult:
+    crop = preprocess_region(image, box.pixels(*image.size))
+    text, confidence = engines.image_to_text_with_confidence(crop, box.psm, whitelist=box.whitelist,
+                                                             timeout=_timeout(deadline))
+    return PassResult(box.psm, text.strip(), confidence)
+
+
+def _read_regions(image: Image.Image, boxes: list, deadline: Deadline | None) -> dict | None:
+    """Read ``boxes`` in parallel; None as soon as one fails"""
+    # Layouts may share boxes, so each is read once
+    boxes = list(dict.fromkeys(boxes))
+    run_region = profiling.bind(_run_region)
+    futures = {box: _pass_executor.submit(run_region, image, box, deadline) for box in boxes}
+    try:
+        return {box: future.result() for box, future in futures.items()}
+    except Exception:
+        return None
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+
+def ocr_regions(image: Image.Image, template: str = 'auto', deadline: Deadline | None = None) -> RegionResult | None:
+    """OCR only the header and field boxes of a known card layout.
+
+    The header boxes of the candidate templates are read first. The field
+    boxes are read only for candidates whose header matched, so a card no
+    template fits costs just its header crops. Each box is cropped and read
+    in parallel with its own whitelist and PSM. Returns None, so the caller
+    can fall back to full-page OCR, when the image does not have the card's
+    shape, no header matches, or a required field fails validation.
+    """
+    candidates = list(templates.TEMPLATES.values()) if template == 'auto' else [templates.get(template)]
+    candidates = [t for t in candidates if t.matches_shape(*image.size)]
+    if not candidates:
+        return None
+
+    results = _read_regions(image, [t.header for t in candidates], deadline)
+    if results is None:
+        return None
+    candidates = [t for t in candidates if templates.match_header(results[t.header].text, [t]) is not None]
+    if not candidates:
+        return None
+    fields = _read_regions(image, [box for t in candidates for box in t.fields.values() if box not in results],
+                           deadline)
+    if fields is None:
+        return None
+    results.update(fields)
+
+    for candidate in candidates:
+        header = results[candidate.header]
+        found = ExtractedFields(id_type=candidate.id_type)
+        found.confidence['id_type'] = round(header.confidence / 100, 3)
+        lines = header.text.splitlines()
+        for name, box in candidate.fields.items():
+            label, parse = _FIELD_PARSERS[name]
+            result = results[box]
+            value = parse(result.text) if result.text else None
+            if value:
+                setattr(found, name, value)
+                found.confidence[name] = round(result.confidence / 100, 3)
+                lines.append(f"{label}: {value}")
+        if all(getattr(found, name) for name in candidate.required):
+            used = [results[candidate.header], *(results[box] for box in candidate.fields.values())]
+            confidence = sum(r.confidence for r in used) / len(used)
+            return RegionResult(candidate.key, '\n'.join(lines), confidence, found)
+    return None
+
+
+def ocr_bytes(image_bytes: bytes, options: OCROptions = OCROptions(), deadline: Deadline | None = None) -> OCROutput:
+    """Decode, preprocess and OCR an uploaded image. Runs in a worker."""
+    started = time.perf_counter()
+    image, decode_plan = decode(image_bytes)
+    timings = {'decode': _ms(started)}
+    lap = time.perf_counter()
+    verdict = quality.check(image)
+    timings['quality'] = _ms(lap)
+    rectified = None
+    if options.rectify:
+        lap = time.perf_counter()
+        rectified = rectify(image)
+        image = rectified.image
+        timings['rectify'] = _ms(lap)
+    output = ocr_decoded(image, decode_plan, options, verdict.to_dict() if verdict else None,
+                         rectified.info() if rectified else None, deadline)
+    output.timings_ms = {**timings, **output.timings_ms, 'worker': _ms(started)}
+    return output
+
+
+def _preprocess(image: Image.Image, options: OCROptions, report: DeadlineReport | None) -> Image.Image:
+    if options.tier == FAST:
+        return preprocess_fast(image)
+    if report and report.deadline.behind('preprocess'):
+        # Already past the point preprocessing should have finished: keep the time for OCR
+        report.skip('preprocess')
+        return preprocess_fast(image)
+    return run_preprocess(image, options.preprocess)
+
+
+def ocr_decoded(image: Image.Image, decode_plan: DecodePlan, options: OCROptions = OCROptions(),
+                quality_info: dict | None = None, rectify_info: dict | None = None,
+                deadline: Deadline | None = None) -> OCROutput:
+    """OCR a decoded grayscale image the caller has already gated and rectified.
+
+    With a ``deadline``, the decode stage is everything since the deadline
+    started, including the wait for a worker.
+    """
+    started = time.perf_counter()
+    timings = {}
+    report = DeadlineReport(deadline) if deadline else None
+    if report:
+        report.stage('decode')
+    if options.template != 'off' and not (deadline and deadline.expired()):
+        lap = time.perf_counter()
+        region = ocr_regions(image, options.template, deadline)
+        timings['regions'] = _ms(lap)
+        if region:
+            if report:
+                report.stage('ocr')
+            return OCROutput(
+                text=region.text,
+                confidence=region.confidence,
+                estimated_peak_bytes=decode_plan.estimated_peak_bytes(options.preprocess),
+                fields=region.fields.to_dict() if options.extract else None,
+                template=region.template,
+                rectify=rectify_info,
+                quality=quality_info,
+                tier=options.tier,
+                deadline=report and report.to_dict(),
+                timings_ms={**timings, 'worker': _ms(started)},
+            )
+
+    if deadline and deadline.expired():
+        report.skip('ocr')
+        result = PassResult(None, '')
+    else:
+        lap = time.perf_counter()
+        processed = _preprocess(image, options, report)
+        timings['preprocess'] = _ms(lap)
+        if report:
+            report.stage('preprocess')
+        if deadline and deadline.expired():
+            report.skip('ocr')
+            result = PassResult(None, '')
+        elif options.tier == FULL:
+            result = ocr_image(processed, options.strategy, deadline, timings)
+        else:
+            tessdata = FAST_TESSDATA if options.tier == FAST else None
+            result = ocr_single(processed, options.psm, tessdata, deadline, timings)
+        if report:
+            report.stage('ocr')
+            report.timed_out = result.timed_out
+    fields = None
+    if options.extract:
+        lap = time.perf_counter()
+        fields = extract_fields(result.text, result.confidence).to_dict()
+        timings['extract'] = _ms(lap)
+    return OCROutput(
+        text=result.text,
+        psm=result.psm,
+        confidence=result.confidence,
+        estimated_peak_bytes=decode_plan.estimated_peak_bytes(options.preprocess),
+        fields=fields,
+        rectify=rectify_info,
+        quality=quality_info,
+        tier=options.tier,
+        truncated=bool(report and report.truncated),
+        deadline=report and report.to_dict(),
+        timings_ms={**timings, 'worker': _ms(started)},
+    )
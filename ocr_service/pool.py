@@ -0,0 +1,312 @@
+"""Bounded worker pool for the CPU-heavy OCR stages.
+
+Each priority lane admits up to ``max_queue`` jobs waiting for a worker.
+Anything beyond that is rejected immediately with ``PoolFull`` so the API can
+answer 503 with a Retry-After hint instead of letting latency grow without
+bound.
+
+Each job can also declare its estimated peak memory (``cost``). Jobs only start
+while the sum of running costs stays within the memory budget, so a burst of
+huge photos runs one or two at a time while small scans use every worker.
+
+Jobs belong to a priority lane: ``interactive`` (someone waiting on the
+page), ``worker`` (the cron-driven edge worker and the batch worker) or
+``backfill`` (historical reprocessing). Each lane has its own queue limit.
+When a worker frees up, the next job is picked by smooth weighted
+round-robin over the lanes with jobs waiting, and ``interactive_reserved``
+workers are never handed to the other lanes, so a backfill cannot push
+interactive latency up to minutes.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+
+from metrics import Histogram
+
+INTERACTIVE = 'interactive'
+WORKER = 'worker'
+BACKFILL = 'backfill'
+LANES = (INTERACTIVE, WORKER, BACKFILL)
+DEFAULT_WEIGHTS = {INTERACTIVE: 6, WORKER: 3, BACKFILL: 1}
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+def default_memory_budget() -> int:
+    """Half of the container memory limit, or of physical memory without one"""
+    try:
+        with open('/sys/fs/cgroup/memory.max') as f:  # cgroup v2
+            limit = f.read().strip()
+        if limit != 'max':
+            return int(limit) // 2
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def lane_settings(value: str, default: dict[str, int]) -> dict[str, int]:
+    """Parse ``interactive=6,backfill=1`` over the defaults"""
+    settings = dict(default)
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, number = item.partition('=')
+        if name.strip() not in LANES:
+            raise ValueError(f"Unknown priority lane: {name}")
+        settings[name.strip()] = int(number)
+    return settings
+
+
+class PoolFull(Exception):
+    """Raised when the admission queue is full"""
+
+    def __init__(self, retry_after: int, lane: str = INTERACTIVE):
+        super().__init__(f"OCR queue is full for {lane} jobs, retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.lane = lane
+
+    def __reduce__(self):
+        return self.__class__, (self.retry_after, self.lane)
+
+
+@dataclass
+class Lane:
+    name: str
+    weight: int
+    max_queue: int
+    # Admitted and waiting for a worker
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    rejected: int = 0
+    # Smooth weighted round-robin state
+    credit: int = 0
+    waiters: deque = field(default_factory=deque)
+    # Admission to start, and admission to finish
+    queue_wait_ms: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS_MS))
+    latency_ms: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS_MS))
+
+    def stats(self) -> dict:
+        return {
+            "weight": self.weight,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_ms": {"count": self.queue_wait_ms.count, **self.queue_wait_ms.percentiles()},
+            "latency_ms": {"count": self.latency_ms.count, **self.latency_ms.percentiles()},
+        }
+
+
+class WorkerPool:
+    """Runs blocking callables on an executor with bounded admission"""
+
+    def __init__(self, workers: int, max_queue: int, kind: str = 'process', initializer=None,
+                 memory_budget: int = 0, weights: dict[str, int] | None = None,
+                 lane_queues: dict[str, int] | None = None, interactive_reserved: int = 0):
+        if kind not in ('process', 'thread'):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.kind = kind
+        # Runs once in every worker process/thread, e.g. to warm OCR engines
+        self.initializer = initializer
+        # Bytes of estimated peak memory allowed to run at once (0 = unlimited)
+        self.memory_budget = max(0, memory_budget)
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        lane_queues = lane_queues or {}
+        self.lanes = {
+            name: Lane(name, max(1, weights[name]), max(0, lane_queues.get(name, self.max_queue)))
+            for name in LANES
+        }
+        # Workers only interactive jobs may take; at least one stays open to the other lanes
+        self.interactive_reserved = min(max(0, interactive_reserved), self.workers - 1)
+        self.reserved_bytes = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.completed = 0
+        self.rejected = 0
+        # Workers handed to a job, including jobs still waiting on the memory budget
+        self.busy = 0
+        # Exponentially weighted average job duration, used for Retry-After
+        self.avg_seconds = 1.0
+        self._executor: Executor | None = None
+        self._memory: asyncio.Condition | None = None
+
+    @classmethod
+    def from_env(cls, initializer=None) -> 'WorkerPool':
+        workers = int(os.getenv('OCR_WORKERS', os.cpu_count() or 1))
+        max_queue = int(os.getenv('OCR_MAX_QUEUE', '16'))
+        return cls(
+            workers=workers,
+            max_queue=max_queue,
+            kind=os.getenv('OCR_EXECUTOR', 'process'),
+            initializer=initializer,
+            memory_budget=int(os.getenv('OCR_MEMORY_BUDGET_MB', default_memory_budget() // 2**20)) * 2**20,
+            weights=lane_settings(os.getenv('OCR_LANE_WEIGHTS', ''), DEFAULT_WEIGHTS),
+            lane_queues=lane_settings(os.getenv('OCR_LANE_QUEUES', ''), dict.fromkeys(LANES, max_queue)),
+            interactive_reserved=int(os.getenv('OCR_INTERACTIVE_RESERVED', workers // 4)),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """Admitted requests still waiting for a worker"""
+        return self.admitted - self.in_flight
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + sum(lane.max_queue for lane in self.lanes.values())
+
+    def _ensure_started(self) -> None:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='ocr', initializer=self.initializer
+                )
+        if self._memory is None:
+            self._memory = asyncio.Condition()
+
+    def retry_after(self, lane: str | None = None) -> int:
+        """Rough number of seconds until a queue slot frees up"""
+        waiting = self.lanes[lane].queued if lane else self.queue_depth
+        waves = (waiting + 1) / self.workers
+        return max(1, math.ceil(waves * self.avg_seconds))
+
+    def _fits(self, cost: int) -> bool:
+        # A job bigger than the whole budget still runs, but only on its own
+        return not self.memory_budget or self.reserved_bytes == 0 or self.reserved_bytes + cost <= self.memory_budget
+
+    def _may_start(self, lane: Lane) -> bool:
+        if self.busy >= self.workers:
+            return False
+        if lane.name == INTERACTIVE:
+            return True
+        return self.busy - self.lanes[INTERACTIVE].running < self.workers - self.interactive_reserved
+
+    def _dispatch(self) -> None:
+        """Hand free workers to waiting jobs by smooth weighted round-robin over the lanes"""
+        while True:
+            ready = []
+            for lane in self.lanes.values():
+                # Callers that gave up while waiting
+                while lane.waiters and lane.waiters[0].done():
+                    lane.waiters.popleft()
+                if lane.waiters and self._may_start(lane):
+                    ready.append(lane)
+            if not ready:
+                return
+            total = sum(lane.weight for lane in ready)
+            for lane in ready:
+                lane.credit += lane.weight
+            chosen = max(ready, key=lambda lane: lane.credit)
+            chosen.credit -= total
+            self.busy += 1
+            chosen.running += 1
+            chosen.waiters.popleft().set_result(None)
+
+    async def _acquire(self, lane: Lane) -> None:
+        if not any(other.waiters for other in self.lanes.values()) and self._may_start(lane):
+            self.busy += 1
+            lane.running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Handed a worker in the same tick the caller gave up: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release(lane)
+            raise
+
+    def _release(self, lane: Lane) -> None:
+        self.busy -= 1
+        lane.running -= 1
+        self._dispatch()
+
+    async def run(self, fn, *args, cost: int = 0, lane: str = INTERACTIVE):
+        """Run ``fn(*args)`` on a worker, or raise PoolFull.
+
+        ``cost`` is the job's estimated peak memory in bytes and ``lane`` its
+        priority class.
+        """
+        lane = self.lanes[lane]
+        if lane.queued >= lane.max_queue and not self._may_start(lane):
+            lane.rejected += 1
+            self.rejected += 1
+            raise PoolFull(self.retry_after(lane.name), lane.name)
+
+        self._ensure_started()
+        admitted = time.perf_counter()
+        self.admitted += 1
+        lane.queued += 1
+        try:
+            try:
+                await self._acquire(lane)
+            finally:
+                lane.queued -= 1
+            try:
+                async with self._memory:
+                    await self._memory.wait_for(lambda: self._fits(cost))
+                    self.reserved_bytes += cost
+                self.in_flight += 1
+                started = time.perf_counter()
+                lane.queue_wait_ms.observe((started - admitted) * 1000)
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, partial(fn, *args))
+                finally:
+                    self.in_flight -= 1
+                    self.completed += 1
+                    lane.completed += 1
+                    finished = time.perf_counter()
+                    self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (finished - started)
+                    lane.latency_ms.observe((finished - admitted) * 1000)
+                    async with self._memory:
+                        self.reserved_bytes -= cost
+                        self._memory.notify_all()
+            finally:
+                self._release(lane)
+        finally:
+            self.admitted -= 1
+
+    def spare(self) -> dict:
+        """Room for more work right now, for autoscaling: idle workers and free queue slots per lane"""
+        headroom = {name: max(0, lane.max_queue - lane.queued) for name, lane in self.lanes.items()}
+        return {
+            "free_workers": max(0, self.workers - self.busy),
+            "queue_headroom": headroom,
+            # Interactive requests that would be admitted now without a 503
+            "interactive_slots": max(0, self.workers - self.busy) + headroom[INTERACTIVE],
+            "utilization": round(min(self.busy, self.workers) / self.workers, 2),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "memory_budget_bytes": self.memory_budget,
+            "reserved_bytes": self.reserved_bytes,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "interactive_reserved": self.interactive_reserved,
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,384 @@
+"""Image preprocessing engines.
+
+``pillow`` is the original enhance/filter chain. ``numpy`` produces a similar
+image into a single uint8 array. It upscales, tones and filters the source a
+strip of rows at a time through a few reused scratch buffers: contrast and
+brightness are fused into one lookup table, and sharpening, the 3x3 median and
+the unsharp mask write back into the same buffers instead of allocating a new
+full-size image per step. The output is the only full-size allocation.
+``sauvola`` is ``numpy`` followed by adaptive binarization, thresholded in
+place into that output, handing Tesseract a black and white image.
+
+``preprocess_fast`` is not an engine choice but the ``fast`` quality tier:
+it caps the long side instead of upscaling and only stretches contrast.
+"""
+import math
+import os
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+PREPROCESSORS = ('pillow', 'numpy', 'sauvola')
+PREPROCESS = os.getenv('OCR_PREPROCESS', 'pillow')
+
+# Minimum size Tesseract gets to see; smaller images are upscaled
+MIN_WIDTH = 1200
+MIN_HEIGHT = 900
+
+# Longest side the fast tier hands to Tesseract; larger images are downscaled
+FAST_MAX_SIDE = int(os.getenv('OCR_FAST_MAX_SIDE', '1280'))
+
+CONTRAST = 3.0
+BRIGHTNESS = 1.2
+SHARPNESS = 3.0
+UNSHARP_PERCENT = 150
+UNSHARP_THRESHOLD = 3
+
+# Card height template regions are scaled to before OCR; a v1 field row is
+# then about 50-60 px tall, which Tesseract reads well without a full upscale
+REGION_CARD_HEIGHT = 720
+
+# Sauvola parameters: window in pixels, sensitivity k and dynamic range R
+SAUVOLA_WINDOW = int(os.getenv('OCR_SAUVOLA_WINDOW', '31'))
+SAUVOLA_K = float(os.getenv('OCR_SAUVOLA_K', '0.2'))
+SAUVOLA_R = 128.0
+
+# Rows filtered at a time by the numpy engine, and the context rows each strip
+# needs: sharpen 1 + median 1 + four vertical binomial passes of radius 2
+STRIP_ROWS = 128
+_HALO = 10
+
+
+def _upscaled_size(width: int, height: int) -> tuple[int, int]:
+    if width < MIN_WIDTH or height < MIN_HEIGHT:
+        scale = max(MIN_WIDTH / width, MIN_HEIGHT / height)
+        return int(width * scale), int(height * scale)
+    return width, height
+
+
+def _upscale(image: Image.Image) -> Image.Image:
+    # Resize if too small (Tesseract works better with larger images)
+    size = _upscaled_size(*image.size)
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return image
+
+
+def working_set_bytes(size: tuple[int, int], engine: str | None = None) -> int:
+    """Approximate peak bytes a grayscale image of ``size`` needs while preprocessing"""
+    w, h = _upscaled_size(*size)
+    pixels = w * h
+    if (engine or PREPROCESS) == 'pillow':
+        # Each enhance step holds its input, a degenerate image and the output
+        return 3 * pixels
+    # The output, and per strip: the upscaled and toned rows with their bytes copy,
+    # then uint8 + two int16 + mask scratch
+    strips = (STRIP_ROWS + 2 * _HALO) * w * 9
+    # Sauvola's float maps, at a sixteenth of the pixels, come after the strips are freed
+    maps = 2 * pixels if engine == 'sauvola' else 0
+    return pixels + max(strips, maps)
+
+
+def preprocess_image(image: Image.Image) -> Image.Image:
+    """Apply image preprocessing to improve OCR accuracy"""
+    if image.mode != 'L':
+        # Convert to RGB if necessary
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        # Convert to grayscale for better contrast
+        image = image.convert('L')
+
+    # Do this early to improve subsequent processing
+    image = _upscale(image)
+
+    # Apply aggressive contrast enhancement
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(CONTRAST)  # Increase contrast by 3x
+
+    # Enhance brightness to make text more visible
+    enhancer = ImageEnhance.Brightness(image)
+    image = enhancer.enhance(BRIGHTNESS)  # Slightly brighter
+
+    # Enhance sharpness
+    enhancer = ImageEnhance.Sharpness(image)
+    image = enhancer.enhance(SHARPNESS)  # Increase sharpness by 3x
+
+    # Apply denoising (median filter)
+    image = image.filter(ImageFilter.MedianFilter(size=3))
+
+    # Apply unsharp mask for better edge definition
+    image = image.filter(ImageFilter.UnsharpMask(radius=2, percent=UNSHARP_PERCENT, threshold=UNSHARP_THRESHOLD))
+
+    return image
+
+
+def _tone_lut(mean: int) -> list[int]:
+    """ImageEnhance.Contrast followed by ImageEnhance.Brightness as one table"""
+    levels = np.arange(256, dtype=np.float32)
+    contrast = np.clip(mean + CONTRAST * (levels - mean), 0, 255).astype(np.uint8)
+    return np.clip(contrast.astype(np.float32) * BRIGHTNESS, 0, 255).astype(np.uint8).tolist()
+
+
+def _sharpen(a: np.ndarray, s: np.ndarray, t: np.ndarray) -> None:
+    """ImageEnhance.Sharpness in place on the interior of ``a``.
+
+    Pillow blends with the SMOOTH kernel ([[1,1,1],[1,5,1],[1,1,1]] / 13):
+    out = smooth + k * (a - smooth) = (13k * a - (k - 1) * smooth13) / 13
+    """
+    c = a[1:-1, 1:-1]
+    s, t = s[1:-1, 1:-1], t[1:-1, 1:-1]
+    np.multiply(c, 4, out=s, dtype=np.int16)  # centre weight 5 = 4 here + 1 from the 3x3 sum below
+    for dy in range(3):
+        for dx in range(3):
+            np.add(s, a[dy:dy + s.shape[0], dx:dx + s.shape[1]], out=s, dtype=np.int16)
+    np.multiply(c, int(13 * SHARPNESS), out=t, dtype=np.int16)
+    s *= -int(SHARPNESS - 1)
+    s += t
+    s += 6  # round
+    s //= 13
+    np.clip(s, 0, 255, out=s)
+    np.copyto(c, s, casting='unsafe')
+
+
+def _median3(a: np.ndarray, lo: np.ndarray, mid: np.ndarray, hi: np.ndarray,
+             x: np.ndarray, y: np.ndarray) -> None:
+    """Exact 3x3 median in place on the interior of ``a``.
+
+    Each column triple is sorted once (lo/mid/hi), then the median of the
+    window is med3(max of lows, med3 of mids, min of highs).
+    """
+    h, w = a.shape[0] - 2, a.shape[1]
+    lo, mid, hi, x, y = lo[:h, :w], mid[:h, :w], hi[:h, :w], x[:h, :w - 2], y[:h, :w - 2]
+    up, ce, dn = a[:-2], a[1:-1], a[2:]
+    np.minimum(up, ce, out=lo)
+    np.maximum(up, ce, out=hi)
+    np.minimum(hi, dn, out=mid)
+    np.maximum(hi, dn, out=hi)
+    np.maximum(lo, mid, out=mid)
+    np.minimum(lo, dn, out=lo)
+
+    out = a[1:-1, 1:-1]
+    np.maximum(lo[:, :-2], lo[:, 1:-1], out=out)
+    np.maximum(out, lo[:, 2:], out=out)
+    # lo is free now; reuse its interior for the min of highs
+    min_hi = lo[:, 1:-1]
+    np.minimum(hi[:, :-2], hi[:, 1:-1], out=min_hi)
+    np.minimum(min_hi, hi[:, 2:], out=min_hi)
+    # med3 of mids -> y
+    np.minimum(mid[:, :-2], mid[:, 1:-1], out=x)
+    np.maximum(mid[:, :-2], mid[:, 1:-1], out=y)
+    np.minimum(y, mid[:, 2:], out=y)
+    np.maximum(x, y, out=y)
+    # med3(out, y, min_hi)
+    np.minimum(out, y, out=x)
+    np.maximum(out, y, out=out)
+    np.minimum(out, min_hi, out=out)
+    np.maximum(x, out, out=out)
+
+
+def _blur_pass(src: np.ndarray, dst: np.ndarray, axis: int) -> None:
+    """One [1, 4, 6, 4, 1] / 16 pass along ``axis``; the two edge lines are copied"""
+    n = src.shape[axis]
+
+    def span(start: int, stop: int) -> tuple:
+        return (slice(start, stop), slice(None)) if axis == 0 else (slice(None), slice(start, stop))
+
+    inner = dst[span(2, n - 2)]
+    centre = src[span(2, n - 2)]
+    # 6c + 4(l1 + r1) + (l2 + r2) == 2 * (c + 2 * (c + l1 + r1)) + l2 + r2, without temporaries
+    np.add(centre, src[span(1, n - 3)], out=inner)
+    inner += src[span(3, n - 1)]
+    inner <<= 1
+    inner += centre
+    inner <<= 1
+    inner += src[span(0, n - 4)]
+    inner += src[span(4, n)]
+    inner += 8
+    inner >>= 4
+    dst[span(0, 2)] = src[span(0, 2)]
+    dst[span(n - 2, n)] = src[span(n - 2, n)]
+
+
+def _unsharp(a: np.ndarray, s: np.ndarray, t: np.ndarray, mask: np.ndarray) -> None:
+    """ImageFilter.UnsharpMask(radius=2) in place on ``a``.
+
+    The Gaussian (sigma 2) is approximated by four binomial passes per axis.
+    """
+    np.copyto(s, a)
+    for axis in (0, 1):
+        for _ in range(2):
+            _blur_pass(s, t, axis)
+            _blur_pass(t, s, axis)
+    # t = a - blur; apply where |t| >= threshold
+    np.subtract(a, s, out=t, dtype=np.int16)
+    np.abs(t, out=s)
+    np.greater_equal(s, UNSHARP_THRESHOLD, out=mask)
+    # percent / 100 as a reduced fraction keeps the product inside int16
+    g = math.gcd(UNSHARP_PERCENT, 100)
+    t *= UNSHARP_PERCENT // g
+    t //= 100 // g
+    t += a
+    np.clip(t, 0, 255, out=t)
+    np.copyto(a, t, casting='unsafe', where=mask)
+
+
+def _sauvola(a: np.ndarray) -> np.ndarray:
+    """Sauvola binarization of ``a`` in place: background 255, ink 0.
+
+    Local mean and deviation are computed on a 4x box-reduced copy, and the
+    threshold map is scaled back up a band of rows at a time, so the
+    full-size cost is ``a`` itself.
+    """
+    f = 4
+    h, w = a.shape
+    hs, ws = h // f, w // f
+    mean = np.empty((hs, ws), dtype=np.float32)
+    sq = np.empty((hs, ws), dtype=np.float32)
+    # Block sums in integers a band of rows at a time, so no float copy of the page is made
+    band = STRIP_ROWS // f
+    for i in range(0, hs, band):
+        j = min(hs, i + band)
+        rows = a[i * f:j * f, :ws * f]
+        mean[i:j] = rows.reshape(j - i, f, ws, f).sum(axis=(1, 3), dtype=np.uint32)
+        squares = np.square(rows, dtype=np.uint16)
+        sq[i:j] = squares.reshape(j - i, f, ws, f).sum(axis=(1, 3), dtype=np.uint32)
+    mean /= f * f
+    sq /= f * f
+
+    r = max(1, SAUVOLA_WINDOW // (2 * f))
+
+    def box(m: np.ndarray) -> np.ndarray:
+        # Mean over a (2r+1)^2 window with edge padding, via an integral image summed
+        # in place in float64 (cumsum(dtype=...) would hold a cast copy as well)
+        p = np.pad(m, r + 1, mode='edge').astype(np.float64)
+        p.cumsum(0, out=p)
+        p.cumsum(1, out=p)
+        k = 2 * r + 1
+        total = p[k:, k:] - p[:-k, k:]
+        total -= p[k:, :-k]
+        total += p[:-k, :-k]
+        del p
+        total /= k * k
+        return total[:hs, :ws].astype(np.float32)
+
+    local_mean = box(mean)
+    del mean
+    threshold = box(sq)
+    del sq
+    # threshold = mean * (1 + k * (std / R - 1)), built up in place
+    threshold -= np.square(local_mean)
+    np.maximum(threshold, 0, out=threshold)
+    np.sqrt(threshold, out=threshold)
+    threshold *= SAUVOLA_K / SAUVOLA_R
+    threshold += 1 - SAUVOLA_K
+    threshold *= local_mean
+    np.clip(threshold, 0, 255, out=threshold)
+    small = Image.fromarray(threshold.astype(np.uint8))
+    del local_mean, threshold
+
+    mask = a.view(np.bool_)
+    scale = hs / h
+    for y0 in range(0, h, STRIP_ROWS):
+        y1 = min(h, y0 + STRIP_ROWS)
+        # Rows y0:y1 of the threshold map scaled to the full page
+        part = small.resize((w, y1 - y0), Image.Resampling.BILINEAR, box=(0, y0 * scale, ws, y1 * scale))
+        np.greater(a[y0:y1], np.frombuffer(part.tobytes(), dtype=np.uint8).reshape(y1 - y0, w),
+                   out=mask[y0:y1])
+    a *= 255
+    return a
+
+
+def _filter_strip(a: np.ndarray, s: np.ndarray, t: np.ndarray, mask: np.ndarray) -> None:
+    """Sharpen, median and unsharp mask a block of rows in place"""
+    _sharpen(a, s, t)
+    # The spare byte halves of the int16 scratch double as uint8 planes for the median
+    h, w = a.shape
+    su = s.view(np.uint8).reshape(h, 2 * w)
+    tu = t.view(np.uint8).reshape(h, 2 * w)
+    _median3(a, mask.view(np.uint8), su[:, :w], tu[:, :w], su[:, w:], tu[:, w:])
+    _unsharp(a, s, t, mask)
+
+
+def _upscaled_rows(image: Image.Image, size: tuple[int, int], top: int, bottom: int) -> Image.Image:
+    """Rows ``top:bottom`` of ``image`` upscaled to ``size``, without upscaling the whole page"""
+    w, h = size
+    if size == image.size:
+        return image.crop((0, top, w, bottom))
+    # Resampling a source box gives the same rows as resizing the page and cropping
+    scale = image.height / h
+    return image.resize((w, bottom - top), Image.Resampling.LANCZOS, box=(0, top * scale, image.width, bottom * scale))
+
+
+def preprocess_array(image: Image.Image, binarize: bool = False) -> Image.Image:
+    """NumPy preprocessing engine (see module docstring)"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    w, h = _upscaled_size(*image.size)
+    if w < 5 or h < 5:
+        return _upscale(image)
+    # Upscaling keeps the mean, so the source histogram sets the tone table. Pillow's
+    # histogram avoids the intp copy np.bincount would make.
+    counts = np.array(image.histogram(), dtype=np.float64)
+    mean = int(np.dot(counts, np.arange(256)) / counts.sum() + 0.5)
+    lut = _tone_lut(mean)
+
+    # All filters run over strips of rows with enough overlap
+    # that the result matches filtering the whole image, so the scratch
+    # buffers stay about 150 rows tall whatever the upload size.
+    # The source is upscaled and read a strip at a time too: a full upscaled
+    # copy, or np.asarray(image) going through tobytes(), would each cost
+    # another page.
+    out = np.empty((h, w), dtype=np.uint8)
+    rows = STRIP_ROWS + 2 * _HALO
+    strip = np.empty((rows, w), dtype=np.uint8)
+    s = np.empty((rows, w), dtype=np.int16)
+    t = np.empty((rows, w), dtype=np.int16)
+    mask = np.empty((rows, w), dtype=np.bool_)
+    for y0 in range(0, h, STRIP_ROWS):
+        y1 = min(h, y0 + STRIP_ROWS)
+        top, bottom = max(0, y0 - _HALO), min(h, y1 + _HALO)
+        n = bottom - top
+        # Contrast + brightness as one table lookup, applied while copying the strip in. Pillow
+        # indexes with the bytes themselves; np.take would first widen them to an intp array.
+        toned = _upscaled_rows(image, (w, h), top, bottom).point(lut)
+        strip[:n] = np.frombuffer(toned.tobytes(), dtype=np.uint8).reshape(n, w)
+        _filter_strip(strip[:n], s[:n], t[:n], mask[:n])
+        out[y0:y1] = strip[y0 - top:y1 - top]
+    del image, toned, strip, s, t, mask
+
+    if binarize:
+        _sauvola(out)
+    return Image.fromarray(out)
+
+
+def preprocess_region(image: Image.Image, box: tuple[int, int, int, int]) -> Image.Image:
+    """Crop one template region and prepare it on its own, at a fixed card scale"""
+    crop = image.crop(box)
+    scale = REGION_CARD_HEIGHT / image.height
+    size = (max(1, round(crop.width * scale)), max(1, round(crop.height * scale)))
+    if size != crop.size:
+        crop = crop.resize(size, Image.Resampling.LANCZOS)
+    crop = ImageOps.autocontrast(crop, cutoff=1)
+    return crop.filter(ImageFilter.SHARPEN)
+
+
+def preprocess_fast(image: Image.Image) -> Image.Image:
+    """Cheap preparation for the fast tier: downscale and stretch contrast, no filters"""
+    if image.mode != 'L':
+        image = image.convert('L')
+    scale = FAST_MAX_SIDE / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.Resampling.BILINEAR)
+    return ImageOps.autocontrast(image, cutoff=1)
+
+
+def run_preprocess(image: Image.Image, engine: str | None = None) -> Image.Image:
+    engine = engine or PREPROCESS
+    if engine == 'pillow':
+        return preprocess_image(image)
+    if engine == 'numpy':
+        return preprocess_array(image)
+    if engine == 'sauvola':
+        return preprocess_array(image, binarize=True)
+    raise ValueError(f"Unknown preprocessing engine: {engine}")
@@ -0,0 +1,195 @@
+"""Per-request profiling of the OCR path.
+
+A profiled job runs under ``cProfile`` in the worker, and so do the PSM pass
+threads it starts. Their profiles are merged into one ``pstats`` file per
+request. cProfile measures wall time, so waiting on the ``tesseract``
+subprocess (pytesseract) or on libtesseract (tesserocr) shows up as time in
+the pass that waited, and as the job thread's wait for its passes.
+
+Requests are profiled in two ways:
+
+* on demand, when the request carries ``X-OCR-Profile`` set to
+  ``OCR_PROFILE_SECRET``. The response names the artifact in
+  ``X-OCR-Profile-Id``, and ``GET /profiles/{id}`` downloads it with the same
+  header.
+* sampled, for a fraction ``OCR_PROFILE_SAMPLE_RATE`` of computed results,
+  to catch slow images nobody asked about.
+
+Artifacts live in ``OCR_PROFILE_DIR``. The oldest are deleted once they take
+more than ``OCR_PROFILE_MAX_MB``.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger("ocr_service")
+
+PROFILE_DIR = os.getenv('OCR_PROFILE_DIR', '/tmp/ocr-profiles')
+# Empty disables on-demand profiling and the download endpoints
+SECRET = os.getenv('OCR_PROFILE_SECRET', '')
+SAMPLE_RATE = float(os.getenv('OCR_PROFILE_SAMPLE_RATE', '0'))
+MAX_BYTES = int(os.getenv('OCR_PROFILE_MAX_MB', '64')) * 2**20
+
+ON_DEMAND = 'request'
+SAMPLED = 'sampled'
+_ID = re.compile(r'^\d{8}T\d{6}-(request|sampled)-[0-9a-f]{12}$')
+
+# Worker side: profiles of the pass threads started by the job on this thread
+_active = threading.local()
+
+
+def _start() -> cProfile.Profile | None:
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12+ allows one cProfile per interpreter; another request has it
+        return None
+    return profile
+
+
+def run(path: str, fn, *args):
+    """``fn(*args)`` with cProfile on, written to ``path`` with the pass threads it started"""
+    profile = _start()
+    if profile is None:
+        logger.info("Profile %s skipped: another profile is running", path)
+        return fn(*args)
+    _active.profiles = []
+    try:
+        return fn(*args)
+    finally:
+        profile.disable()
+        passes, _active.profiles = _active.profiles, None
+        stats = pstats.Stats(profile)
+        for other in list(passes):
+            stats.add(other)
+        partial = f"{path}.tmp"
+        stats.dump_stats(partial)
+        os.replace(partial, path)
+
+
+def bind(fn):
+    """``fn`` profiled into the current job's profile, for running on another thread"""
+    profiles = getattr(_active, 'profiles', None)
+    if profiles is None:
+        return fn
+
+    def profiled(*args):
+        profile = _start()
+        if profile is None:
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            profiles.append(profile)
+    return profiled
+
+
+class ProfileStore:
+    """Profile artifacts on disk, owned by the API process"""
+
+    def __init__(self, directory: str = PROFILE_DIR, secret: str = SECRET, sample_rate: float = SAMPLE_RATE,
+                 max_bytes: int = MAX_BYTES):
+        self.directory = Path(directory)
+        self.secret = secret
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.max_bytes = max_bytes
+        self.requested = 0
+        self.sampled = 0
+        self.pruned = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ProfileStore':
+        return cls()
+
+    def authorized(self, token: str | None) -> bool:
+        return bool(self.secret) and hmac.compare_digest(token or '', self.secret)
+
+    def _new(self, kind: str) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{kind}-{uuid.uuid4().hex[:12]}"
+
+    def request(self, token: str | None) -> str | None:
+        """A new artifact id when ``token`` asks for a profile; PermissionError when it is wrong"""
+        if token is None:
+            return None
+        if not self.authorized(token):
+            raise PermissionError("Invalid profile token")
+        self.requested += 1
+        return self._new(ON_DEMAND)
+
+    def sample(self) -> str | None:
+        """A new artifact id for the sampled fraction of jobs"""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return self._new(SAMPLED)
+
+    def path(self, profile_id: str) -> Path | None:
+        """Where the artifact goes; None for anything that is not an id this store made"""
+        if not _ID.match(profile_id):
+            return None
+        return self.directory / f"{profile_id}.prof"
+
+    def list(self) -> list[dict]:
+        entries = []
+        for path in sorted(self.directory.glob('*.prof'), reverse=True):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append({'id': path.stem, 'bytes': stat.st_size, 'created_at': stat.st_mtime})
+        return entries
+
+    def text(self, profile_id: str, limit: int = 40) -> str | None:
+        """The top ``limit`` functions by cumulative time, as ``pstats`` prints them"""
+        path = self.path(profile_id)
+        if path is None or not path.exists():
+            return None
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def prune(self, keep: str | None = None) -> None:
+        """Delete the oldest artifacts until the rest fit in ``max_bytes``, sparing ``keep``"""
+        with self._lock:
+            entries = []
+            for path in self.directory.glob('*.prof'):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path.stem == keep:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= size
+                self.pruned += 1
+
+    def stats(self) -> dict:
+        entries = self.list() if self.directory.exists() else []
+        return {
+            'on_demand': bool(self.secret),
+            'sample_rate': self.sample_rate,
+            'requested': self.requested,
+            'sampled': self.sampled,
+            'stored': len(entries),
+            'stored_bytes': sum(entry['bytes'] for entry in entries),
+            'max_bytes': self.max_bytes,
+            'pruned': self.pruned,
+        }
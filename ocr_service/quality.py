@@ -0,0 +1,115 @@
+"""Image quality gate, run on the decoded image before any OCR.
+
+Blurry, glared, washed-out or tiny captures come back from Tesseract as junk
+after the full preprocessing chain and every PSM pass. The gate measures a
+downscaled grayscale copy in a few milliseconds:
+
+- sharpness: variance of the 4-neighbour Laplacian
+- glare: fraction of pixels at 250 or above
+- contrast: spread between the 0.1% and 99.9% intensity percentiles
+- resolution: short side of the decoded image in pixels
+
+The default, ``log``, only reports the verdict next to the OCR result, for
+calibrating the thresholds against real uploads. Once they are calibrated,
+``OCR_QUALITY_GATE=enforce`` rejects a failing image with a "retake photo"
+verdict (HTTP 422). ``off`` skips the gate.
+"""
+import os
+import time
+from dataclasses import asdict, dataclass, field
+import numpy as np
+from PIL import Image
+
+from decode import ImageRejected
+
+MODES = ('off', 'log', 'enforce')
+MODE = os.getenv('OCR_QUALITY_GATE', 'log')
+
+# Long side of the copy the metrics are computed on; sharpness depends on it
+LONG_SIDE = 640
+
+MIN_SHARPNESS = float(os.getenv('OCR_QUALITY_MIN_SHARPNESS', '10'))
+MAX_GLARE = float(os.getenv('OCR_QUALITY_MAX_GLARE', '0.2'))
+MIN_CONTRAST = int(os.getenv('OCR_QUALITY_MIN_CONTRAST', '48'))
+MIN_SIDE = int(os.getenv('OCR_QUALITY_MIN_SIDE', '360'))
+
+GLARE_LEVEL = 250
+# Tails ignored when measuring contrast, so a few stray pixels do not count
+CONTRAST_TAIL = 0.001
+
+
+@dataclass
+class Verdict:
+    ok: bool
+    sharpness: float
+    glare: float
+    contrast: int
+    resolution: int
+    ms: float
+    # 'blurry', 'glare', 'low_contrast', 'low_resolution'
+    reasons: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class QualityRejected(ImageRejected):
+    """The image is readable but too poor to OCR; the user should retake it"""
+
+    def __init__(self, verdict: Verdict):
+        super().__init__(f"Retake photo: {', '.join(verdict.reasons)}", status_code=422)
+        self.verdict = verdict
+
+    def __reduce__(self):
+        return self.__class__, (self.verdict,)
+
+
+def fingerprint() -> str:
+    """Gate settings, for cache keys: they decide whether a result exists at all"""
+    return f"{MODE},{MIN_SHARPNESS},{MAX_GLARE},{MIN_CONTRAST},{MIN_SIDE}"
+
+
+def measure(image: Image.Image) -> Verdict:
+    started = time.perf_counter()
+    scale = min(1.0, LONG_SIDE / max(image.size))
+    small = image if scale == 1.0 else image.resize(
+        (max(3, round(image.width * scale)), max(3, round(image.height * scale))), Image.Resampling.BOX)
+    a = np.asarray(small if small.mode == 'L' else small.convert('L'))
+
+    c = a[1:-1, 1:-1].astype(np.int16)
+    laplacian = 4 * c - a[:-2, 1:-1] - a[2:, 1:-1] - a[1:-1, :-2] - a[1:-1, 2:]
+    cumulative = np.cumsum(np.bincount(a.ravel(), minlength=256))
+    total = cumulative[-1]
+    low = int(np.searchsorted(cumulative, CONTRAST_TAIL * total))
+    high = int(np.searchsorted(cumulative, (1 - CONTRAST_TAIL) * total))
+
+    verdict = Verdict(
+        ok=True,
+        sharpness=round(float(laplacian.var()), 1),
+        glare=round(float(1 - cumulative[GLARE_LEVEL - 1] / total), 4),
+        contrast=high - low,
+        resolution=min(image.size),
+        ms=0.0,
+    )
+    if verdict.sharpness < MIN_SHARPNESS:
+        verdict.reasons.append('blurry')
+    if verdict.glare > MAX_GLARE:
+        verdict.reasons.append('glare')
+    if verdict.contrast < MIN_CONTRAST:
+        verdict.reasons.append('low_contrast')
+    if verdict.resolution < MIN_SIDE:
+        verdict.reasons.append('low_resolution')
+    verdict.ok = not verdict.reasons
+    verdict.ms = round((time.perf_counter() - started) * 1000, 2)
+    return verdict
+
+
+def check(image: Image.Image, mode: str | None = None) -> Verdict | None:
+    """Measure ``image`` and raise QualityRejected when the gate enforces and it fails"""
+    mode = mode or MODE
+    if mode == 'off':
+        return None
+    verdict = measure(image)
+    if mode == 'enforce' and not verdict.ok:
+        raise QualityRejected(verdict)
+    return verdict
@@ -0,0 +1,242 @@
+"""Card detection and perspective rectification.
+
+Camera captures arrive with background, skew and rotation. This finds the
+card in a small grayscale copy of the image and warps it to a canonical
+card-sized raster, so OCR (and any later model) only sees the card.
+
+Detection runs on an image of at most ``DETECT_LONG_SIDE`` pixels:
+
+1. Otsu threshold, taking the class that is rare along the image border as
+   the card, then a small morphological opening to drop specks.
+2. Rough corners from the extremes of ``x + y`` and ``x - y`` over the mask.
+3. Each side is refined by a least-squares line through the mask's outline
+   pixels near it; the corners are the intersections of adjacent lines, so
+   rounded card corners do not pull them inward.
+
+The quadrilateral has to cover ``MIN_AREA`` of the frame, have an ID card's
+aspect ratio and be mostly filled by the mask, otherwise the image is passed
+through untouched. Portrait cards are turned landscape, and a card whose
+bottom band carries clearly more ink than its top band (the header is the
+densest band on both card types) is turned 180 degrees.
+"""
+import os
+import time
+from dataclasses import dataclass
+import numpy as np
+from PIL import Image
+
+from templates import CARD_ASPECT
+
+RECTIFY = os.getenv('OCR_RECTIFY', '0') == '1'
+
+DETECT_LONG_SIDE = 320
+# ID-1 at 300 dpi, the size templates and the benchmark cards are drawn at
+OUTPUT_SIZE = (1012, 638)
+
+MIN_AREA = float(os.getenv('OCR_RECTIFY_MIN_AREA', '0.15'))
+ASPECT_TOLERANCE = 0.2
+# Area inside the mask's row spans over quadrilateral area; a card is a solid blob
+MIN_FILL = 0.85
+MAX_FILL = 1.15
+# Share of the border the card class may touch before the frame counts as the card itself
+MAX_BORDER_SHARE = 0.25
+# Bottom/top ink ratio above which the card is taken to be upside down
+FLIP_RATIO = 1.3
+
+
+@dataclass
+class Rectified:
+    image: Image.Image
+    found: bool
+    # Clockwise degrees the card was turned after warping
+    rotation: int = 0
+    # TL, TR, BR, BL in input pixel coordinates
+    corners: list[tuple[float, float]] | None = None
+    seconds: float = 0.0
+
+    def info(self) -> dict:
+        return {'found': self.found, 'rotation': self.rotation, 'ms': round(self.seconds * 1000, 2)}
+
+
+def _otsu(a: np.ndarray) -> int:
+    hist = np.bincount(a.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    total = weight[-1]
+    mean = np.cumsum(hist * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mean[-1] * weight - mean * total) ** 2 / (weight * (total - weight))
+    between[~np.isfinite(between)] = 0
+    return int(between.argmax())
+
+
+def _shift_all(mask: np.ndarray, radius: int, reduce) -> np.ndarray:
+    """Erosion (np.logical_and) or dilation (np.logical_or) with a square of ``radius``"""
+    padded = np.pad(mask, radius, constant_values=reduce is np.logical_and)
+    h, w = mask.shape
+    out = mask.copy()
+    for dy in range(2 * radius + 1):
+        for dx in range(2 * radius + 1):
+            reduce(out, padded[dy:dy + h, dx:dx + w], out=out)
+    return out
+
+
+def _card_mask(a: np.ndarray) -> np.ndarray | None:
+    mask = a > _otsu(a)
+    border = np.concatenate([mask[0], mask[-1], mask[:, 0], mask[:, -1]])
+    if border.mean() > 0.5:
+        mask = ~mask
+        border = ~border
+    if border.mean() > MAX_BORDER_SHARE:
+        return None
+    return _shift_all(_shift_all(mask, 2, np.logical_and), 2, np.logical_or)
+
+
+def _fit_line(points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Centroid and unit direction of the total least-squares line through ``points``"""
+    centroid = points.mean(axis=0)
+    _, _, vt = np.linalg.svd(points - centroid, full_matrices=False)
+    return centroid, vt[0]
+
+
+def _intersect(p1, d1, p2, d2) -> np.ndarray | None:
+    m = np.array([d1, -d2]).T
+    if abs(np.linalg.det(m)) < 1e-6:
+        return None
+    t = np.linalg.solve(m, p2 - p1)
+    return p1 + t[0] * d1
+
+
+def _refine(corners: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Replace each corner by the intersection of lines fitted to the two sides meeting there"""
+    lines = []
+    for i in range(4):
+        a, b = corners[i], corners[(i + 1) % 4]
+        side = b - a
+        length = np.hypot(*side)
+        if length < 8:
+            return corners
+        normal = np.array([-side[1], side[0]]) / length
+        t = (edges - a) @ side / length ** 2
+        near = (np.abs((edges - a) @ normal) < max(3.0, 0.04 * length)) & (t > 0.15) & (t < 0.85)
+        if near.sum() < 10:
+            return corners
+        lines.append(_fit_line(edges[near]))
+    refined = []
+    for i in range(4):
+        point = _intersect(*lines[i - 1], *lines[i])
+        if point is None:
+            return corners
+        refined.append(point)
+    return np.array(refined)
+
+
+def _spans(mask: np.ndarray, axis: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Indices of the rows (axis=1) or columns (axis=0) holding mask pixels, and their first and last"""
+    lines = mask if axis == 1 else mask.T
+    index = np.nonzero(lines.any(axis=1))[0]
+    first = lines[index].argmax(axis=1)
+    last = lines.shape[1] - 1 - lines[index, ::-1].argmax(axis=1)
+    return index, first, last
+
+
+def _outline(mask: np.ndarray) -> np.ndarray:
+    """(x, y) of the outermost mask pixels seen from each side.
+
+    Unlike the full edge of the mask this leaves out holes, such as a dark
+    header band close to the card's top edge, which would bend the side fits.
+    """
+    ys, left, right = _spans(mask, 1)
+    xs, top, bottom = _spans(mask, 0)
+    return np.concatenate([
+        np.column_stack([left, ys]), np.column_stack([right, ys]),
+        np.column_stack([xs, top]), np.column_stack([xs, bottom]),
+    ]).astype(np.float64)
+
+
+def _area(quad: np.ndarray) -> float:
+    x, y = quad[:, 0], quad[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def detect(image: Image.Image) -> list[tuple[float, float]] | None:
+    """Card corners (TL, TR, BR, BL) in ``image`` pixel coordinates, or None"""
+    scale = min(1.0, DETECT_LONG_SIDE / max(image.size))
+    small = image if scale == 1.0 else image.resize(
+        (max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.Resampling.BOX)
+    a = np.asarray(small.convert('L') if small.mode != 'L' else small)
+    mask = _card_mask(a)
+    if mask is None or not mask.any():
+        return None
+
+    ys, xs = np.nonzero(mask)
+    s, d = xs + ys, xs - ys
+    corners = np.array([
+        (xs[s.argmin()], ys[s.argmin()]),
+        (xs[d.argmax()], ys[d.argmax()]),
+        (xs[s.argmax()], ys[s.argmax()]),
+        (xs[d.argmin()], ys[d.argmin()]),
+    ], dtype=np.float64)
+    corners = _refine(corners, _outline(mask))
+
+    area = _area(corners)
+    # Printed text leaves holes in the mask; the blob is measured with them filled
+    _, left, right = _spans(mask, 1)
+    if area < MIN_AREA * mask.size or not MIN_FILL <= (right - left + 1).sum() / area <= MAX_FILL:
+        return None
+    width = (np.hypot(*(corners[1] - corners[0])) + np.hypot(*(corners[2] - corners[3]))) / 2
+    height = (np.hypot(*(corners[3] - corners[0])) + np.hypot(*(corners[2] - corners[1]))) / 2
+    aspect = max(width, height) / max(min(width, height), 1.0)
+    if abs(aspect - CARD_ASPECT) > ASPECT_TOLERANCE * CARD_ASPECT:
+        return None
+    return [(float(x) / scale, float(y) / scale) for x, y in corners]
+
+
+def _perspective_coeffs(source: list[tuple[float, float]], size: tuple[int, int]) -> list[float]:
+    """Pillow PERSPECTIVE data mapping the output rectangle onto ``source`` (TL, TR, BR, BL)"""
+    w, h = size
+    target = [(0, 0), (w, 0), (w, h), (0, h)]
+    rows, rhs = [], []
+    for (x, y), (u, v) in zip(target, source):
+        rows.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        rows.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+        rhs += [u, v]
+    return np.linalg.solve(np.array(rows, dtype=np.float64), np.array(rhs, dtype=np.float64)).tolist()
+
+
+def _upside_down(card: Image.Image) -> bool:
+    a = np.asarray(card.reduce(4))
+    ink = a < _otsu(a)
+    band = max(1, ink.shape[0] // 4)
+    top, bottom = ink[:band].mean(), ink[-band:].mean()
+    return bottom > top * FLIP_RATIO
+
+
+def warp(image: Image.Image, corners: list[tuple[float, float]],
+         rotation: int | None = None) -> tuple[Image.Image, int]:
+    """Warp the card at ``corners`` to OUTPUT_SIZE, upright. Returns the card and the rotation applied.
+
+    Pass the ``rotation`` an earlier call chose to warp another copy of the
+    same image (say, color after grayscale) identically.
+    """
+    tl, tr, br, bl = corners
+    source = corners
+    portrait = np.hypot(bl[0] - tl[0], bl[1] - tl[1]) > np.hypot(tr[0] - tl[0], tr[1] - tl[1])
+    if portrait:
+        # Start from the bottom-left corner so the long side runs across
+        source = [bl, tl, tr, br]
+    card = image.transform(OUTPUT_SIZE, Image.Transform.PERSPECTIVE,
+                           _perspective_coeffs(source, OUTPUT_SIZE), Image.Resampling.BILINEAR)
+    flip = _upside_down(card) if rotation is None else rotation >= 180
+    if flip:
+        card = card.transpose(Image.Transpose.ROTATE_180)
+    return card, (90 if portrait else 0) + (180 if flip else 0)
+
+
+def rectify(image: Image.Image) -> Rectified:
+    """Crop and warp the card to OUTPUT_SIZE, or return ``image`` unchanged when no card is found"""
+    started = time.perf_counter()
+    corners = detect(image)
+    if corners is None:
+        return Rectified(image, False, seconds=time.perf_counter() - started)
+    card, rotation = warp(image, corners)
+    return Rectified(card, True, rotation, corners, time.perf_counter() - started)
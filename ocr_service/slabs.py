@@ -0,0 +1,284 @@
+"""Shared-memory handoff of uploads and decoded images to worker processes.
+
+With ``OCR_EXECUTOR=process``, arguments to a pool job are pickled into a
+pipe and unpickled by the worker. For an upload or a decoded grayscale page
+that is several MB serialized, pushed through the pipe and rebuilt on every
+request. Instead, ``SlabPool.share`` copies each large argument into a
+``multiprocessing.shared_memory`` segment (a slab) and sends the worker a
+``SlabRef`` descriptor of a few dozen bytes. The worker maps the slab and works on it in place: uploads are
+read through a ``memoryview`` and images are wrapped without a copy.
+
+A job can also write its result into a slab: ``SlabPool.output`` leases one
+for the caller to pass along as a ``SlabOut``, the worker ``store``s images
+into it and returns their ``SlabRef``s, and those refs can be handed straight
+to the next job without the pixels crossing the pipe in either direction.
+
+Slabs come in power-of-two size classes. A slab goes back to its free list
+when the job returns, and workers keep their mappings, so a steady stream of
+requests reuses the same few segments without new ``mmap`` calls. A job that
+was abandoned (deadline, disconnect) may still be reading its slab, so that
+slab is unlinked instead of reused. Once ``OCR_SLAB_POOL_MB`` is allocated,
+further arguments fall back to pickling.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from PIL import Image
+
+logger = logging.getLogger("ocr_service")
+
+POOL_BYTES = int(os.getenv('OCR_SLAB_POOL_MB', '256')) * 2**20
+# Smaller arguments are cheaper to pickle than to place in a slab
+MIN_SHARE_BYTES = int(os.getenv('OCR_SLAB_MIN_KB', '64')) * 1024
+MIN_SLAB_BYTES = 256 * 1024
+# Mappings each worker process keeps open
+WORKER_MAPPINGS = 32
+
+
+@dataclass(frozen=True)
+class SlabRef:
+    """What a worker receives instead of the bytes or the image"""
+    name: str
+    nbytes: int
+    # Set for images: PIL mode and (width, height)
+    mode: str | None = None
+    size: tuple[int, int] | None = None
+    offset: int = 0
+
+
+@dataclass(frozen=True)
+class SlabOut:
+    """A leased slab a worker writes its result into"""
+    name: str
+    nbytes: int
+
+
+def _size_class(nbytes: int) -> int:
+    return max(MIN_SLAB_BYTES, 1 << (nbytes - 1).bit_length())
+
+
+class SlabPool:
+    """Slabs owned by the API process"""
+
+    def __init__(self, max_bytes: int = POOL_BYTES, min_share: int = MIN_SHARE_BYTES):
+        self.max_bytes = max(0, max_bytes)
+        self.min_share = min_share
+        self.allocated = 0
+        self._free: dict[int, list[shared_memory.SharedMemory]] = {}
+        self._lock = threading.Lock()
+        self.leased = 0
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.fallbacks = 0
+        self.shared_bytes = 0
+        self.outputs = 0
+        # Output slabs by name while their block runs, so the caller can read them back
+        self._output_slabs: dict[str, shared_memory.SharedMemory] = {}
+
+    @classmethod
+    def from_env(cls, process: bool) -> 'SlabPool':
+        """Slabs only help process workers; worker threads already share the arguments"""
+        return cls(POOL_BYTES if process else 0)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _acquire(self, nbytes: int) -> shared_memory.SharedMemory | None:
+        size = _size_class(nbytes)
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self.reused += 1
+                self.leased += 1
+                return free.pop()
+            if self.allocated + size > self.max_bytes:
+                self.fallbacks += 1
+                return None
+            self.allocated += size
+            self.created += 1
+            self.leased += 1
+        try:
+            return shared_memory.SharedMemory(create=True, size=size)
+        except OSError:
+            logger.exception("Could not create a %d byte shared memory slab", size)
+            with self._lock:
+                self.allocated -= size
+                self.leased -= 1
+                self.fallbacks += 1
+            return None
+
+    def _release(self, slab: shared_memory.SharedMemory, reuse: bool) -> None:
+        with self._lock:
+            self.leased -= 1
+            if reuse:
+                self._free.setdefault(slab.size, []).append(slab)
+                return
+            self.allocated -= slab.size
+            self.discarded += 1
+        slab.close()
+        slab.unlink()
+
+    def _place(self, value) -> tuple[object, shared_memory.SharedMemory | None]:
+        """``value`` as a SlabRef in a fresh slab, or unchanged"""
+        if isinstance(value, (bytes, bytearray)) and len(value) >= self.min_share:
+            slab = self._acquire(len(value))
+            if slab is None:
+                return value, None
+            slab.buf[:len(value)] = value
+            return SlabRef(slab.name, len(value)), slab
+        if isinstance(value, Image.Image) and value.mode in ('L', 'RGB'):
+            data = value.tobytes()
+            if len(data) < self.min_share:
+                return value, None
+            slab = self._acquire(len(data))
+            if slab is None:
+                return value, None
+            slab.buf[:len(data)] = data
+            return SlabRef(slab.name, len(data), value.mode, value.size), slab
+        return value, None
+
+    @contextmanager
+    def share(self, fn, args: tuple):
+        """Yield ``(fn, args)`` to submit to the pool, with large arguments moved into slabs.
+
+        The slabs are recycled when the block exits normally and discarded
+        when it raises (or is cancelled), since the worker may still use them.
+        """
+        if not self.enabled:
+            yield fn, args
+            return
+        placed = [self._place(arg) for arg in args]
+        slabs = [slab for _, slab in placed if slab is not None]
+        if not slabs:
+            # Refs a worker stored earlier still need mapping back
+            yield (call, (fn, *args)) if any(isinstance(arg, SlabRef) for arg in args) else (fn, args)
+            return
+        self.shared_bytes += sum(ref.nbytes for ref, slab in placed if slab is not None)
+        ok = False
+        try:
+            yield call, (fn, *(arg for arg, _ in placed))
+            ok = True
+        finally:
+            for slab in slabs:
+                self._release(slab, reuse=ok)
+
+    @contextmanager
+    def output(self, nbytes: int):
+        """Yield a SlabOut of ``nbytes`` for a worker to store into, or None to fall back to pickling.
+
+        Refs stored into it stay valid until the block exits; the slab is then
+        recycled, or discarded when the block raises, like ``share``.
+        """
+        slab = self._acquire(nbytes) if self.enabled else None
+        if slab is None:
+            yield None
+            return
+        self.outputs += 1
+        self._output_slabs[slab.name] = slab
+        ok = False
+        try:
+            yield SlabOut(slab.name, nbytes)
+            ok = True
+        finally:
+            del self._output_slabs[slab.name]
+            self._release(slab, reuse=ok)
+
+    def image(self, ref: SlabRef) -> Image.Image:
+        """A copy of an image a worker stored in one of this pool's output slabs"""
+        view = self._output_slabs[ref.name].buf[ref.offset:ref.offset + ref.nbytes]
+        try:
+            return Image.frombytes(ref.mode, ref.size, view)
+        finally:
+            # A live export would keep the slab from being closed
+            view.release()
+
+    def close(self) -> None:
+        with self._lock:
+            free, self._free = self._free, {}
+        for slabs in free.values():
+            for slab in slabs:
+                slab.close()
+                slab.unlink()
+
+    def stats(self) -> dict:
+        return {
+            'max_bytes': self.max_bytes,
+            'allocated_bytes': self.allocated,
+            'free_slabs': sum(len(slabs) for slabs in self._free.values()),
+            'leased': self.leased,
+            'created': self.created,
+            'reused': self.reused,
+            'discarded': self.discarded,
+            'fallbacks': self.fallbacks,
+            'shared_bytes': self.shared_bytes,
+            'outputs': self.outputs,
+        }
+
+
+# Worker side: mappings by slab name, most recently used last
+_mappings: OrderedDict[str, shared_memory.SharedMemory] = OrderedDict()
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Map a segment the API process owns, without taking ownership of it.
+
+    Attaching would register it with the resource tracker, which unlinks it
+    when the worker exits (Python < 3.13 has no track=False), so
+    registration is skipped for the attach.
+    """
+    register, resource_tracker.register = resource_tracker.register, lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    slab = _mappings.get(name)
+    if slab is not None:
+        _mappings.move_to_end(name)
+        return slab
+    slab = attach(name)
+    _mappings[name] = slab
+    while len(_mappings) > WORKER_MAPPINGS:
+        _, old = _mappings.popitem(last=False)
+        try:
+            old.close()
+        except BufferError:
+            # An image from an earlier job still points into it; the mapping goes when that does
+            pass
+    return slab
+
+
+def load(ref: SlabRef):
+    """The upload as a memoryview, or the image, backed by the slab without copying"""
+    buf = _attach(ref.name).buf[ref.offset:ref.offset + ref.nbytes]
+    if ref.mode is None:
+        return buf
+    return Image.frombuffer(ref.mode, ref.size, buf, 'raw', ref.mode, 0, 1)
+
+
+def store(out: SlabOut | None, image: Image.Image, offset: int = 0) -> SlabRef | Image.Image:
+    """Worker side: ``image`` written into ``out`` at ``offset``, as its SlabRef.
+
+    Returns ``image`` itself, to be pickled back, without an output slab or
+    when it does not fit.
+    """
+    if out is None or image.mode not in ('L', 'RGB'):
+        return image
+    data = image.tobytes()
+    if offset + len(data) > out.nbytes:
+        return image
+    _attach(out.name).buf[offset:offset + len(data)] = data
+    return SlabRef(out.name, len(data), image.mode, image.size, offset)
+
+
+def call(fn, *args):
+    """Run ``fn`` in a worker with every SlabRef argument mapped back"""
+    return fn(*(load(arg) if isinstance(arg, SlabRef) else arg for arg in args))
@@ -0,0 +1,51 @@
+"""Supabase Storage downloads for images referenced by path.
+
+Uses the Storage REST API with the service role key, the same bucket the edge
+worker reads from (``id-uploads``).
+"""
+import asyncio
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+SUPABASE_URL = os.getenv('SUPABASE_URL', '').rstrip('/')
+SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY', '')
+BUCKET = os.getenv('OCR_STORAGE_BUCKET', 'id-uploads')
+TIMEOUT_SECONDS = float(os.getenv('OCR_STORAGE_TIMEOUT', '30'))
+
+
+class StorageError(Exception):
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def configured() -> bool:
+    return bool(SUPABASE_URL and SERVICE_ROLE_KEY)
+
+
+def download(path: str, max_bytes: int) -> bytes:
+    """Blocking download of ``path`` from the bucket, refusing bodies over ``max_bytes``"""
+    if not configured():
+        raise StorageError("Storage is not configured (SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY)", 503)
+    url = f"{SUPABASE_URL}/storage/v1/object/{BUCKET}/{urllib.parse.quote(path.lstrip('/'))}"
+    request = urllib.request.Request(url, headers={
+        'Authorization': f"Bearer {SERVICE_ROLE_KEY}",
+        'apikey': SERVICE_ROLE_KEY,
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT_SECONDS) as response:
+            body = response.read(max_bytes + 1)
+    except urllib.error.HTTPError as exc:
+        status = 404 if exc.code in (400, 404) else 502
+        raise StorageError(f"Storage download failed for {path}: HTTP {exc.code}", status) from exc
+    except (urllib.error.URLError, TimeoutError) as exc:
+        raise StorageError(f"Storage download failed for {path}: {exc}") from exc
+    if len(body) > max_bytes:
+        raise StorageError(f"{path} is larger than {max_bytes} bytes", 413)
+    return body
+
+
+async def fetch(path: str, max_bytes: int) -> bytes:
+    return await asyncio.to_thread(download, path, max_bytes)
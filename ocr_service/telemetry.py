@@ -0,0 +1,89 @@
+"""What the OCR service exports on ``/metrics`` and in ``Server-Timing``.
+
+Workers time their own stages and return them with the result
+(``OCROutput.timings_ms``), so the same numbers feed the histograms here and
+the ``Server-Timing`` header, whichever executor ran the job. The API process
+adds what only it sees: the wait for a worker and the handoff (``queue``),
+and the whole request (``total``). Gauges are read from the pool and the other components
+when Prometheus scrapes, so they cost nothing between scrapes.
+"""
+from cache import MISS
+from metrics import Registry
+
+# Milliseconds, like the rest of the service's histograms
+STAGE_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+REQUEST_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+UPLOAD_BUCKETS_BYTES = tuple(2**20 * mb for mb in (0.0625, 0.25, 0.5, 1, 2, 4, 8, 16, 32))
+MEGAPIXEL_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 12, 16, 24, 50)
+
+# Reasons a request fails, as the ``cause`` label
+FAILURE_CAUSES = ('pool_full', 'quality_rejected', 'image_rejected', 'storage', 'disconnected', 'error')
+
+# Order of the stages in Server-Timing; PSM passes ('psm6', ...) sort in between
+_TIMING_ORDER = ('queue', 'decode', 'quality', 'rectify', 'regions', 'preprocess', 'psm', 'fallback', 'select',
+                 'extract', 'worker', 'classify', 'total')
+
+
+def _order(stage: str) -> int:
+    prefix = 'psm' if stage.startswith('psm') else stage
+    return _TIMING_ORDER.index(prefix) if prefix in _TIMING_ORDER else len(_TIMING_ORDER)
+
+
+class OCRMetrics:
+    def __init__(self, registry: Registry | None = None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.requests_ms = r.histogram('ocr_request_ms', 'Wall time of OCR requests in the API process',
+                                       REQUEST_BUCKETS_MS, ('endpoint',))
+        self.stage_ms = r.histogram('ocr_stage_ms', 'Time per pipeline stage of computed (uncached) results',
+                                    STAGE_BUCKETS_MS, ('stage',))
+        self.pass_ms = r.histogram('ocr_pass_ms', 'Time per Tesseract pass', STAGE_BUCKETS_MS, ('psm',))
+        self.upload_bytes = r.histogram('ocr_upload_bytes', 'Size of uploaded images', UPLOAD_BUCKETS_BYTES)
+        self.megapixels = r.histogram('ocr_image_megapixels', 'Pixel count of uploaded images (from the header)',
+                                      MEGAPIXEL_BUCKETS)
+        self.results = r.counter('ocr_results_total', 'Results served, by cache status and quality tier',
+                                 ('cache', 'tier'))
+        self.winning_psm = r.counter('ocr_winning_psm_total', 'Computed results by the pass whose text was kept',
+                                     ('psm',))
+        self.truncated = r.counter('ocr_truncated_total', 'Results cut short by their deadline')
+        self.failures = r.counter('ocr_failures_total', 'Failed requests by cause', ('cause',))
+        for cause in FAILURE_CAUSES:
+            self.failures.inc(0, cause=cause)
+
+    def image(self, nbytes: int, pixels: int | None) -> None:
+        self.upload_bytes.observe(nbytes)
+        if pixels:
+            self.megapixels.observe(pixels / 1e6)
+
+    def computed(self, result: dict) -> None:
+        """A result that just came back from a worker"""
+        for stage, ms in (result.get('timings_ms') or {}).items():
+            if stage.startswith('psm'):
+                self.pass_ms.observe(ms, psm=stage[3:])
+            else:
+                self.stage_ms.observe(ms, stage=stage)
+        if result.get('truncated'):
+            self.truncated.inc()
+        psm = result.get('psm')
+        self.winning_psm.inc(psm=psm if psm is not None else 'template' if result.get('template') else 'none')
+
+    def served(self, endpoint: str, result: dict, cache_status: str, ms: float) -> None:
+        self.results.inc(cache=cache_status, tier=result.get('tier') or 'none')
+        self.requests_ms.observe(ms, endpoint=endpoint)
+
+    def failure(self, cause: str) -> None:
+        self.failures.inc(cause=cause)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def server_timing(result: dict, cache_status: str, total_ms: float, extra: dict | None = None) -> str:
+    """``Server-Timing`` value: every stage of a computed result, or the cache status and total for a hit"""
+    timings = dict(extra or {})
+    if cache_status == MISS:
+        timings.update(result.get('timings_ms') or {})
+    timings['total'] = total_ms
+    entries = [f'cache;desc="{cache_status}"']
+    entries += [f"{stage};dur={ms:g}" for stage, ms in sorted(timings.items(), key=lambda item: _order(item[0]))]
+    return ', '.join(entries)
@@ -0,0 +1,108 @@
+"""Card layout templates for region-of-interest OCR.
+
+Each template maps field names to boxes in normalized card coordinates
+(x0, y0, x1, y1 as fractions of width and height), with a character
+whitelist and page segmentation mode per box. Only the boxes are sent to
+Tesseract, in parallel, instead of the whole card three times.
+
+A template is trusted only when the image has the card's aspect ratio, the
+header box contains one of the template's keywords and the required fields
+validate. Otherwise the caller falls back to full-page OCR.
+
+The v1 boxes are measured on the Pasig City cards in ``ml/data/images``
+(one genuine sample of each layout), so template OCR is experimental: check
+them against more scans before turning it on by default. The synthetic
+benchmark cards do not follow these layouts.
+"""
+from dataclasses import dataclass
+
+DIGITS = '0123456789'
+UPPER = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+NAME_CHARS = UPPER + UPPER.lower() + 'Ññ.,-'
+DATE_CHARS = DIGITS + '/-' + UPPER + UPPER.lower() + ','
+ID_CHARS = UPPER + DIGITS + '-'
+
+# PSM 7: treat the crop as a single text line
+SINGLE_LINE = 7
+SINGLE_BLOCK = 6
+
+# ID-1 cards are 85.60 x 53.98 mm
+CARD_ASPECT = 85.60 / 53.98
+
+
+@dataclass(frozen=True)
+class Box:
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    whitelist: str | None = None
+    psm: int = SINGLE_LINE
+
+    def pixels(self, width: int, height: int) -> tuple[int, int, int, int]:
+        return (round(self.x0 * width), round(self.y0 * height),
+                round(self.x1 * width), round(self.y1 * height))
+
+
+@dataclass(frozen=True)
+class Template:
+    id_type: str
+    version: str
+    header: Box
+    keywords: tuple[str, ...]
+    fields: dict
+    required: tuple[str, ...] = ('id_number', 'holder_name')
+    aspect: float = CARD_ASPECT
+    aspect_tolerance: float = 0.12
+
+    @property
+    def key(self) -> str:
+        return f"{self.id_type}/{self.version}"
+
+    def matches_shape(self, width: int, height: int) -> bool:
+        aspect = max(width, height) / min(width, height)
+        return abs(aspect - self.aspect) <= self.aspect_tolerance * self.aspect
+
+
+# Pasig OSCA card: values right of the printed labels, dates side by side
+# above their captions. It is squarer than ID-1 (421 x 304 sample).
+_SENIOR_V1_ASPECT = 421 / 304
+_SENIOR_V1_HEADER = Box(0.19, 0.02, 0.82, 0.26, psm=SINGLE_BLOCK)
+_SENIOR_V1_FIELDS = {
+    'id_number': Box(0.20, 0.27, 0.48, 0.35, ID_CHARS),
+    'holder_name': Box(0.17, 0.35, 0.74, 0.43, NAME_CHARS),
+    'date_of_birth': Box(0.17, 0.61, 0.48, 0.69, DATE_CHARS),
+    'date_of_issue': Box(0.57, 0.61, 0.86, 0.69, DATE_CHARS),
+}
+
+# Pasig PWD card: values above their captions and no dates. The top header
+# names only the municipality, so the disability line is what identifies it.
+_PWD_V1_HEADER = Box(0.05, 0.49, 0.72, 0.64, psm=SINGLE_BLOCK)
+_PWD_V1_FIELDS = {
+    'holder_name': Box(0.05, 0.30, 0.70, 0.40, NAME_CHARS),
+    'id_number': Box(0.73, 0.66, 0.97, 0.73, ID_CHARS),
+}
+
+TEMPLATES = {
+    t.key: t for t in (
+        Template('senior_citizen', 'v1', _SENIOR_V1_HEADER, ('SENIOR', 'CITIZEN', 'OSCA'), _SENIOR_V1_FIELDS,
+                 aspect=_SENIOR_V1_ASPECT),
+        Template('pwd', 'v1', _PWD_V1_HEADER, ('PWD', 'DISABILITY', 'DISABILITIES'), _PWD_V1_FIELDS),
+    )
+}
+
+
+def get(key: str) -> Template:
+    try:
+        return TEMPLATES[key]
+    except KeyError:
+        raise ValueError(f"Unknown template: {key}") from None
+
+
+def match_header(header_text: str, candidates: list[Template]) -> Template | None:
+    """First template whose keywords appear in the OCR'd header"""
+    text = header_text.upper()
+    for template in candidates:
+        if any(keyword in text for keyword in template.keywords):
+            return template
+    return None
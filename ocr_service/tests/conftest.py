@@ -0,0 +1,106 @@
+"""Test setup: the service modules import flat from ocr_service/, and a fake
+pytesseract stands in for the tesseract binary, so the suite runs without it.
+
+Settings are read when the modules are imported, so they are fixed here first.
+"""
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVICE_DIR))
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix='ocr-tests-'))
+INGEST_SECRET = 'test-ingest-secret'
+
+os.environ.update({
+    'OCR_ENGINE': 'pytesseract',
+    'OCR_EXECUTOR': 'thread',
+    'OCR_WORKERS': '2',
+    'OCR_WARMUP': 'off',
+    'OCR_QUALITY_GATE': 'off',
+    'OCR_INGEST_SECRET': INGEST_SECRET,
+    'OCR_JOBS_DB': str(TMP_DIR / 'jobs.db'),
+    'OCR_JOBS_MAX_ATTEMPTS': '1',
+    'OCR_WORKER_FILES_DIR': str(TMP_DIR),
+    'OCR_PROFILE_DIR': str(TMP_DIR / 'profiles'),
+})
+os.environ.pop('OCR_CACHE_DIR', None)
+
+import pytesseract  # noqa: E402
+
+CARD_TEXT = ("REPUBLIC OF THE PHILIPPINES\nOffice of Senior Citizens Affairs\nName: JUAN DELA CRUZ\n"
+             "ID No.: SC-2025-104392\nDate of Birth: 1959-11-15")
+
+
+class FakeTesseract:
+    """Answers pytesseract calls with ``texts[psm]`` or ``text``, after ``delays[psm]`` seconds.
+
+    A pass slower than its timeout fails the way pytesseract does when it
+    kills tesseract: a bare RuntimeError.
+    """
+
+    def __init__(self):
+        self.text = CARD_TEXT
+        self.texts: dict[int, str] = {}
+        self.confidence = 90.0
+        self.delays: dict[int, float] = {}
+        self.calls: list[int] = []
+        self._lock = threading.Lock()
+
+    def _run(self, config: str, timeout: float) -> str:
+        match = re.search(r'--psm (\d+)', config)
+        psm = int(match.group(1)) if match else 3
+        with self._lock:
+            self.calls.append(psm)
+        delay = self.delays.get(psm, 0)
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise RuntimeError('Tesseract process timeout')
+        time.sleep(delay)
+        return self.texts.get(psm, self.text)
+
+    def image_to_string(self, image, lang=None, config='', timeout=0, **kwargs):
+        return self._run(config, timeout)
+
+    def image_to_data(self, image, lang=None, config='', timeout=0, output_type=None, **kwargs):
+        words = self._run(config, timeout).split()
+        return {
+            'text': words,
+            'conf': [self.confidence] * len(words),
+            'block_num': [1] * len(words),
+            'par_num': [1] * len(words),
+            'line_num': list(range(len(words))),
+            'word_num': [1] * len(words),
+        }
+
+
+def install(monkeypatch: pytest.MonkeyPatch) -> FakeTesseract:
+    fake = FakeTesseract()
+    monkeypatch.setattr(pytesseract, 'image_to_string', fake.image_to_string)
+    monkeypatch.setattr(pytesseract, 'image_to_data', fake.image_to_data)
+    monkeypatch.setattr(pytesseract, 'get_tesseract_version', lambda: '5.3.0')
+    return fake
+
+
+@pytest.fixture
+def tesseract(monkeypatch) -> FakeTesseract:
+    return install(monkeypatch)
+
+
+@pytest.fixture(scope='module')
+def client():
+    """The app, started with its job runner, on the fake tesseract"""
+    from fastapi.testclient import TestClient
+
+    import app
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        install(monkeypatch)
+        with TestClient(app.app) as client:
+            yield client
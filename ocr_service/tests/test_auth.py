@@ -0,0 +1,93 @@
+"""Ingest, job and event stream credentials (OCR_INGEST_SECRET)"""
+import hashlib
+import secrets
+import time
+import uuid
+
+import pytest
+from PIL import Image
+
+import app
+from conftest import INGEST_SECRET, TMP_DIR
+
+BEARER = {'Authorization': f"Bearer {INGEST_SECRET}"}
+
+
+@pytest.fixture(scope='module')
+def card_path() -> str:
+    Image.new('RGB', (800, 500), 'white').save(TMP_DIR / 'card.png')
+    return 'card.png'
+
+
+def ingest(client, card_path: str, **record) -> str:
+    id = f"verification-{uuid.uuid4()}"
+    response = client.post('/ingest', json={'id': id, 'file_path': card_path, **record}, headers=BEARER)
+    assert response.status_code == 202
+    return id
+
+
+def wait_finished(client, id: str) -> dict:
+    for _ in range(200):
+        job = client.get(f"/jobs/{id}", headers=BEARER).json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {id} did not finish")
+
+
+def test_ingest_needs_the_secret(client, card_path):
+    body = {'id': 'verification-x', 'file_path': card_path}
+    assert client.post('/ingest', json=body).status_code == 401
+    assert client.post('/ingest', json=body, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+
+def test_unset_secret_fails_closed(client, card_path, monkeypatch):
+    monkeypatch.setattr(app, 'INGEST_SECRET', '')
+    body = {'id': 'verification-x', 'file_path': card_path}
+    assert client.post('/ingest', json=body).status_code == 503
+    # An empty bearer must not match the empty secret
+    assert client.post('/ingest', json=body, headers={'Authorization': 'Bearer '}).status_code == 503
+    assert client.get('/jobs/verification-x').status_code == 503
+    assert client.get('/events/verification-x').status_code == 503
+
+
+def test_job_token_reads_only_its_own_job(client, card_path):
+    first = client.post('/ingest', json={'id': 'verification-a', 'file_path': card_path}, headers=BEARER).json()
+    assert first['token'] == app.job_token('verification-a')
+    other = app.job_token('verification-b')
+
+    assert client.get('/jobs/verification-a').status_code == 401
+    assert client.get('/jobs/verification-a', params={'token': other}).status_code == 401
+    assert client.get('/jobs/verification-a', params={'token': first['token']}).status_code == 200
+    assert client.get('/jobs/verification-a', headers=BEARER).status_code == 200
+
+
+def test_unknown_job_does_not_leak_existence(client):
+    assert client.get('/jobs/verification-missing').status_code == 401
+    assert client.get('/jobs/verification-missing', headers=BEARER).status_code == 404
+
+
+def test_events_need_credentials(client, card_path):
+    id = ingest(client, card_path)
+    wait_finished(client, id)
+    assert client.get(f"/events/{id}").status_code == 401
+    assert client.get(f"/events/{id}", params={'token': 'guess'}).status_code == 401
+
+    response = client.get(f"/events/{id}", params={'token': app.job_token(id)})
+    assert response.status_code == 200
+    assert 'event: complete' in response.text
+
+
+def test_browser_key_opens_its_own_event_stream(client, card_path):
+    key = secrets.token_hex(32)
+    id = ingest(client, card_path, ocr_events_key_hash=hashlib.sha256(key.encode()).hexdigest())
+    job = wait_finished(client, id)
+    assert job['status'] == 'complete'
+
+    response = client.get(f"/events/{id}", params={'token': key})
+    assert response.status_code == 200
+    assert 'event: complete' in response.text
+    # The key only opens the stream of the verification it was uploaded with
+    other = ingest(client, card_path)
+    assert client.get(f"/events/{other}", params={'token': key}).status_code == 401
+    assert client.get(f"/jobs/{id}", params={'token': key}).status_code == 200
@@ -0,0 +1,74 @@
+"""POST /ocr/batch"""
+import io
+import json
+
+from PIL import Image
+
+import app
+from conftest import INGEST_SECRET
+
+BEARER = {'Authorization': f"Bearer {INGEST_SECRET}"}
+
+
+def card_bytes(color: str = 'white') -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 500), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def lines(response) -> list[dict]:
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line['index'])
+
+
+def test_streams_one_line_per_upload(client):
+    files = [('files', ('a.png', card_bytes(), 'image/png')), ('files', ('b.png', card_bytes('gray'), 'image/png'))]
+    response = client.post('/ocr/batch', files=files)
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    results = lines(response)
+    assert [(line['index'], line['source'], line['status']) for line in results] == [(0, 'a.png', 200),
+                                                                                    (1, 'b.png', 200)]
+    assert results[0]['result']['text'].startswith('REPUBLIC')
+
+
+def test_failed_item_does_not_fail_the_batch(client):
+    files = [('files', ('card.png', card_bytes(), 'image/png')), ('files', ('junk.png', b'not an image', 'image/png'))]
+    response = client.post('/ocr/batch', files=files)
+    assert response.status_code == 200
+    good, bad = lines(response)
+    assert good['status'] == 200
+    assert bad['status'] >= 400 and bad['error']
+
+
+def test_batch_limits(client, monkeypatch):
+    assert client.post('/ocr/batch').status_code == 400
+    monkeypatch.setattr(app, 'BATCH_MAX_ITEMS', 1)
+    files = [('files', (f"{i}.png", card_bytes(), 'image/png')) for i in range(2)]
+    assert client.post('/ocr/batch', files=files).status_code == 413
+
+
+def test_storage_paths_need_the_ingest_secret(client, monkeypatch):
+    fetched = []
+
+    async def fetch(path: str, max_bytes: int) -> bytes:
+        fetched.append(path)
+        return card_bytes()
+
+    monkeypatch.setattr(app.storage, 'fetch', fetch)
+    data = {'paths': ['uploads/private.jpg']}
+    assert client.post('/ocr/batch', data=data).status_code == 401
+    assert client.post('/ocr/batch', data=data, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert fetched == []
+
+    response = client.post('/ocr/batch', data=data, headers=BEARER)
+    assert response.status_code == 200
+    assert lines(response)[0]['status'] == 200
+    assert fetched == ['uploads/private.jpg']
+
+
+def test_storage_paths_are_refused_without_a_secret(client, monkeypatch):
+    monkeypatch.setattr(app, 'INGEST_SECRET', '')
+    assert client.post('/ocr/batch', data={'paths': ['uploads/private.jpg']}).status_code == 503
+    # Uploads still work
+    files = [('files', ('a.png', card_bytes(), 'image/png'))]
+    assert client.post('/ocr/batch', files=files).status_code == 200
@@ -0,0 +1,114 @@
+"""Single-flight ResultCache.get_or_compute"""
+import asyncio
+
+import pytest
+
+from cache import COALESCED, HIT, MISS, ResultCache
+
+
+class Computation:
+    """compute() for get_or_compute that blocks until released and counts its runs"""
+
+    def __init__(self, value: dict | None = None, error: Exception | None = None):
+        self.value = value or {'text': 'JUAN DELA CRUZ'}
+        self.error = error
+        self.runs = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> dict:
+        self.runs += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.value
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_requests_compute_once():
+    async def scenario():
+        cache, compute = ResultCache(), Computation()
+        callers = [asyncio.create_task(cache.get_or_compute('key', compute)) for _ in range(3)]
+        await settle()
+        compute.release.set()
+        results = await asyncio.gather(*callers)
+        later = await cache.get_or_compute('key', compute)
+        return cache, compute, results, later
+
+    cache, compute, results, later = asyncio.run(scenario())
+    assert compute.runs == 1
+    assert [status for _, status in results] == [MISS, COALESCED, COALESCED]
+    assert all(value is compute.value for value, _ in results)
+    assert later == (compute.value, HIT)
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 2, 1)
+
+
+def test_uncacheable_result_is_shared_but_not_stored():
+    async def scenario():
+        cache, compute = ResultCache(), Computation({'text': '', 'truncated': True})
+        cacheable = lambda result: not result.get('truncated')  # noqa: E731
+        callers = [asyncio.create_task(cache.get_or_compute('key', compute, cacheable)) for _ in range(2)]
+        await settle()
+        compute.release.set()
+        results = await asyncio.gather(*callers)
+        again = await cache.get_or_compute('key', compute, cacheable)
+        return cache, compute, results, again
+
+    cache, compute, results, again = asyncio.run(scenario())
+    assert [status for _, status in results] == [MISS, COALESCED]
+    assert again[1] == MISS
+    assert compute.runs == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_failure_reaches_waiters_and_is_not_cached():
+    async def scenario():
+        cache, compute = ResultCache(), Computation(error=ValueError('undecodable'))
+        callers = [asyncio.create_task(cache.get_or_compute('key', compute)) for _ in range(2)]
+        await settle()
+        compute.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        compute.error = None
+        retried = await cache.get_or_compute('key', compute)
+        return compute, results, retried
+
+    compute, results, retried = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried[1] == MISS and compute.runs == 2
+
+
+def test_waiter_takes_over_when_the_first_caller_leaves():
+    async def scenario():
+        cache, compute = ResultCache(), Computation()
+        first = asyncio.create_task(cache.get_or_compute('key', compute))
+        await settle()
+        waiter = asyncio.create_task(cache.get_or_compute('key', compute))
+        await settle()
+        first.cancel()
+        await settle()
+        compute.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return compute, await waiter
+
+    compute, (value, status) = asyncio.run(scenario())
+    assert value is compute.value
+    assert status == MISS
+    assert compute.runs == 2
+
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    async def scenario():
+        compute = Computation()
+        compute.release.set()
+        first = await ResultCache(disk_dir=str(tmp_path)).get_or_compute('key', compute)
+        restarted = await ResultCache(disk_dir=str(tmp_path)).get_or_compute('key', compute)
+        return compute, first, restarted
+
+    compute, first, restarted = asyncio.run(scenario())
+    assert first[1] == MISS
+    assert restarted == (compute.value, HIT)
+    assert compute.runs == 1
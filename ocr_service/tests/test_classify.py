@@ -0,0 +1,112 @@
+"""Classifier micro-batching, with a stand-in for the TensorFlow model"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from classify import Classifier, ClassifierUnavailable
+
+LABELS = ('senior_genuine', 'senior_counterfeit', 'pwd_genuine', 'pwd_counterfeit')
+
+
+def image(label: int) -> np.ndarray:
+    # The fake model reads the class off the first pixel
+    array = np.zeros((4, 4, 3), dtype=np.float32)
+    array[0, 0, 0] = label
+    return array
+
+
+class FakeModel:
+    def __init__(self, error: Exception | None = None):
+        self.batches: list[int] = []
+        self.error = error
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        self.batches.append(len(batch))
+        if self.error:
+            raise self.error
+        return np.eye(len(LABELS), dtype=np.float32)[batch[:, 0, 0, 0].astype(int)]
+
+
+@pytest.fixture
+def no_tensorflow(monkeypatch):
+    monkeypatch.setattr(Classifier, 'load', lambda self: None)
+
+
+async def started(model, **kwargs) -> Classifier:
+    classifier = Classifier('unused', LABELS, **kwargs)
+    classifier.predict = model
+    await classifier.start()
+    return classifier
+
+
+def test_concurrent_requests_share_a_forward_pass(no_tensorflow):
+    async def main():
+        model = FakeModel()
+        classifier = await started(model, max_batch=4, max_wait_ms=2000)
+        begun = time.perf_counter()
+        first = await asyncio.gather(*(classifier.classify(image(i % 4)) for i in range(4)))
+        # A full batch does not wait out max_wait
+        assert time.perf_counter() - begun < 1
+        rest = await asyncio.gather(*(classifier.classify(image(i % 4)) for i in range(5)))
+        await classifier.close()
+        return model, classifier, first + rest
+
+    model, classifier, results = asyncio.run(main())
+    assert model.batches == [4, 4, 1]
+    assert [result['label'] for result in results] == [LABELS[i % 4] for i in (*range(4), *range(5))]
+    assert results[0]['confidence'] == 1.0 and set(results[0]['probabilities']) == set(LABELS)
+    assert classifier.stats()['batches'] == 3
+
+
+def test_a_lone_request_waits_at_most_max_wait(no_tensorflow):
+    async def main():
+        classifier = await started(FakeModel(), max_wait_ms=50)
+        begun = time.perf_counter()
+        result = await classifier.classify(image(2))
+        await classifier.close()
+        return result, time.perf_counter() - begun
+
+    result, seconds = asyncio.run(main())
+    assert result['label'] == 'pwd_genuine' and 0.04 < seconds < 1
+
+
+def test_a_failed_batch_fails_every_caller(no_tensorflow):
+    async def main():
+        classifier = await started(FakeModel(RuntimeError('out of memory')), max_batch=2)
+        results = await asyncio.gather(classifier.classify(image(0)), classifier.classify(image(1)),
+                                       return_exceptions=True)
+        await classifier.close()
+        return results
+
+    assert [str(result) for result in asyncio.run(main())] == ['out of memory'] * 2
+
+
+def test_cancelled_callers_are_left_out_of_the_batch(no_tensorflow):
+    async def main():
+        model = FakeModel()
+        classifier = await started(model, max_batch=3, max_wait_ms=50)
+        gone = asyncio.create_task(classifier.classify(image(0)))
+        await asyncio.sleep(0)
+        gone.cancel()
+        result = await classifier.classify(image(1))
+        await classifier.close()
+        return model, result
+
+    model, result = asyncio.run(main())
+    assert model.batches == [1] and result['label'] == 'senior_counterfeit'
+
+
+def test_without_a_model_it_is_unavailable():
+    async def main():
+        classifier = Classifier('/nonexistent', LABELS)
+        await classifier.start()
+        try:
+            with pytest.raises(ClassifierUnavailable):
+                await classifier.classify(image(0))
+        finally:
+            await classifier.close()
+        return classifier
+
+    assert asyncio.run(main()).stats()['available'] is False
@@ -0,0 +1,152 @@
+"""Deadline truncation: passes killed at the deadline, abandoned pool jobs and cancel flags"""
+import asyncio
+import io
+import multiprocessing
+import threading
+import time
+
+import pytesseract
+import pytest
+from PIL import Image
+
+import engines
+from deadline import CancelFlags, Deadline
+from pipeline import FALLBACK_PSM, PSM_MODES, OCROptions, ocr_bytes, ocr_image, ocr_single
+
+OPTIONS = OCROptions.create(template='off', rectify=False, strategy='longest')
+
+
+def card_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 500), 'white').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_slow_pass_is_stopped_at_the_deadline(tesseract):
+    slow = PSM_MODES[-1]
+    tesseract.delays[slow] = 5
+    started = time.perf_counter()
+    result = ocr_image(Image.new('L', (400, 250), 255), 'longest', Deadline(0.3))
+    assert time.perf_counter() - started < 2
+    assert result.timed_out == [slow]
+    assert result.text.startswith('REPUBLIC')
+
+
+def test_no_fallback_pass_once_out_of_time(tesseract):
+    tesseract.delays = dict.fromkeys(PSM_MODES, 5)
+    result = ocr_image(Image.new('L', (400, 250), 255), 'longest', Deadline(0.2))
+    assert result.text == ''
+    assert sorted(result.timed_out) == sorted(PSM_MODES)
+    assert len(tesseract.calls) == len(PSM_MODES)
+
+
+def test_cancelled_request_starts_no_pass(tesseract):
+    cancel = threading.Event()
+    cancel.set()
+    result = ocr_image(Image.new('L', (400, 250), 255), 'first_good', Deadline(30, cancel=cancel))
+    assert tesseract.calls == []
+    assert sorted(result.timed_out) == sorted(PSM_MODES)
+
+
+def test_tesseract_errors_are_not_timeouts(monkeypatch):
+    def failing(*args, **kwargs):
+        raise pytesseract.TesseractError(1, 'Error opening data file')
+
+    monkeypatch.setattr(pytesseract, 'image_to_string', failing)
+    with pytest.raises(pytesseract.TesseractError):
+        engines.image_to_text(Image.new('L', (40, 20), 255), timeout=5)
+
+
+def test_expired_deadline_truncates_the_result(tesseract):
+    deadline = Deadline(0.001)
+    time.sleep(0.01)
+    output = ocr_bytes(card_bytes(), OPTIONS, deadline)
+    assert output.truncated
+    assert output.text == ''
+    assert output.deadline['skipped'] == ['ocr']
+    assert tesseract.calls == []
+
+
+def test_finished_within_budget_is_not_truncated(tesseract):
+    output = ocr_bytes(card_bytes(), OPTIONS, Deadline(30))
+    assert not output.truncated
+    assert output.deadline['timed_out_psms'] == []
+
+
+def test_pool_job_is_abandoned_after_the_deadline(monkeypatch):
+    import app
+    from pool import WorkerPool
+
+    def stuck(image_bytes: bytes, deadline: Deadline):
+        # A stage that cannot be interrupted; it only notices the cancel flag when done
+        while not deadline.cancelled():
+            time.sleep(0.01)
+        raise AssertionError("an abandoned job's result is not used")
+
+    async def scenario():
+        deadline = app.deadlines.new(0.1)
+        started = time.perf_counter()
+        result = await app.run_in_pool(stuck, b'image', options=OPTIONS, deadline=deadline, cost=0,
+                                       lane='interactive')
+        return result, deadline, time.perf_counter() - started
+
+    monkeypatch.setattr(app, 'pool', WorkerPool(workers=1, max_queue=1, kind='thread'))
+    expired = app.deadlines.expired_queued
+    result, deadline, seconds = asyncio.run(scenario())
+    app.pool.shutdown()
+    assert result['truncated']
+    assert result['text'] == ''
+    assert result['deadline']['skipped'] == ['ocr']
+    assert deadline.cancelled()
+    assert seconds < 0.1 + app.GRACE_SECONDS + 1
+    assert app.deadlines.expired_queued == expired + 1
+
+
+def test_reused_cancel_slot_keeps_its_own_flag():
+    flags = CancelFlags(slots=2)
+    try:
+        old, other = flags.new(), flags.new()
+        # Takes old's slot under a newer generation
+        new = flags.new()
+        assert new.slot == old.slot
+        old.set()
+        assert not new.is_set() and not old.is_set()
+        new.set()
+        assert new.is_set() and not other.is_set()
+    finally:
+        flags.close()
+
+
+def _set_flag(flag) -> bool:
+    flag.set()
+    return flag.is_set()
+
+
+@pytest.mark.parametrize('method', ['fork', 'spawn'])
+def test_cancel_flag_crosses_processes(method):
+    flags = CancelFlags(slots=4)
+    try:
+        flag = flags.new()
+        with multiprocessing.get_context(method).Pool(1) as workers:
+            assert workers.apply(_set_flag, (flag,))
+        assert flag.is_set()
+    finally:
+        flags.close()
+
+
+def test_blank_passes_at_the_deadline_skip_the_fallback(tesseract):
+    tesseract.text = ''
+    tesseract.delays = dict.fromkeys(PSM_MODES, 0.2)
+    # The blank passes finish just before the deadline, leaving no time for the fallback
+    result = ocr_image(Image.new('L', (400, 250), 255), 'longest', Deadline(0.3))
+    assert result.text == ''
+    assert result.timed_out == [FALLBACK_PSM]
+
+
+def test_failed_single_pass_reads_as_blank(monkeypatch):
+    def failing(*args, **kwargs):
+        raise pytesseract.TesseractError(1, 'Error opening data file')
+
+    monkeypatch.setattr(pytesseract, 'image_to_data', failing)
+    result = ocr_single(Image.new('L', (400, 250), 255), deadline=Deadline(30))
+    assert result.text == '' and result.timed_out == []
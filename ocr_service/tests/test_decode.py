@@ -0,0 +1,126 @@
+"""Upload decoding: limits, draft-mode downscaling and in-place reads"""
+import io
+import pickle
+import struct
+import tracemalloc
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import decode
+
+
+def upload(size=(2400, 1800), format='JPEG') -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format, quality=95)
+    return buf.getvalue()
+
+
+def test_memoryview_is_read_in_place():
+    data = upload()
+    view = memoryview(bytearray(data))
+    expected, _ = decode.decode(data)
+    decode.decode(view)
+    tracemalloc.start()
+    try:
+        image, _ = decode.decode(view)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # Pillow's pixel buffers are not traced: anything near the upload's size is a copy of it
+    assert peak < len(data) // 4
+    assert image.tobytes() == expected.tobytes()
+
+
+def test_memoryview_of_every_format():
+    for format in ('PNG', 'WEBP', 'TIFF'):
+        data = upload((300, 200), format)
+        from_view = decode.decode(memoryview(data))[0]
+        assert from_view.tobytes() == decode.decode(data)[0].tobytes(), format
+
+
+def png_header(width: int, height: int) -> bytes:
+    """A PNG that declares ``width`` x ``height`` but carries almost no pixel data"""
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'\0' * 64)) + chunk(b'IEND', b''))
+
+
+def test_large_jpeg_is_drafted_down():
+    data = upload()
+    decode_plan = decode.plan(data)
+    assert (decode_plan.draft_scale, decode_plan.reduce) == (1, 1)
+    image, decode_plan = decode.decode(data, long_side=300)
+    # DCT scaling alone gets an 8x smaller image, without a full-size decode
+    assert (decode_plan.draft_scale, decode_plan.reduce) == (8, 1)
+    assert image.mode == 'L' and image.size == (300, 225)
+
+
+def test_other_formats_are_reduced_after_decoding():
+    image, decode_plan = decode.decode(upload((1600, 1200), 'PNG'), mode='RGB', long_side=500)
+    assert (decode_plan.draft_scale, decode_plan.reduce) == (1, 3)
+    assert image.mode == 'RGB' and image.size == decode_plan.output_size == (534, 400)
+
+
+@pytest.mark.parametrize('size', [(2401, 1803), (4032, 3024), (1601, 1201)])
+@pytest.mark.parametrize('format', ['JPEG', 'PNG'])
+def test_decoded_size_is_the_planned_size(size, format):
+    buf = io.BytesIO()
+    Image.new('RGB', size, 'white').save(buf, format)
+    for long_side in (300, 500, 700):
+        image, decode_plan = decode.decode(buf.getvalue(), long_side=long_side)
+        assert image.size == decode_plan.output_size, long_side
+
+
+def test_exif_orientation_is_applied():
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new('RGB', (400, 200), 'white').save(buf, 'JPEG', exif=exif)
+    assert decode.decode(buf.getvalue())[0].size == (200, 400)
+
+
+def test_pixel_bomb_is_rejected_from_its_header():
+    with pytest.raises(decode.ImageRejected) as rejected:
+        decode.plan(png_header(60000, 60000))
+    assert rejected.value.status_code == 413
+
+
+def test_pixel_limit(monkeypatch):
+    monkeypatch.setattr(decode, 'MAX_PIXELS', 1000 * 1000)
+    with pytest.raises(decode.ImageRejected, match='over the 1000000 pixel limit') as rejected:
+        decode.plan(upload((1200, 900)))
+    assert rejected.value.status_code == 413
+    assert decode.plan(upload((1000, 1000))).size == (1000, 1000)
+
+
+@pytest.mark.parametrize('data, status_code', [
+    (b'', 400),
+    (b'not an image', 400),
+    (b'\0' * (decode.MAX_UPLOAD_BYTES + 1), 413),
+])
+def test_unreadable_uploads(data, status_code):
+    with pytest.raises(decode.ImageRejected) as rejected:
+        decode.decode(data)
+    assert rejected.value.status_code == status_code
+    # The status code survives a trip back from a process worker
+    assert pickle.loads(pickle.dumps(rejected.value)).status_code == status_code
+
+
+def test_truncated_image_is_rejected():
+    data = upload((300, 200))
+    with pytest.raises(decode.ImageRejected):
+        decode.decode(data[:len(data) // 2])
+
+
+def test_peak_estimate_counts_the_color_decode():
+    decode_plan = decode.plan(upload((1600, 1200)))
+    assert decode_plan.decode_peak_bytes('RGB') >= decode_plan.upload_bytes + 1600 * 1200 * 3
+    # A JPEG decodes straight to grayscale; anything else is converted after decoding in color
+    assert decode_plan.decode_peak_bytes('L') == decode_plan.upload_bytes + 1600 * 1200
+    png = decode.plan(upload((1600, 1200), 'PNG'))
+    assert png.decode_peak_bytes('L') == png.upload_bytes + 1600 * 1200 * 4
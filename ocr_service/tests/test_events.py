@@ -0,0 +1,88 @@
+"""Completion event streams"""
+import asyncio
+import gc
+
+import pytest
+
+from events import CompletionBroker, TooManyConnections
+from jobs import QUEUED, Job
+from verifications import COMPLETE
+
+
+def job(id: str = 'v1', status: str = QUEUED) -> Job:
+    return Job(id, f"uploads/{id}.jpg", status, 1, 0.0, finished_at=1.0 if status != QUEUED else None,
+               result={'fields': {'id_number': 'SC-1'}} if status == COMPLETE else None)
+
+
+async def collect(body) -> list[str]:
+    return [chunk async for chunk in body]
+
+
+def test_publish_wakes_every_subscriber():
+    async def main():
+        broker = CompletionBroker(lambda ids: {})
+        readers = [asyncio.create_task(collect(broker.stream('v1', job()))) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert broker.connections == 3 and broker.stats()['subscribed_ids'] == 1
+        broker.publish(job(status=COMPLETE))
+        chunks = await asyncio.gather(*readers)
+        assert broker.connections == 0 and broker.stats()['subscribed_ids'] == 0
+        return chunks
+
+    for chunks in asyncio.run(main()):
+        assert chunks[0].startswith('retry:')
+        assert chunks[-1].startswith('event: complete') and 'SC-1' in chunks[-1]
+
+
+def test_finished_job_is_sent_at_once():
+    async def main():
+        return await collect(CompletionBroker(lambda ids: {}).stream('v1', job(status=COMPLETE)))
+
+    assert [chunk.split('\n')[0] for chunk in asyncio.run(main())] == ['event: complete']
+
+
+def test_stream_times_out():
+    async def main():
+        broker = CompletionBroker(lambda ids: {})
+        chunks = await collect(broker.stream('v1', job(), timeout=0.05))
+        return broker, chunks
+
+    broker, chunks = asyncio.run(main())
+    assert chunks[-1].startswith('event: timeout') and broker.timeouts == 1
+
+
+def test_slots_are_taken_when_admitted():
+    async def main():
+        broker = CompletionBroker(lambda ids: {}, max_connections=2)
+        # Admitted but not started yet, as when responses are still on their way out
+        first, second = broker.stream('v1', job()), broker.stream('v2', job('v2'))
+        with pytest.raises(TooManyConnections):
+            broker.stream('v3', job('v3'))
+        # A body that is dropped unsent gives its slot back
+        del second
+        gc.collect()
+        assert broker.connections == 1
+        third = broker.stream('v3', job('v3'))
+        reader = asyncio.create_task(collect(third))
+        await asyncio.sleep(0.01)
+        broker.publish(job('v3', COMPLETE))
+        await reader
+        assert broker.connections == 1
+        await first.aclose()
+        del first
+        gc.collect()
+        return broker
+
+    broker = asyncio.run(main())
+    assert broker.connections == 0 and broker.peak_connections == 2
+
+
+def test_other_processes_are_polled():
+    async def main():
+        broker = CompletionBroker(lambda ids: {id: job(id, COMPLETE) for id in ids}, poll_seconds=0.01)
+        broker.start()
+        chunks = await asyncio.wait_for(collect(broker.stream('v1', job())), 5)
+        await broker.close()
+        return chunks
+
+    assert asyncio.run(main())[-1].startswith('event: complete')
@@ -0,0 +1,67 @@
+"""Field extraction from OCR text"""
+import pytest
+
+from conftest import CARD_TEXT
+from extract import clean_name, extract_fields, parse_date
+
+
+def test_labelled_fields_on_the_same_line():
+    fields = extract_fields(CARD_TEXT)
+    assert fields.id_type == 'senior_citizen'
+    assert fields.id_number == 'SC-2025-104392'
+    assert fields.holder_name == 'JUAN DELA CRUZ'
+    assert fields.date_of_birth == '1959-11-15'
+    assert fields.confidence['holder_name'] == 0.95
+
+
+def test_values_on_the_next_line():
+    text = ("Republic of the Philippines\nPersons with Disability Affairs Office\n"
+            "ID No.\n22135\nNarne\nMARIA L. SANTOS\nDate Issued\nMarch 3, 2021\nValid Until\n3 Mar 2026")
+    fields = extract_fields(text)
+    assert fields.id_type == 'pwd'
+    assert (fields.id_number, fields.holder_name) == ('22135', 'MARIA L. SANTOS')
+    assert (fields.date_of_issue, fields.valid_until) == ('2021-03-03', '2026-03-03')
+    assert fields.confidence['id_number'] == 0.75
+
+
+def test_unlabelled_text_falls_back():
+    # No header survived OCR: the serial prefix still tells the card type,
+    # and the earliest free-standing date is taken as the birth date
+    fields = extract_fields("OSCA-21-00431\nRODRIGO PANGANIBAN\n09/30/2021\n11/15/1959")
+    assert (fields.id_type, fields.id_number) == ('senior_citizen', 'OSCA-21-00431')
+    assert fields.holder_name == 'RODRIGO PANGANIBAN' and fields.confidence['holder_name'] == 0.3
+    assert fields.date_of_birth == '1959-11-15'
+
+
+def test_stronger_rules_win_over_earlier_weaker_ones():
+    fields = extract_fields("104392\nID No.: 22135")
+    assert fields.id_number == '22135'
+
+
+def test_confidence_scales_with_ocr_confidence():
+    assert extract_fields(CARD_TEXT, ocr_confidence=50).confidence['id_number'] == 0.425
+    assert extract_fields(CARD_TEXT, ocr_confidence=250).confidence['id_number'] == 0.85
+
+
+def test_nothing_to_find():
+    fields = extract_fields("")
+    assert fields.to_dict() == {'id_type': None, 'id_number': None, 'holder_name': None, 'date_of_birth': None,
+                                'date_of_issue': None, 'valid_until': None, 'confidence': {}}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1959-11-15', '1959-11-15'),
+    ('11/15/1959', '1959-11-15'),
+    ('Nov. 15, 1959', '1959-11-15'),
+    ('15 November 1959', '1959-11-15'),
+    ('13/13/1959', None),
+    ('Smarch 5, 1959', None),
+])
+def test_parse_date(text, expected):
+    assert parse_date(text) == expected
+
+
+def test_clean_name_drops_card_words():
+    assert clean_name('JUAN  DELA CRUZ,') == 'JUAN DELA CRUZ'
+    assert clean_name('OFFICE OF SENIOR CITIZENS') is None
+    assert clean_name('JUAN') is None
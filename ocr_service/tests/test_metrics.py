@@ -0,0 +1,127 @@
+"""Histograms, the Prometheus text rendering and what the service exports"""
+import io
+import re
+
+import pytest
+from PIL import Image
+
+from cache import HIT, MISS
+from metrics import Histogram, Registry
+from telemetry import OCRMetrics, server_timing
+
+# name{label="value",...} number
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+
+def parse(text: str) -> dict[str, float]:
+    """Sample lines by their name and labels; fails on anything Prometheus would not accept"""
+    assert text.endswith('\n')
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert kind in ('counter', 'gauge', 'histogram')
+            types[name] = kind
+        elif not line.startswith('# HELP '):
+            match = SAMPLE.match(line)
+            assert match, line
+            family = re.sub(r'_(bucket|sum|count)$', '', match.group(1))
+            assert match.group(1) in types or family in types, line
+            samples[match.group(1) + (match.group(2) or '')] = float(match.group(3))
+    return samples
+
+
+def test_histogram_buckets_are_inclusive_upper_bounds():
+    histogram = Histogram((10, 100))
+    for value in (5, 10, 11, 100, 1000):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'10': 2, '100': 4, '+Inf': 5}
+    assert (snapshot['count'], snapshot['sum']) == (5, 1126)
+
+
+def test_quantiles_interpolate_inside_the_bucket():
+    histogram = Histogram((10, 20, 40))
+    assert histogram.quantile(0.5) == 0.0
+    for value in [5] * 50 + [15] * 50:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 10
+    assert histogram.quantile(0.75) == 15
+    histogram.observe(1000)
+    assert histogram.quantile(0.999) == 40
+
+
+def test_registry_renders_the_text_format():
+    registry = Registry()
+    counter = registry.counter('jobs_total', 'Jobs', ('status',))
+    counter.inc(status='ok')
+    counter.inc(2, status='say "hi"\n')
+    family = registry.histogram('wait_ms', 'Wait', (1, 10), ('lane',))
+    family.observe(3, lane='interactive')
+    registry.gauge('workers', 'Workers', lambda: 4)
+    registry.gauge('queued', 'Queued', lambda: {'backfill': 2, 'interactive': 0}, 'lane')
+    text = registry.render()
+    assert '# TYPE wait_ms histogram\n' in text
+    assert parse(text) == {
+        'jobs_total{status="ok"}': 1,
+        r'jobs_total{status="say \"hi\"\n"}': 2,
+        'wait_ms_bucket{lane="interactive",le="1"}': 0,
+        'wait_ms_bucket{lane="interactive",le="10"}': 1,
+        'wait_ms_bucket{lane="interactive",le="+Inf"}': 1,
+        'wait_ms_sum{lane="interactive"}': 3,
+        'wait_ms_count{lane="interactive"}': 1,
+        'workers': 4,
+        'queued{lane="backfill"}': 2,
+        'queued{lane="interactive"}': 0,
+    }
+
+
+def test_bound_histograms_are_exported_as_they_change():
+    registry = Registry()
+    lane = Histogram((5,))
+    registry.histogram('queue_wait_ms', 'Wait', (), ('lane',)).bind(lane, lane='backfill')
+    lane.observe(7)
+    assert parse(registry.render())['queue_wait_ms_count{lane="backfill"}'] == 1
+
+
+def test_computed_results_feed_the_stage_and_pass_histograms():
+    metrics = OCRMetrics()
+    metrics.computed({'psm': 6, 'truncated': True,
+                      'timings_ms': {'decode': 12.5, 'preprocess': 40, 'psm6': 300, 'psm11': 250}})
+    metrics.computed({'psm': None, 'template': 'senior_citizen/v1', 'timings_ms': {'regions': 80}})
+    metrics.served('ocr', {'tier': 'full'}, MISS, 400)
+    metrics.failure('pool_full')
+    samples = parse(metrics.render())
+    assert samples['ocr_stage_ms_count{stage="decode"}'] == 1
+    assert samples['ocr_pass_ms_count{psm="11"}'] == 1
+    assert 'ocr_stage_ms_count{stage="psm6"}' not in samples
+    assert samples['ocr_winning_psm_total{psm="6"}'] == 1
+    assert samples['ocr_winning_psm_total{psm="template"}'] == 1
+    assert samples['ocr_truncated_total'] == 1
+    assert samples['ocr_results_total{cache="miss",tier="full"}'] == 1
+    # Every cause is exported from the start
+    assert samples['ocr_failures_total{cause="pool_full"}'] == 1
+    assert samples['ocr_failures_total{cause="storage"}'] == 0
+
+
+@pytest.mark.parametrize('cache_status, expected', [
+    (MISS, 'cache;desc="miss", queue;dur=3, decode;dur=10, psm6;dur=200, extract;dur=1, total;dur=220'),
+    (HIT, 'cache;desc="hit", queue;dur=3, total;dur=220'),
+])
+def test_server_timing_lists_stages_in_pipeline_order(cache_status, expected):
+    result = {'timings_ms': {'extract': 1, 'psm6': 200, 'decode': 10}}
+    assert server_timing(result, cache_status, 220, {'queue': 3}) == expected
+
+
+def test_metrics_endpoint(client):
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 500), 'white').save(buffer, 'PNG')
+    response = client.post('/ocr', files={'file': ('card.png', buffer.getvalue(), 'image/png')})
+    assert response.status_code == 200
+    assert response.headers['server-timing'].startswith('cache;desc=')
+    response = client.get('/metrics')
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    samples = parse(response.text)
+    assert samples['ocr_request_ms_count{endpoint="ocr"}'] >= 1
+    assert samples['ocr_pool_workers'] == 2
+    assert 'ocr_lane_queued{lane="interactive"}' in samples
@@ -0,0 +1,96 @@
+"""PSM pass strategies in ocr_image"""
+import os
+import sys
+import time
+
+import pytesseract
+import pytest
+from PIL import Image
+
+from deadline import Deadline
+from pipeline import PSM_MODES, ocr_image
+
+IMAGE = Image.new('L', (400, 250), 255)
+FIRST, *LOSERS = PSM_MODES
+
+
+def test_longest_keeps_the_longest_text(tesseract):
+    tesseract.texts = {FIRST: 'SHORT', LOSERS[0]: 'THE LONGEST TEXT OF ALL', LOSERS[1]: 'MEDIUM TEXT'}
+    assert ocr_image(IMAGE, 'longest').psm == LOSERS[0]
+
+
+def test_first_good_does_not_wait_for_the_other_passes(tesseract):
+    tesseract.delays = {FIRST: 0.5, LOSERS[0]: 0.05, LOSERS[1]: 3}
+    started = time.perf_counter()
+    result = ocr_image(IMAGE, 'first_good')
+    assert time.perf_counter() - started < 1.5
+    # The first to finish above the threshold wins, whatever its place in PSM_MODES
+    assert result.psm == LOSERS[0]
+    assert result.confidence == 90 and result.timed_out == []
+
+
+def test_first_good_keeps_the_most_confident_below_the_threshold(tesseract):
+    tesseract.confidence = 40
+    result = ocr_image(IMAGE, 'first_good')
+    assert result.confidence == 40 and result.text.startswith('REPUBLIC')
+    assert sorted(tesseract.calls) == sorted(PSM_MODES)
+
+
+FAKE_TESSERACT = '''\
+import os, sys, time
+args = sys.argv[1:]
+if '--version' in args:
+    print('tesseract 5.3.0')
+    sys.exit(0)
+psm = int(args[args.index('--psm') + 1])
+marks = os.environ['FAKE_TESSERACT_MARKS']
+open(os.path.join(marks, f'{psm}.pid'), 'w').write(str(os.getpid()))
+time.sleep(0.05 if psm == FAST else 30)
+with open(args[1] + '.tsv', 'w') as out:
+    out.write('level\\tpage_num\\tblock_num\\tpar_num\\tline_num\\tword_num\\tleft\\ttop\\twidth\\theight\\tconf\\ttext\\n')
+    out.write('5\\t1\\t1\\t1\\t1\\t1\\t0\\t0\\t10\\t10\\t91\\tSENIOR\\n')
+with open(args[1] + '.txt', 'w') as out:
+    out.write('SENIOR\\n')
+'''
+
+
+@pytest.fixture
+def slow_tesseract(tmp_path, monkeypatch):
+    """A ``tesseract`` binary whose passes other than PSM_MODES[0] take 30 s"""
+    script = tmp_path / 'tesseract'
+    script.write_text(f"#!{sys.executable}\nFAST = {FIRST}\n{FAKE_TESSERACT}")
+    script.chmod(0o755)
+    marks = tmp_path / 'marks'
+    marks.mkdir()
+    monkeypatch.setattr(pytesseract.pytesseract, 'tesseract_cmd', str(script))
+    monkeypatch.setenv('FAKE_TESSERACT_MARKS', str(marks))
+    return marks
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_losing_tesseract_processes_are_killed(slow_tesseract):
+    started = time.perf_counter()
+    result = ocr_image(IMAGE, 'first_good')
+    assert time.perf_counter() - started < 10
+    assert result.psm == FIRST and result.text == 'SENIOR'
+    for _ in range(100):
+        pids = [int(path.read_text()) for path in slow_tesseract.glob('*.pid') if path.stem != str(FIRST)]
+        if pids and not any(map(alive, pids)):
+            break
+        time.sleep(0.05)
+    assert pids and not any(map(alive, pids))
+
+
+def test_slow_tesseract_process_is_killed_at_the_deadline(slow_tesseract):
+    started = time.perf_counter()
+    result = ocr_image(IMAGE, 'longest', Deadline(1))
+    assert time.perf_counter() - started < 5
+    assert result.psm == FIRST
+    assert sorted(result.timed_out) == sorted(LOSERS)
@@ -0,0 +1,118 @@
+"""Admission and lane scheduling in WorkerPool"""
+import asyncio
+import threading
+
+import pytest
+
+from pool import BACKFILL, INTERACTIVE, WORKER, PoolFull, WorkerPool
+
+
+def work(gate: threading.Event, order: list, name: str) -> str:
+    gate.wait(5)
+    order.append(name)
+    return name
+
+
+async def settle():
+    """Let submitted jobs reach their admission point"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_full_queue_raises_pool_full():
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=1, kind='thread')
+        gate, order = threading.Event(), []
+        running = asyncio.create_task(pool.run(work, gate, order, 'running'))
+        queued = asyncio.create_task(pool.run(work, gate, order, 'queued'))
+        await settle()
+        with pytest.raises(PoolFull) as rejected:
+            await pool.run(work, gate, order, 'rejected')
+        gate.set()
+        assert await asyncio.gather(running, queued) == ['running', 'queued']
+        pool.shutdown()
+        return pool, rejected.value
+
+    pool, error = asyncio.run(scenario())
+    assert error.lane == INTERACTIVE
+    assert error.retry_after >= 1
+    assert pool.rejected == 1 and pool.lanes[INTERACTIVE].rejected == 1
+    assert pool.completed == 2 and pool.queue_depth == 0 and pool.busy == 0
+
+
+def test_cancelled_waiter_gives_its_turn_away():
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=4, kind='thread')
+        gate, order = threading.Event(), []
+        first = asyncio.create_task(pool.run(work, gate, order, 'first'))
+        await settle()
+        gone = asyncio.create_task(pool.run(work, gate, order, 'gone'))
+        kept = asyncio.create_task(pool.run(work, gate, order, 'kept'))
+        await settle()
+        gone.cancel()
+        gate.set()
+        await asyncio.gather(first, kept)
+        pool.shutdown()
+        return pool, order
+
+    pool, order = asyncio.run(scenario())
+    assert order == ['first', 'kept']
+    assert pool.busy == 0 and pool.queue_depth == 0
+
+
+def test_lane_queues_are_separate():
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=4, kind='thread', lane_queues={BACKFILL: 0})
+        gate, order = threading.Event(), []
+        running = asyncio.create_task(pool.run(work, gate, order, 'worker', lane=WORKER))
+        await settle()
+        with pytest.raises(PoolFull) as rejected:
+            await pool.run(work, gate, order, 'backfill', lane=BACKFILL)
+        # A full backfill lane does not turn interactive requests away
+        interactive = asyncio.create_task(pool.run(work, gate, order, 'interactive'))
+        await settle()
+        gate.set()
+        await asyncio.gather(running, interactive)
+        pool.shutdown()
+        return rejected.value, order
+
+    error, order = asyncio.run(scenario())
+    assert error.lane == BACKFILL
+    assert order == ['worker', 'interactive']
+
+
+def test_waiting_jobs_start_by_weighted_round_robin():
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=8, kind='thread', weights={INTERACTIVE: 2, BACKFILL: 1})
+        gate, order = threading.Event(), []
+        first = asyncio.create_task(pool.run(work, gate, order, 'first', lane=WORKER))
+        await settle()
+        waiting = [asyncio.create_task(pool.run(work, gate, order, lane[0], lane=lane))
+                   for lane in [BACKFILL] * 3 + [INTERACTIVE] * 3]
+        await settle()
+        gate.set()
+        await asyncio.gather(first, *waiting)
+        pool.shutdown()
+        return order
+
+    # Interactive gets two turns for every backfill turn, whatever the arrival order
+    assert asyncio.run(scenario()) == ['first', 'i', 'b', 'i', 'i', 'b', 'b']
+
+
+def test_reserved_workers_stay_free_for_interactive():
+    async def scenario():
+        pool = WorkerPool(workers=2, max_queue=4, kind='thread', interactive_reserved=1)
+        gate, order = threading.Event(), []
+        backfill = [asyncio.create_task(pool.run(work, gate, order, 'backfill', lane=BACKFILL))
+                    for _ in range(2)]
+        await settle()
+        lanes = {'backfill_running': pool.lanes[BACKFILL].running, 'backfill_queued': pool.lanes[BACKFILL].queued}
+        interactive = asyncio.create_task(pool.run(work, gate, order, 'interactive'))
+        await settle()
+        lanes['interactive_running'] = pool.lanes[INTERACTIVE].running
+        gate.set()
+        await asyncio.gather(*backfill, interactive)
+        pool.shutdown()
+        return lanes
+
+    assert asyncio.run(scenario()) == {'backfill_running': 1, 'backfill_queued': 1, 'interactive_running': 1}
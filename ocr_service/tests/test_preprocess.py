@@ -0,0 +1,69 @@
+"""Preprocessing engines: the numpy engine against Pillow's chain, and its memory bound"""
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+import preprocess
+
+
+def card(size=(1012, 638)) -> Image.Image:
+    image = Image.new('L', size, 230)
+    draw = ImageDraw.Draw(image)
+    for row in range(8):
+        y = 40 + row * size[1] // 9
+        draw.text((60, y), f"ID No.: SC-2025-10439{row}", fill=20)
+        draw.rectangle((size[0] // 2, y, size[0] // 2 + size[0] // 4, y + 6), fill=40)
+    return image
+
+
+def pixels(image: Image.Image) -> np.ndarray:
+    return np.asarray(image).astype(np.int16)
+
+
+def test_numpy_engine_matches_pillow():
+    image = card()
+    expected = pixels(preprocess.preprocess_image(image))
+    got = pixels(preprocess.preprocess_array(image))
+    assert got.shape == expected.shape == (900, 1427)
+    assert np.abs(got - expected).mean() < 0.5
+
+
+def test_strips_match_one_pass(monkeypatch):
+    image = card()
+    strips = pixels(preprocess.preprocess_array(image))
+    monkeypatch.setattr(preprocess, 'STRIP_ROWS', 10_000)
+    whole = pixels(preprocess.preprocess_array(image))
+    # Only the upscale's rounding differs between a strip and the whole page,
+    # by a level here and there before contrast stretches it
+    assert (strips != whole).mean() < 0.001
+    assert np.abs(strips - whole).max() < 16
+
+
+def test_sauvola_is_black_and_white():
+    out = np.asarray(preprocess.preprocess_array(card(), binarize=True))
+    assert set(np.unique(out)) == {0, 255}
+    grey = np.asarray(preprocess.preprocess_array(card()))
+    # Ink stays ink and the background stays background
+    assert (out[grey < 64] == 0).mean() > 0.95
+    assert (out[grey > 200] == 255).mean() > 0.99
+
+
+@pytest.mark.parametrize('size', [(1012, 638), (3000, 1900)])
+@pytest.mark.parametrize('engine', ['numpy', 'sauvola'])
+def test_peak_stays_inside_the_estimate(size, engine):
+    image = card(size)
+    preprocess.run_preprocess(image, engine)
+    tracemalloc.start()
+    try:
+        preprocess.run_preprocess(image, engine)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= preprocess.working_set_bytes(size, engine)
+
+
+def test_fast_tier_caps_the_long_side():
+    out = preprocess.preprocess_fast(card((3000, 1900)).convert('RGB'))
+    assert out.mode == 'L' and max(out.size) == preprocess.FAST_MAX_SIDE
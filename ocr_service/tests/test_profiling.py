@@ -0,0 +1,102 @@
+"""Request profiling: merged pass-thread profiles and the artifact store"""
+import io
+import os
+import pstats
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import app
+import profiling
+from profiling import ProfileStore
+
+SECRET = 'test-profile-secret'
+
+
+def spin_in_pass():
+    time.sleep(0.01)
+
+
+def job() -> str:
+    thread = threading.Thread(target=profiling.bind(spin_in_pass))
+    thread.start()
+    thread.join()
+    return 'done'
+
+
+def functions(path) -> set[str]:
+    return {name for _, _, name in pstats.Stats(str(path)).stats}
+
+
+def test_pass_threads_are_merged_into_the_job_profile(tmp_path):
+    path = tmp_path / 'job.prof'
+    assert profiling.run(str(path), job) == 'done'
+    assert {'job', 'spin_in_pass'} <= functions(path)
+    assert not (tmp_path / 'job.prof.tmp').exists()
+    # Outside a profiled job, bind leaves the function alone
+    assert profiling.bind(spin_in_pass) is spin_in_pass
+
+
+def test_a_failing_job_still_leaves_its_profile(tmp_path):
+    path = tmp_path / 'job.prof'
+    with pytest.raises(ZeroDivisionError):
+        profiling.run(str(path), lambda: 1 / 0)
+    assert path.exists()
+
+
+def test_tokens(tmp_path):
+    store = ProfileStore(tmp_path, secret=SECRET)
+    assert store.request(None) is None
+    with pytest.raises(PermissionError):
+        store.request('wrong')
+    assert store.path(store.request(SECRET)).parent == tmp_path
+    # Without a secret nobody may ask for a profile
+    with pytest.raises(PermissionError):
+        ProfileStore(tmp_path, secret='').request('')
+
+
+def test_only_ids_the_store_makes_are_paths(tmp_path):
+    store = ProfileStore(tmp_path, secret=SECRET)
+    assert store.path(store._new(profiling.SAMPLED)).name.endswith('.prof')
+    for bad in ('../../etc/passwd', '20250101T000000-request-abc', '20250101T000000-request-0123456789ab/..'):
+        assert store.path(bad) is None
+
+
+def test_sampling_rate(tmp_path):
+    assert ProfileStore(tmp_path, sample_rate=0).sample() is None
+    store = ProfileStore(tmp_path, sample_rate=5)
+    assert store.sample_rate == 1 and profiling.SAMPLED in store.sample()
+
+
+def test_prune_drops_the_oldest_but_keeps_the_new_one(tmp_path):
+    store = ProfileStore(tmp_path, secret=SECRET, max_bytes=2500)
+    ids = [store.request(SECRET) for _ in range(4)]
+    for age, id in enumerate(reversed(ids)):
+        path = store.path(id)
+        path.write_bytes(b'x' * 1000)
+        os.utime(path, (time.time() - 100 * age, time.time() - 100 * age))
+    # The oldest is the one being kept, so the next two go instead
+    store.prune(keep=ids[0])
+    assert sorted(entry['id'] for entry in store.list()) == sorted([ids[0], ids[3]])
+    assert store.stats()['pruned'] == 2
+
+
+def test_profiled_request_end_to_end(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(app.profiles, 'secret', SECRET)
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 500), 'white').save(buffer, 'PNG')
+    headers = {'X-OCR-Profile': SECRET}
+    response = client.post('/ocr', files={'file': ('card.png', buffer.getvalue(), 'image/png')}, headers=headers)
+    assert response.status_code == 200
+    profile_id = response.headers['X-OCR-Profile-Id']
+    text = client.get(f"/profiles/{profile_id}", params={'format': 'text'}, headers=headers)
+    assert text.status_code == 200 and 'ocr_bytes' in text.text
+    download = tmp_path / 'download.prof'
+    download.write_bytes(client.get(f"/profiles/{profile_id}", headers=headers).content)
+    assert 'ocr_bytes' in functions(download)
+    assert profile_id in [entry['id'] for entry in client.get('/profiles', headers=headers).json()['profiles']]
+    assert client.get(f"/profiles/{profile_id}").status_code == 401
+    assert client.post('/ocr', files={'file': ('card.png', buffer.getvalue(), 'image/png')},
+                       headers={'X-OCR-Profile': 'wrong'}).status_code == 401
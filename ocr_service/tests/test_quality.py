@@ -0,0 +1,86 @@
+"""Image quality gate: measure() and check()"""
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+import quality
+from conftest import SERVICE_DIR
+from quality import QualityRejected
+
+SAMPLES = SERVICE_DIR.parent / 'ml' / 'data' / 'images'
+
+
+def card(size=(1012, 638), background=200, ink=20) -> Image.Image:
+    """Grey card with dark text-like strokes: sharp, no glare, full contrast"""
+    image = Image.new('L', size, background)
+    draw = ImageDraw.Draw(image)
+    for row in range(6):
+        top = 60 + row * size[1] // 8
+        for column in range(12):
+            left = 60 + column * size[0] // 14
+            draw.rectangle((left, top, left + size[0] // 20, top + size[1] // 30), fill=ink)
+    return image
+
+
+def test_good_card_passes():
+    verdict = quality.measure(card())
+    assert verdict.ok and verdict.reasons == []
+    assert verdict.resolution == 638
+    assert verdict.ms >= 0
+
+
+def test_blurry():
+    verdict = quality.measure(card().filter(ImageFilter.GaussianBlur(12)))
+    assert 'blurry' in verdict.reasons and not verdict.ok
+
+
+def test_glare():
+    image = card()
+    # A blown-out highlight over a third of the card
+    ImageDraw.Draw(image).rectangle((0, 0, image.width // 2, image.height * 2 // 3), fill=255)
+    assert 'glare' in quality.measure(image).reasons
+
+
+def test_low_contrast():
+    assert quality.measure(card(background=140, ink=120)).reasons == ['low_contrast']
+
+
+def test_low_resolution():
+    assert quality.measure(card().resize((400, 252))).reasons == ['low_resolution']
+
+
+def test_measures_colour_images_in_grayscale():
+    assert quality.measure(card().convert('RGB')).ok
+
+
+def test_check_modes():
+    blurry = card().filter(ImageFilter.GaussianBlur(12))
+    assert quality.check(blurry, 'off') is None
+    assert not quality.check(blurry, 'log').ok
+    with pytest.raises(QualityRejected) as rejected:
+        quality.check(blurry, 'enforce')
+    assert rejected.value.status_code == 422
+    assert 'blurry' in str(rejected.value)
+    # Raised in process workers, so it must survive pickling
+    assert pickle.loads(pickle.dumps(rejected.value)).verdict.reasons == rejected.value.verdict.reasons
+    assert quality.check(card(), 'enforce').ok
+
+
+def test_gate_only_logs_by_default():
+    env = {key: value for key, value in os.environ.items() if key != 'OCR_QUALITY_GATE'}
+    mode = subprocess.run([sys.executable, '-c', 'import quality; print(quality.MODE)'], cwd=SERVICE_DIR,
+                          env=env, capture_output=True, text=True, check=True).stdout.strip()
+    assert mode == 'log'
+
+
+@pytest.mark.parametrize('name', ['pwd_genuine_001.png', 'senior_genuine_001.jpg'])
+def test_genuine_samples_are_sharp_and_glare_free(name):
+    with Image.open(SAMPLES / name) as image:
+        verdict = quality.measure(image.convert('L'))
+    assert verdict.sharpness >= quality.MIN_SHARPNESS
+    assert verdict.glare <= quality.MAX_GLARE
+    assert verdict.contrast >= quality.MIN_CONTRAST
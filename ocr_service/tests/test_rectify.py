@@ -0,0 +1,92 @@
+"""Card detection and rectification on synthetic photos of a card"""
+import math
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+import rectify
+
+CARD = (600, 378)
+BACKGROUND = 40
+
+
+def card() -> Image.Image:
+    image = Image.new('L', CARD, 235)
+    draw = ImageDraw.Draw(image)
+    # A dense header band, as on both card types, and a few thin lines below
+    for y in range(20, 90, 14):
+        draw.rectangle((40, y, 560, y + 7), fill=20)
+    for y in (200, 260, 320):
+        draw.rectangle((40, y, 300, y + 3), fill=60)
+    return image
+
+
+def photo(angle: float = 0.0, rotate: int = 0, frame=(900, 700)) -> tuple[Image.Image, np.ndarray]:
+    """``card()`` turned ``rotate`` degrees, tilted ``angle`` and pasted mid-frame; returns its TL, TR, BR, BL"""
+    source = card().rotate(rotate, expand=True) if rotate else card()
+    w, h = source.size
+    tilted = source.rotate(angle, expand=True, resample=Image.Resampling.BICUBIC)
+    mask = Image.new('L', source.size, 255).rotate(angle, expand=True)
+    image = Image.new('L', frame, BACKGROUND)
+    offset = ((frame[0] - tilted.width) // 2, (frame[1] - tilted.height) // 2)
+    image.paste(tilted, offset, mask)
+    # Counter-clockwise rotation about the centre, in image coordinates (y down)
+    t = math.radians(angle)
+    cx, cy = offset[0] + tilted.width / 2, offset[1] + tilted.height / 2
+    corners = [(x - w / 2, y - h / 2) for x, y in [(0, 0), (w, 0), (w, h), (0, h)]]
+    return image, np.array([(cx + x * math.cos(t) + y * math.sin(t), cy - x * math.sin(t) + y * math.cos(t))
+                            for x, y in corners])
+
+
+def test_corners_of_a_tilted_card():
+    image, expected = photo(angle=8)
+    corners = np.array(rectify.detect(image))
+    assert np.abs(corners - expected).max() < 6
+
+
+def test_card_is_warped_upright():
+    image, _ = photo(angle=-10)
+    result = rectify.rectify(image)
+    assert result.found and result.rotation == 0
+    assert result.image.size == rectify.OUTPUT_SIZE
+    assert result.info()['found'] is True
+    # The header lands at the top of the output
+    ink = np.asarray(result.image) < 128
+    band = ink.shape[0] // 4
+    assert ink[:band].mean() > 2 * ink[-band:].mean()
+
+
+@pytest.mark.parametrize('rotate, rotation', [(180, 180), (90, 90), (270, 270)])
+def test_turned_cards_are_turned_back(rotate, rotation):
+    upright = rectify.rectify(photo(angle=5)[0]).image
+    result = rectify.rectify(photo(angle=5, rotate=rotate)[0])
+    assert result.found and result.rotation == rotation
+    diff = np.abs(np.asarray(result.image, dtype=np.int16) - np.asarray(upright, dtype=np.int16))
+    assert diff.mean() < 20
+
+
+def test_a_second_copy_warps_the_same_way():
+    gray, _ = photo(angle=6, rotate=180)
+    found = rectify.rectify(gray)
+    color, rotation = rectify.warp(gray.convert('RGB'), found.corners, found.rotation)
+    assert rotation == found.rotation and color.mode == 'RGB'
+    assert np.array_equal(np.asarray(color.convert('L')), np.asarray(found.image))
+
+
+@pytest.mark.parametrize('image', [
+    Image.new('L', (900, 700), BACKGROUND),
+    # A flat scan that is all card, with nothing around it
+    card().resize((900, 567)),
+    # Something square, not card shaped
+    photo(frame=(900, 700))[0].crop((150, 161, 528, 539)).resize((900, 900)),
+], ids=['blank', 'scan', 'square'])
+def test_no_card_leaves_the_image_alone(image):
+    result = rectify.rectify(image)
+    assert not result.found and result.image is image and result.corners is None
+
+
+def test_small_card_is_ignored():
+    image = Image.new('L', (3000, 2400), BACKGROUND)
+    image.paste(card(), (100, 100))
+    assert rectify.detect(image) is None
@@ -0,0 +1,122 @@
+"""Shared-memory slabs between the API process and process workers"""
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from PIL import Image
+
+import slabs
+from slabs import SlabPool, SlabRef
+
+UPLOAD = bytes(range(256)) * 4096  # 1 MB
+
+
+def digest(data) -> str:
+    # Runs in the worker: reads a memoryview or bytes alike
+    return hashlib.sha256(data).hexdigest()
+
+
+def describe(image: Image.Image, tag: str) -> tuple:
+    return image.mode, image.size, image.getpixel((3, 2)), tag
+
+
+def exists(name: str) -> bool:
+    try:
+        slabs.attach(name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+@pytest.fixture
+def pool():
+    pool = SlabPool(8 << 20, min_share=64 * 1024)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope='module')
+def worker():
+    with ProcessPoolExecutor(1) as executor:
+        yield executor
+
+
+def test_uploads_reach_a_worker_through_a_slab(pool, worker):
+    with pool.share(digest, (UPLOAD,)) as (fn, args):
+        assert isinstance(args[-1], SlabRef) and args[-1].nbytes == len(UPLOAD)
+        assert worker.submit(fn, *args).result() == digest(UPLOAD)
+    assert pool.stats()['shared_bytes'] == len(UPLOAD)
+
+
+def test_images_reach_a_worker_through_a_slab(pool, worker):
+    image = Image.new('RGB', (400, 300), (10, 20, 30))
+    image.putpixel((3, 2), (200, 100, 50))
+    with pool.share(describe, (image, 'card')) as (fn, args):
+        assert isinstance(args[1], SlabRef) and (args[1].mode, args[1].size) == ('RGB', (400, 300))
+        assert worker.submit(fn, *args).result() == ('RGB', (400, 300), (200, 100, 50), 'card')
+
+
+def test_small_and_other_arguments_are_passed_as_they_are(pool):
+    small, palette = b'x' * 1024, Image.new('P', (400, 300))
+    with pool.share(digest, (small, palette, 3)) as (fn, args):
+        assert fn is digest and args == (small, palette, 3)
+    assert pool.stats()['leased'] == 0
+
+
+def test_disabled_pool_changes_nothing():
+    pool = SlabPool(0)
+    assert not pool.enabled
+    with pool.share(digest, (UPLOAD,)) as (fn, args):
+        assert fn is digest and args == (UPLOAD,)
+
+
+def test_slabs_are_reused_after_a_normal_exit(pool):
+    for _ in range(3):
+        with pool.share(digest, (UPLOAD,)) as (fn, args):
+            name = args[-1].name
+    stats = pool.stats()
+    assert (stats['created'], stats['reused'], stats['leased'], stats['free_slabs']) == (1, 2, 0, 1)
+    assert exists(name)
+    pool.close()
+    assert not exists(name)
+
+
+def test_slab_is_unlinked_when_the_job_is_abandoned(pool):
+    with pytest.raises(TimeoutError):
+        with pool.share(digest, (UPLOAD,)) as (fn, args):
+            name = args[-1].name
+            raise TimeoutError
+    assert not exists(name)
+    stats = pool.stats()
+    assert (stats['discarded'], stats['allocated_bytes'], stats['free_slabs']) == (1, 0, 0)
+
+
+def test_arguments_are_pickled_once_the_pool_is_full():
+    pool = SlabPool(2 << 20, min_share=1024)
+    try:
+        with pool.share(digest, (UPLOAD, UPLOAD, UPLOAD)) as (fn, args):
+            # 1 MB slabs: the budget holds two
+            assert [isinstance(arg, SlabRef) for arg in args[1:]] == [True, True, False]
+        assert pool.stats()['fallbacks'] == 1
+    finally:
+        pool.close()
+
+
+def test_slabs_come_in_power_of_two_sizes():
+    assert slabs._size_class(1) == slabs.MIN_SLAB_BYTES
+    assert slabs._size_class(len(UPLOAD)) == len(UPLOAD)
+    assert slabs._size_class(len(UPLOAD) + 1) == 2 * len(UPLOAD)
+
+
+def test_loaded_image_is_backed_by_the_slab(pool):
+    image = Image.new('L', (512, 256), 7)
+    with pool.share(describe, (image,)) as (fn, args):
+        ref = args[-1]
+        loaded = slabs.load(ref)
+        assert loaded.tobytes() == image.tobytes()
+        # Writes through the slab show up in the image: it was not copied
+        writer = slabs.attach(ref.name)
+        writer.buf[0] = 99
+        writer.close()
+        assert loaded.getpixel((0, 0)) == 99
+        del loaded
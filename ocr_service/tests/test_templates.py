@@ -0,0 +1,90 @@
+"""Card layout templates, checked against the genuine samples they were measured on"""
+import numpy as np
+import pytest
+from PIL import Image
+
+import pipeline
+import templates
+from conftest import SERVICE_DIR
+from preprocess import preprocess_region
+
+SAMPLES = SERVICE_DIR.parent / 'ml' / 'data' / 'images'
+SENIOR = templates.get('senior_citizen/v1')
+PWD = templates.get('pwd/v1')
+
+# Boxes that hold printed text on each sample; the PWD holder name is redacted
+PRINTED = [
+    ('senior_genuine_001.jpg', SENIOR, ['header', 'id_number', 'holder_name', 'date_of_birth', 'date_of_issue']),
+    ('pwd_genuine_001.png', PWD, ['header', 'id_number']),
+]
+
+
+def sample(name: str) -> Image.Image:
+    with Image.open(SAMPLES / name) as image:
+        return image.convert('L')
+
+
+def ink(crop: Image.Image) -> np.ndarray:
+    """Share of dark pixels in each row of a prepared crop"""
+    return (np.asarray(crop) < 100).mean(axis=1)
+
+
+@pytest.mark.parametrize('name, template, fields', PRINTED)
+def test_boxes_crop_the_printed_lines(name, template, fields):
+    image = sample(name)
+    assert template.matches_shape(*image.size)
+    for field in fields:
+        box = template.header if field == 'header' else template.fields[field]
+        rows = ink(preprocess_region(image, box.pixels(*image.size)))
+        assert rows.mean() > 0.05, field
+        if template is SENIOR:
+            # Nothing from the line above leaks in at the top of the box
+            assert rows[:len(rows) // 10].max() < 0.02, field
+
+
+def test_boxes_stay_inside_the_card():
+    for template in templates.TEMPLATES.values():
+        for box in [template.header, *template.fields.values()]:
+            assert 0 <= box.x0 < box.x1 <= 1 and 0 <= box.y0 < box.y1 <= 1
+        assert set(template.required) <= set(template.fields)
+
+
+def test_shape():
+    assert not SENIOR.matches_shape(1012, 638)
+    assert PWD.matches_shape(1012, 638) and PWD.matches_shape(638, 1012)
+    assert not PWD.matches_shape(800, 800)
+
+
+def test_match_header():
+    assert templates.match_header('Office of the Senior Citizens Affairs (OSCA)', [PWD, SENIOR]) is SENIOR
+    assert templates.match_header('ENCEPHALITIS AND HYPERTENSION\nTYPE OF DISABILITY', [SENIOR, PWD]) is PWD
+    assert templates.match_header('MUNICIPALITY OF PASIG', [SENIOR, PWD]) is None
+    with pytest.raises(ValueError):
+        templates.get('drivers_license/v1')
+
+
+def test_regions_read_the_matching_layout(tesseract):
+    tesseract.texts = {templates.SINGLE_BLOCK: 'Office of the Senior Citizens Affairs (OSCA)',
+                       templates.SINGLE_LINE: 'RODRIGO P. PANGANIBAN'}
+    # Every field crop gets the same fake text: only the name validates
+    assert pipeline.ocr_regions(sample('senior_genuine_001.jpg')) is None
+    tesseract.calls.clear()
+    # A card no template fits costs only its header crops
+    tesseract.texts[templates.SINGLE_BLOCK] = 'MUNICIPALITY OF PASIG'
+    assert pipeline.ocr_regions(sample('pwd_genuine_001.png')) is None
+    assert tesseract.calls == [templates.SINGLE_BLOCK]
+
+
+def test_regions_fill_fields_from_their_boxes(monkeypatch):
+    read = {SENIOR.header: 'Republic of the Philippines\nOffice of the Senior Citizens Affairs (OSCA)',
+            SENIOR.fields['id_number']: '22135',
+            SENIOR.fields['holder_name']: 'RODRIGO P. PANGANIBAN',
+            SENIOR.fields['date_of_birth']: '11/15/1959',
+            SENIOR.fields['date_of_issue']: '09/30/2021'}
+    monkeypatch.setattr(pipeline, '_run_region',
+                        lambda image, box, deadline=None: pipeline.PassResult(box.psm, read.get(box, ''), 80.0))
+    region = pipeline.ocr_regions(sample('senior_genuine_001.jpg'))
+    assert region.template == 'senior_citizen/v1'
+    assert (region.fields.id_number, region.fields.holder_name) == ('22135', 'RODRIGO P. PANGANIBAN')
+    assert (region.fields.date_of_birth, region.fields.date_of_issue) == ('1959-11-15', '2021-09-30')
+    assert 'ID No.: 22135' in region.text
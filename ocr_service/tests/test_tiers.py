@@ -0,0 +1,115 @@
+"""Load-adaptive quality tiers"""
+import io
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import tiers
+from pipeline import BALANCED, FAST, FULL, PSM_MODES, OCROptions, ocr_bytes
+from tiers import TierGovernor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tiers, 'time', clock)
+    return clock
+
+
+def governor(**kwargs) -> TierGovernor:
+    # Two workers; thresholds of 1 and 3 queued jobs per worker, 5 s and 15 s of latency
+    pool = SimpleNamespace(queue_depth=0, workers=2)
+    return TierGovernor(pool, tiers.AUTO, depths=(1, 3), latencies_ms=(5000, 15000), recover_seconds=10, **kwargs)
+
+
+def test_queue_depth_moves_the_tier_down_at_once(clock):
+    gov = governor()
+    assert gov.current() == FULL
+    gov.pool.queue_depth = 2
+    assert gov.current() == BALANCED
+    gov.pool.queue_depth = 6
+    assert gov.current() == FAST
+    assert gov.stats()['switches'] == 2
+
+
+def test_slow_jobs_move_the_tier_down(clock):
+    gov = governor()
+    gov.observe({'tier': FULL, 'psm': 6}, 6.0)
+    assert gov.current() == BALANCED
+    # Latencies age out of the window
+    clock.now += tiers.LATENCY_WINDOW_SECONDS + 1
+    assert gov.stats()['latency_ms'] == 0
+
+
+def test_recovery_is_one_step_at_a_time_after_a_calm_spell(clock):
+    gov = governor()
+    gov.pool.queue_depth = 6
+    assert gov.current() == FAST
+    gov.pool.queue_depth = 0
+    assert gov.current() == FAST
+    clock.now += 9
+    assert gov.current() == FAST
+    clock.now += 1
+    assert gov.current() == BALANCED
+    clock.now += 9
+    assert gov.current() == BALANCED
+    clock.now += 1
+    assert gov.current() == FULL
+
+
+def test_load_near_the_threshold_holds_the_tier(clock):
+    gov = governor()
+    gov.pool.queue_depth = 2
+    assert gov.current() == BALANCED
+    # 0.6 per worker is under the threshold of 1, but not under half of it
+    gov.pool.queue_depth = 1.2
+    for _ in range(5):
+        clock.now += 10
+        assert gov.current() == BALANCED
+    gov.pool.queue_depth = 0.8
+    gov.current()
+    clock.now += 10
+    assert gov.current() == FULL
+
+
+def test_pinned_mode_ignores_load(clock):
+    gov = TierGovernor(SimpleNamespace(queue_depth=100, workers=1), FULL)
+    assert gov.current() == FULL
+    with pytest.raises(ValueError):
+        TierGovernor(gov.pool, 'turbo')
+
+
+def test_apply_picks_the_psm_that_wins_most(clock):
+    gov = governor()
+    assert gov.apply(OCROptions(), BALANCED).psm == PSM_MODES[0]
+    for psm in (11, 6, 11):
+        gov.observe({'tier': FULL, 'psm': psm}, 0.1)
+    # Degraded reads do not vote
+    gov.observe({'tier': BALANCED, 'psm': 6}, 0.1)
+    gov.observe({'tier': BALANCED, 'psm': 6}, 0.1)
+    options = gov.apply(OCROptions(strategy='first_good'))
+    assert (options.tier, options.psm, options.strategy) == (FULL, None, 'first_good')
+    assert gov.apply(OCROptions(), FAST).psm == 11
+    assert gov.stats()['served'] == {FULL: 3, BALANCED: 2, FAST: 0}
+    with pytest.raises(ValueError):
+        gov.apply(OCROptions(), 'turbo')
+
+
+@pytest.mark.parametrize('tier, passes', [(FULL, len(PSM_MODES)), (BALANCED, 1), (FAST, 1)])
+def test_degraded_tiers_run_a_single_pass(tesseract, tier, passes):
+    buf = io.BytesIO()
+    Image.new('L', (1200, 760), 255).save(buf, 'PNG')
+    output = ocr_bytes(buf.getvalue(), OCROptions(tier=tier, psm=None if tier == FULL else 11))
+    assert output.tier == tier
+    assert len(tesseract.calls) == passes
+    if tier != FULL:
+        assert tesseract.calls == [11] and output.psm == 11
@@ -0,0 +1,104 @@
+"""Leased access to the verifications table"""
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import verifications
+from verifications import COMPLETE, FAILED, PROCESSING, Outcome, SQLiteStore, open_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = open_store(f"sqlite:///{tmp_path / 'verifications.db'}")
+    store.add([(f"v{i}", f"uploads/{i}.jpg") for i in range(5)])
+    yield store
+    store.close()
+
+
+def statuses(store: SQLiteStore) -> dict[str, str]:
+    with store._lock:
+        return dict(store._db.execute('SELECT id, ocr_status FROM verifications'))
+
+
+def test_claims_oldest_pending_rows_once(store):
+    first = store.claim('a', 3, 60, 3)
+    second = store.claim('b', 3, 60, 3)
+    assert [c.id for c in first] == ['v0', 'v1', 'v2']
+    assert [c.id for c in second] == ['v3', 'v4']
+    assert all(c.attempts == 1 for c in first + second)
+    assert store.claim('c', 3, 60, 3) == []
+    assert store.counts() == {PROCESSING: 5}
+
+
+def test_expired_lease_is_claimed_again_then_failed(store):
+    store.claim('a', 5, -1, 2)
+    # The first worker died: its leases have expired
+    again = store.claim('b', 5, -1, 2)
+    assert [c.attempts for c in again] == [2] * 5
+    assert store.claim('c', 5, 60, 2) == []
+    assert store.counts() == {FAILED: 5}
+
+
+def test_only_the_lease_holder_writes_back(store):
+    store.claim('a', 2, -1, 3)
+    # a's leases expired and b took the rows over, along with the rest
+    assert len(store.claim('b', 5, 60, 3)) == 5
+    assert store.finish('a', [Outcome('v0', COMPLETE, 'stale')]) == 0
+    assert store.finish('b', [Outcome('v0', COMPLETE, 'text', id_number='SC-1'),
+                              Outcome('v1', FAILED, error='unreadable')]) == 2
+    assert statuses(store) == {'v0': COMPLETE, 'v1': FAILED, 'v2': PROCESSING, 'v3': PROCESSING,
+                               'v4': PROCESSING}
+
+
+def test_lease_by_id(store):
+    claim = store.lease('a', 'v3', 60)
+    assert claim.id == 'v3' and claim.file_path == 'uploads/3.jpg'
+    assert store.lease('b', 'v3', 60) is None
+    # The holder renews its own lease
+    assert store.lease('a', 'v3', 60).attempts == 2
+    assert store.lease('a', 'missing', 60) is None
+
+
+def test_unsupported_store():
+    with pytest.raises(ValueError):
+        open_store('mysql://localhost/db')
+
+
+class FakeConnection:
+    """psycopg connection that records how many transactions overlap"""
+
+    def __init__(self):
+        self.active = 0
+        self.overlap = 0
+
+    @contextmanager
+    def transaction(self):
+        self.active += 1
+        self.overlap = max(self.overlap, self.active)
+        time.sleep(0.01)
+        try:
+            yield
+        finally:
+            self.active -= 1
+
+    @contextmanager
+    def cursor(self):
+        yield SimpleNamespace(execute=lambda *args: None, executemany=lambda *args: None,
+                              fetchall=lambda: [], fetchone=lambda: None, rowcount=0)
+
+
+def test_postgres_calls_do_not_share_a_transaction(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(verifications, 'psycopg', SimpleNamespace(connect=lambda dsn, autocommit: connection))
+    store = open_store('postgresql://localhost/db')
+    calls = [lambda: store.claim('w', 16, 60, 3), lambda: store.finish('w', [Outcome('v0', COMPLETE)]),
+             lambda: store.lease('w', 'v1', 60), store.counts] * 4
+    threads = [threading.Thread(target=call) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert connection.overlap == 1
@@ -0,0 +1,84 @@
+"""/verify preparation: one color decode split into the OCR page and the classifier thumbnail"""
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import slabs
+import verify
+from classify import INPUT_SIZE
+from conftest import SERVICE_DIR
+from deadline import Deadline
+from decode import plan
+from engines import PassTimeout
+from pipeline import OCROptions
+
+with open(SERVICE_DIR.parent / 'ml' / 'data' / 'images' / 'senior_genuine_001.jpg', 'rb') as f:
+    UPLOAD = f.read()
+
+
+def test_without_a_slab_the_images_come_back():
+    prepared = verify.prepare(UPLOAD, OCROptions(rectify=False))
+    assert prepared.gray.mode == 'L' and prepared.gray.size == prepared.decode_plan.output_size
+    assert prepared.thumbnail.mode == 'RGB' and prepared.thumbnail.size == (INPUT_SIZE, INPUT_SIZE)
+    assert prepared.rectify is None
+
+
+def test_images_are_stored_in_the_output_slab():
+    options = OCROptions(rectify=False)
+    expected = verify.prepare(UPLOAD, options)
+    pool = slabs.SlabPool(64 << 20, min_share=0)
+    try:
+        decode_plan = plan(UPLOAD)
+        with pool.output(verify.output_bytes(decode_plan, options)) as out:
+            prepared = verify.prepare(UPLOAD, options, decode_plan, out)
+            assert isinstance(prepared.gray, slabs.SlabRef) and isinstance(prepared.thumbnail, slabs.SlabRef)
+            # The thumbnail sits after the page in the same slab
+            assert prepared.thumbnail.offset == prepared.gray.nbytes
+            assert pool.image(prepared.gray).tobytes() == expected.gray.tobytes()
+            assert pool.image(prepared.thumbnail).tobytes() == expected.thumbnail.tobytes()
+            # A SlabRef goes on to the next job like a shared argument
+            with pool.share(lambda image: image.size, (prepared.gray,)) as (call, args):
+                assert call(*args) == expected.gray.size
+        assert pool.stats()['outputs'] == 1
+    finally:
+        pool.close()
+
+
+def test_an_image_that_does_not_fit_is_returned():
+    out = slabs.SlabOut('unused', 16)
+    image = Image.new('L', (8, 8))
+    assert slabs.store(out, image) is image
+    assert slabs.store(None, image) is image
+
+
+def test_cost_is_the_color_decode():
+    options = OCROptions(rectify=False)
+    decode_plan = plan(UPLOAD)
+    assert decode_plan.decode_peak_bytes('RGB') > decode_plan.decode_peak_bytes('L')
+    assert verify.estimated_peak_bytes(decode_plan, options) > decode_plan.decode_peak_bytes('RGB')
+    rectified = verify.estimated_peak_bytes(decode_plan, OCROptions(rectify=True))
+    assert rectified > verify.estimated_peak_bytes(decode_plan, options)
+
+
+def test_cancelled_request_is_not_decoded():
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(PassTimeout):
+        verify.prepare(UPLOAD, OCROptions(), deadline=Deadline(30, cancel=cancel))
+
+
+def test_rectify_is_skipped_once_decode_is_behind():
+    options = OCROptions(rectify=True)
+    assert verify.prepare(UPLOAD, options, deadline=Deadline(30)).rectify is not None
+    late = Deadline(30, started_at=time.time() - 20)
+    assert verify.prepare(UPLOAD, options, deadline=late).rectify is None
+
+
+def test_rgb_upload_is_decoded_in_color():
+    buf = io.BytesIO()
+    Image.new('RGB', (600, 380), (200, 30, 30)).save(buf, 'PNG')
+    prepared = verify.prepare(buf.getvalue(), OCROptions(rectify=False))
+    assert prepared.thumbnail.getpixel((10, 10))[0] > 150
@@ -0,0 +1,58 @@
+"""Batch OCR worker: claim -> download -> OCR -> write-back"""
+import asyncio
+
+import pytest
+from PIL import Image
+
+import storage
+from decode import ImageRejected
+from pool import PoolFull, WorkerPool
+from verifications import COMPLETE, FAILED, open_store
+from worker import BatchWorker, FileSource, is_transient
+
+
+@pytest.fixture
+def files(tmp_path):
+    root = tmp_path / 'uploads'
+    root.mkdir()
+    Image.new('RGB', (800, 500), 'white').save(root / 'card.png')
+    (root / 'junk.jpg').write_bytes(b'not an image')
+    return root
+
+
+def test_drains_pending_rows(tmp_path, files, tesseract):
+    store = open_store(f"sqlite:///{tmp_path / 'verifications.db'}")
+    store.add([('good-1', 'card.png'), ('good-2', '/card.png'), ('junk', 'junk.jpg'), ('missing', 'nope.png'),
+               ('escape', '../verifications.db')])
+    pool = WorkerPool(workers=2, max_queue=4, kind='thread')
+    worker = BatchWorker(store, FileSource(str(files)), pool, batch=2, write_batch=2)
+    stats = asyncio.run(worker.run(drain=True))
+    pool.shutdown()
+
+    assert stats['claimed'] == 5
+    assert (stats['complete'], stats['failed'], stats['lost_leases']) == (2, 3, 0)
+    assert store.counts() == {COMPLETE: 2, FAILED: 3}
+    with store._lock:
+        rows = dict(store._db.execute('SELECT id, ocr_text FROM verifications WHERE ocr_status = ?', (COMPLETE,)))
+        number = store._db.execute("SELECT detected_id_number FROM verifications WHERE id = 'good-1'").fetchone()
+    assert rows['good-1'].startswith('REPUBLIC')
+    assert number == ('SC-2025-104392',)
+    store.close()
+
+
+def test_file_source_stays_inside_its_root(files):
+    source = FileSource(str(files))
+    assert asyncio.run(source.fetch('card.png', 10**6))
+    for path, status in (('../uploads/../x', 404), ('missing.png', 404), ('card.png', 413)):
+        with pytest.raises(storage.StorageError) as error:
+            asyncio.run(source.fetch(path, 10**6 if status == 404 else 10))
+        assert error.value.status_code == status
+
+
+def test_transient_failures():
+    assert is_transient(PoolFull(1))
+    assert is_transient(storage.StorageError('bad gateway', 502))
+    assert is_transient(TimeoutError())
+    assert not is_transient(storage.StorageError('not found', 404))
+    assert not is_transient(ImageRejected('undecodable'))
+    assert not is_transient(ValueError())
@@ -0,0 +1,145 @@
+"""Load-adaptive OCR quality tiers.
+
+Every PSM pass on the full preprocess chain is the most accurate read, but
+when the pool is backed up it makes the backlog worse. The governor picks a
+tier per request from how deep the pool queue is (jobs waiting per worker) and
+how long recent OCR jobs took from admission to result:
+
+* ``full``: every PSM pass on the configured preprocess chain
+* ``balanced``: one pass at the PSM that has won most often recently
+* ``fast``: one pass on a downscaled image, with ``OCR_FAST_TESSDATA``
+  models when set
+
+Pressure moves the tier down at once. It only moves back up one step at a
+time, after pressure has stayed below half of the threshold that triggered
+the current tier for ``OCR_TIER_RECOVER_SECONDS``, so the service does not
+flap between tiers at the edge of a threshold. Callers can pin a tier, and
+``OCR_TIER`` set to a tier name turns the governor off.
+"""
+import os
+import time
+from collections import Counter, deque
+from dataclasses import replace
+
+from pipeline import BALANCED, FAST, FULL, PSM_MODES, TIERS, OCROptions
+from pool import WorkerPool
+
+AUTO = 'auto'
+MODE = os.getenv('OCR_TIER', AUTO)
+
+# Queued jobs per worker at which each degraded tier starts
+BALANCED_DEPTH = float(os.getenv('OCR_TIER_BALANCED_DEPTH', '1'))
+FAST_DEPTH = float(os.getenv('OCR_TIER_FAST_DEPTH', '3'))
+# Mean OCR latency over the last LATENCY_WINDOW_SECONDS at which each degraded tier starts
+BALANCED_LATENCY_MS = float(os.getenv('OCR_TIER_BALANCED_LATENCY_MS', '5000'))
+FAST_LATENCY_MS = float(os.getenv('OCR_TIER_FAST_LATENCY_MS', '15000'))
+RECOVER_SECONDS = float(os.getenv('OCR_TIER_RECOVER_SECONDS', '10'))
+LATENCY_WINDOW_SECONDS = 30.0
+
+# Full-tier winning PSMs remembered when picking the single-pass PSM
+PSM_WINDOW = 200
+
+
+class TierGovernor:
+    def __init__(self, pool: WorkerPool, mode: str = MODE,
+                 depths: tuple[float, float] = (BALANCED_DEPTH, FAST_DEPTH),
+                 latencies_ms: tuple[float, float] = (BALANCED_LATENCY_MS, FAST_LATENCY_MS),
+                 recover_seconds: float = RECOVER_SECONDS):
+        if mode != AUTO and mode not in TIERS:
+            raise ValueError(f"OCR_TIER must be {AUTO} or one of {', '.join(TIERS)}")
+        self.pool = pool
+        self.mode = mode
+        # Entry thresholds for TIERS[1:], in order
+        self.depths = depths
+        self.latencies_ms = latencies_ms
+        self.recover_seconds = recover_seconds
+        self.level = 0 if mode == AUTO else TIERS.index(mode)
+        self.changed_at = time.monotonic()
+        self.switches = 0
+        self.served = Counter()
+        self._calm_since: float | None = None
+        # (monotonic time, ms) of recent OCR jobs
+        self._latencies: deque[tuple[float, float]] = deque()
+        self._winners: deque[int] = deque(maxlen=PSM_WINDOW)
+
+    def _latency_ms(self, now: float) -> float:
+        while self._latencies and now - self._latencies[0][0] > LATENCY_WINDOW_SECONDS:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        return sum(ms for _, ms in self._latencies) / len(self._latencies)
+
+    def _pressure(self, depth: float, latency_ms: float) -> int:
+        """Tier level the given load calls for"""
+        level = 0
+        for i, (max_depth, max_latency) in enumerate(zip(self.depths, self.latencies_ms), start=1):
+            if depth >= max_depth or latency_ms >= max_latency:
+                level = i
+        return level
+
+    def current(self) -> str:
+        """The tier for a request arriving now"""
+        if self.mode != AUTO:
+            return self.mode
+        now = time.monotonic()
+        depth = self.pool.queue_depth / self.pool.workers
+        latency_ms = self._latency_ms(now)
+        target = self._pressure(depth, latency_ms)
+        if target > self.level:
+            self._switch(target, now)
+        elif target < self.level:
+            # Doubling the load must still not reach the current tier before stepping back up
+            if self._pressure(2 * depth, 2 * latency_ms) >= self.level:
+                self._calm_since = None
+            elif self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.recover_seconds:
+                self._switch(self.level - 1, now)
+                # Load was already calm at the switch; the next step up counts from here
+                self._calm_since = now
+        else:
+            self._calm_since = None
+        return TIERS[self.level]
+
+    def _switch(self, level: int, now: float) -> None:
+        self.level = level
+        self.changed_at = now
+        self.switches += 1
+        self._calm_since = None
+
+    def best_psm(self) -> int:
+        """The PSM that won most full-tier reads recently, or the first of PSM_MODES"""
+        if not self._winners:
+            return PSM_MODES[0]
+        return Counter(self._winners).most_common(1)[0][0]
+
+    def apply(self, options: OCROptions, tier: str | None = None) -> OCROptions:
+        """``options`` at a pinned ``tier``, or at the tier the current load calls for"""
+        tier = tier or self.current()
+        if tier not in TIERS:
+            raise ValueError(f"tier must be one of {', '.join(TIERS)}")
+        return replace(options, tier=tier, psm=None if tier == FULL else self.best_psm())
+
+    def observe(self, result: dict, seconds: float) -> None:
+        """Record one computed result and how long it took from admission"""
+        self._latencies.append((time.monotonic(), seconds * 1000))
+        self.served[result.get('tier') or FULL] += 1
+        if result.get('tier') == FULL and result.get('psm') is not None:
+            self._winners.append(result['psm'])
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "mode": self.mode,
+            "tier": TIERS[self.level],
+            "tier_seconds": round(now - self.changed_at, 1),
+            "switches": self.switches,
+            "depth_per_worker": round(self.pool.queue_depth / self.pool.workers, 2),
+            "latency_ms": round(self._latency_ms(now), 1),
+            "best_psm": self.best_psm(),
+            "served": {tier: self.served[tier] for tier in TIERS},
+            "thresholds": {
+                BALANCED: {"depth": self.depths[0], "latency_ms": self.latencies_ms[0]},
+                FAST: {"depth": self.depths[1], "latency_ms": self.latencies_ms[1]},
+            },
+        }
@@ -0,0 +1,229 @@
+"""Leased access to the ``verifications`` table for the batch OCR worker.
+
+Rows move ``pending`` -> ``processing`` -> ``complete`` / ``failed``. A claim
+takes up to N rows at once and leases them to one worker until
+``ocr_lease_until``; rows whose lease expired (the worker died) are claimable
+again, and rows that keep expiring are failed after ``max_attempts`` claims.
+Single rows can also be leased by ID, for jobs pushed to the service instead
+of polled. Results are written back in one transaction per batch, and only
+for rows the writer still holds the lease on.
+
+Postgres (``postgresql://...``, e.g. the Supabase database) claims with
+``FOR UPDATE SKIP LOCKED`` so several workers never contend for the same
+rows. SQLite (``sqlite:///path``) is a local stand-in: ``BEGIN IMMEDIATE``
+serializes claims instead. The Postgres columns this needs are added by
+``supabase/migrations/20261017000000_ocr_worker_lease.sql``.
+"""
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    import psycopg
+except ImportError:  # optional: only needed against Postgres
+    psycopg = None
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+
+@dataclass
+class Claim:
+    id: str
+    file_path: str
+    attempts: int
+
+
+@dataclass
+class Outcome:
+    id: str
+    status: str
+    text: str | None = None
+    id_number: str | None = None
+    holder_name: str | None = None
+    id_type: str | None = None
+    error: str | None = None
+
+
+class SQLiteStore:
+    """Local stand-in for the verifications table"""
+
+    SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS verifications (
+            id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            created_at REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0),
+            ocr_status TEXT NOT NULL DEFAULT '{PENDING}',
+            ocr_text TEXT,
+            detected_id_number TEXT,
+            detected_holder_name TEXT,
+            detected_id_type TEXT,
+            ocr_attempts INTEGER NOT NULL DEFAULT 0,
+            ocr_lease_until REAL,
+            ocr_leased_by TEXT,
+            ocr_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS verifications_ocr_queue ON verifications (ocr_status, created_at);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(self.SCHEMA)
+        # Claims and writes run on worker threads; one connection runs one transaction at a time
+        self._lock = threading.Lock()
+
+    def add(self, rows: list[tuple[str, str]]) -> None:
+        """Insert pending ``(id, file_path)`` rows, for local testing"""
+        with self._lock, self._db:
+            self._db.executemany('INSERT INTO verifications (id, file_path) VALUES (?, ?)', rows)
+
+    def claim(self, worker: str, limit: int, lease_seconds: float, max_attempts: int) -> list[Claim]:
+        now = time.time()
+        db = self._db
+        with self._lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute(
+                    "UPDATE verifications SET ocr_status = ?, ocr_error = 'lease expired', ocr_leased_by = NULL "
+                    "WHERE ocr_status = ? AND ocr_lease_until < ? AND ocr_attempts >= ?",
+                    (FAILED, PROCESSING, now, max_attempts),
+                )
+                rows = db.execute(
+                    "UPDATE verifications SET ocr_status = ?, ocr_leased_by = ?, ocr_lease_until = ?, "
+                    "ocr_attempts = ocr_attempts + 1 "
+                    "WHERE id IN (SELECT id FROM verifications "
+                    "             WHERE ocr_status = ? OR (ocr_status = ? AND ocr_lease_until < ?) "
+                    "             ORDER BY created_at LIMIT ?) "
+                    "RETURNING id, file_path, ocr_attempts",
+                    (PROCESSING, worker, now + lease_seconds, PENDING, PROCESSING, now, limit),
+                ).fetchall()
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return [Claim(*row) for row in rows]
+
+    def lease(self, worker: str, id: str, lease_seconds: float) -> Claim | None:
+        """Lease one pending row (or renew ``worker``'s own lease on it)"""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "UPDATE verifications SET ocr_status = ?, ocr_leased_by = ?, ocr_lease_until = ?, "
+                "ocr_attempts = ocr_attempts + 1 "
+                "WHERE id = ? AND (ocr_status = ? "
+                "                  OR (ocr_status = ? AND (ocr_lease_until < ? OR ocr_leased_by = ?))) "
+                "RETURNING id, file_path, ocr_attempts",
+                (PROCESSING, worker, now + lease_seconds, id, PENDING, PROCESSING, now, worker),
+            ).fetchone()
+        return Claim(*row) if row else None
+
+    def finish(self, worker: str, outcomes: list[Outcome]) -> int:
+        db = self._db
+        with self._lock:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                before = db.total_changes
+                db.executemany(
+                    "UPDATE verifications SET ocr_status = ?, ocr_text = ?, "
+                    "detected_id_number = COALESCE(?, detected_id_number), "
+                    "detected_holder_name = COALESCE(?, detected_holder_name), "
+                    "detected_id_type = COALESCE(?, detected_id_type), "
+                    "ocr_error = ?, ocr_lease_until = NULL, ocr_leased_by = NULL "
+                    "WHERE id = ? AND ocr_leased_by = ?",
+                    [(o.status, o.text, o.id_number, o.holder_name, o.id_type, o.error, o.id, worker)
+                     for o in outcomes],
+                )
+                written = db.total_changes - before
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return written
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute('SELECT ocr_status, count(*) FROM verifications GROUP BY ocr_status'))
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class PostgresStore:
+    def __init__(self, dsn: str):
+        if psycopg is None:
+            raise RuntimeError("psycopg is required for a Postgres verifications store")
+        # Each call runs in its own transaction() block
+        self._db = psycopg.connect(dsn, autocommit=True)
+        # Claims and writes run on worker threads; a transaction() block owns the connection until it ends
+        self._lock = threading.Lock()
+
+    def claim(self, worker: str, limit: int, lease_seconds: float, max_attempts: int) -> list[Claim]:
+        with self._lock, self._db.transaction(), self._db.cursor() as cur:
+            cur.execute(
+                "UPDATE verifications SET ocr_status = %s, ocr_error = 'lease expired', ocr_leased_by = NULL "
+                "WHERE ocr_status = %s AND ocr_lease_until < now() AND ocr_attempts >= %s",
+                (FAILED, PROCESSING, max_attempts),
+            )
+            cur.execute(
+                "UPDATE verifications v SET ocr_status = %(processing)s, ocr_leased_by = %(worker)s, "
+                "ocr_lease_until = now() + make_interval(secs => %(lease)s), ocr_attempts = v.ocr_attempts + 1 "
+                "WHERE v.id IN (SELECT id FROM verifications "
+                "               WHERE ocr_status = %(pending)s "
+                "                  OR (ocr_status = %(processing)s AND ocr_lease_until < now()) "
+                "               ORDER BY created_at LIMIT %(limit)s "
+                "               FOR UPDATE SKIP LOCKED) "
+                "RETURNING v.id::text, v.file_path, v.ocr_attempts",
+                {'processing': PROCESSING, 'pending': PENDING, 'worker': worker, 'lease': lease_seconds,
+                 'limit': limit},
+            )
+            return [Claim(*row) for row in cur.fetchall()]
+
+    def lease(self, worker: str, id: str, lease_seconds: float) -> Claim | None:
+        with self._lock, self._db.transaction(), self._db.cursor() as cur:
+            cur.execute(
+                "UPDATE verifications SET ocr_status = %(processing)s, ocr_leased_by = %(worker)s, "
+                "ocr_lease_until = now() + make_interval(secs => %(lease)s), ocr_attempts = ocr_attempts + 1 "
+                "WHERE id = %(id)s AND (ocr_status = %(pending)s "
+                "                       OR (ocr_status = %(processing)s "
+                "                           AND (ocr_lease_until < now() OR ocr_leased_by = %(worker)s))) "
+                "RETURNING id::text, file_path, ocr_attempts",
+                {'processing': PROCESSING, 'pending': PENDING, 'worker': worker, 'lease': lease_seconds, 'id': id},
+            )
+            row = cur.fetchone()
+            return Claim(*row) if row else None
+
+    def finish(self, worker: str, outcomes: list[Outcome]) -> int:
+        with self._lock, self._db.transaction(), self._db.cursor() as cur:
+            # executemany pipelines the statements: one round trip for the batch
+            cur.executemany(
+                "UPDATE verifications SET ocr_status = %s, ocr_text = %s, "
+                "detected_id_number = COALESCE(%s, detected_id_number), "
+                "detected_holder_name = COALESCE(%s, detected_holder_name), "
+                "detected_id_type = COALESCE(%s, detected_id_type), "
+                "ocr_error = %s, ocr_lease_until = NULL, ocr_leased_by = NULL "
+                "WHERE id = %s AND ocr_leased_by = %s",
+                [(o.status, o.text, o.id_number, o.holder_name, o.id_type, o.error, o.id, worker) for o in outcomes],
+            )
+            return cur.rowcount
+
+    def counts(self) -> dict[str, int]:
+        with self._lock, self._db.transaction(), self._db.cursor() as cur:
+            cur.execute('SELECT ocr_status, count(*) FROM verifications GROUP BY ocr_status')
+            return dict(cur.fetchall())
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def open_store(url: str):
+    """``sqlite:///path/to.db`` or a ``postgresql://`` DSN"""
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresStore(url)
+    raise ValueError(f"Unsupported verifications store: {url}")
@@ -0,0 +1,78 @@
+"""Single-decode preparation for /verify.
+
+The upload is decoded once, in color, at OCR resolution. Both consumers are
+cut from that one buffer: the grayscale image for the OCR pipeline and the
+small RGB thumbnail for the classifier, so the two can run side by side.
+In a process worker both are written into an output slab the API process
+leased for the request, so the page goes on to the OCR job without being
+pickled back and forth.
+"""
+import time
+from dataclasses import dataclass
+from PIL import Image
+
+import quality
+import slabs
+from classify import INPUT_SIZE, thumbnail
+from deadline import Deadline
+from decode import DecodePlan, decode
+from engines import PassTimeout
+from pipeline import OCROptions
+from rectify import OUTPUT_SIZE, rectify, warp
+from slabs import SlabOut, SlabRef
+
+
+@dataclass
+class Prepared:
+    # SlabRefs into the request's output slab, or the images themselves without one
+    gray: Image.Image | SlabRef
+    decode_plan: DecodePlan
+    thumbnail: Image.Image | SlabRef
+    quality: dict | None
+    rectify: dict | None
+    seconds: float
+
+
+def output_bytes(decode_plan: DecodePlan, options: OCROptions) -> int:
+    """Room prepare() needs in an output slab: the grayscale page, then the thumbnail"""
+    w, h = decode_plan.output_size
+    page = max(w * h, OUTPUT_SIZE[0] * OUTPUT_SIZE[1] if options.rectify else 0)
+    return page + INPUT_SIZE * INPUT_SIZE * 3
+
+
+def estimated_peak_bytes(decode_plan: DecodePlan, options: OCROptions) -> int:
+    """Pool cost of prepare(): the color decode, its grayscale copy and the rectified card"""
+    w, h = decode_plan.output_size
+    rectified = OUTPUT_SIZE[0] * OUTPUT_SIZE[1] * 4 if options.rectify else 0
+    return decode_plan.decode_peak_bytes('RGB') + w * h + rectified
+
+
+def prepare(image_bytes: bytes, options: OCROptions, decode_plan: DecodePlan | None = None,
+            out: SlabOut | None = None, deadline: Deadline | None = None) -> Prepared:
+    """Decode, gate and (optionally) rectify once, then split into OCR and CNN inputs (blocking)"""
+    started = time.perf_counter()
+    if deadline is not None and deadline.cancelled():
+        raise PassTimeout("Request cancelled")
+    image, decode_plan = decode(image_bytes, mode='RGB', decode_plan=decode_plan)
+    gray = image.convert('L')
+    verdict = quality.check(gray)
+    rectified = None
+    # Rectifying is optional: once decoding has used up its share of the budget, the time goes to OCR
+    if options.rectify and not (deadline and deadline.behind('decode')):
+        # Detection runs on the grayscale copy; the same corners warp the color image
+        rectified = rectify(gray)
+        if rectified.found:
+            image, _ = warp(image, rectified.corners, rectified.rotation)
+            gray = rectified.image
+    small = thumbnail(image)
+    del image
+    gray = slabs.store(out, gray)
+    small = slabs.store(out, small, offset=gray.nbytes if isinstance(gray, SlabRef) else 0)
+    return Prepared(
+        gray=gray,
+        decode_plan=decode_plan,
+        thumbnail=small,
+        quality=verdict.to_dict() if verdict else None,
+        rectify=rectified.info() if rectified else None,
+        seconds=time.perf_counter() - started,
+    )
@@ -0,0 +1,126 @@
+"""Warm startup and readiness.
+
+A fresh instance used to take traffic as soon as uvicorn bound its port. The
+first requests then paid for loading Tesseract's language data in every
+worker, and with the classifier enabled for the TensorFlow import and the
+first trace, several seconds each. Now the lifespan starts a warm-up in the
+background:
+
+* the classifier loads and traces its model
+* every worker reads a synthetic card through the whole pipeline (decode,
+  quality gate, rectification, preprocessing, template and full-page OCR,
+  field extraction) at each quality tier. Each worker process loads both
+  the default and the fast Tesseract models.
+
+``/ready`` answers 503 until that finishes, so a deploy health check only
+routes traffic to a warm instance. ``/health`` stays a liveness check and
+answers right away.
+"""
+import asyncio
+import io
+import logging
+import os
+import time
+from PIL import Image, ImageDraw, ImageFont
+
+from pipeline import FAST, FULL, OCROptions, ocr_bytes
+from pool import INTERACTIVE, WorkerPool
+
+logger = logging.getLogger("ocr_service")
+
+ENABLED = os.getenv('OCR_WARMUP', 'on') != 'off'
+# A warm-up that has not finished by then marks the instance failed
+TIMEOUT_SECONDS = float(os.getenv('OCR_WARMUP_TIMEOUT_SECONDS', '300'))
+
+PENDING = 'pending'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+
+# Fictitious holder; the layout only needs to exercise each pipeline stage
+_CARD_LINES = [
+    ('', 'REPUBLIC OF THE PHILIPPINES'),
+    ('', 'Office of Senior Citizens Affairs'),
+    ('', 'Pasig City'),
+    ('Name:', 'JUAN DELA CRUZ'),
+    ('Address:', '123 Sample St., Pasig City'),
+    ('Date of Birth:', '1959-11-15'),
+    ('ID No.:', 'SC-2025-000000'),
+    ('Date of Issue:', '2025-01-06'),
+]
+
+
+def synthetic_card(size: tuple[int, int] = (1012, 638)) -> bytes:
+    """A JPEG of a plain ID card, sharp and evenly lit enough to pass the quality gate"""
+    image = Image.new('RGB', size, (236, 240, 232))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    value_x = int(size[0] * 0.30)
+    for i, (label, value) in enumerate(_CARD_LINES):
+        y = 40 + 60 * i
+        if label:
+            draw.text((60, y), label, fill=(20, 20, 20), font=font)
+            draw.text((value_x, y), value, fill=(20, 20, 20), font=font)
+        else:
+            draw.text((60, y), value, fill=(20, 20, 20), font=font)
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+
+async def warm_workers(pool: WorkerPool) -> None:
+    """Run the synthetic card once per worker at the full and fast tiers"""
+    card = await asyncio.to_thread(synthetic_card)
+    for tier in (FULL, FAST):
+        options = OCROptions.create(extract=True, tier=tier)
+        # One job per worker at once, so each worker process takes one
+        await asyncio.gather(*(pool.run(ocr_bytes, card, options, lane=INTERACTIVE) for _ in range(pool.workers)))
+
+
+class Warmup:
+    """Runs the warm-up steps in order and reports readiness"""
+
+    def __init__(self, enabled: bool = ENABLED, timeout: float = TIMEOUT_SECONDS):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.state = PENDING
+        self.error: str | None = None
+        # Milliseconds per finished step
+        self.steps: dict[str, float] = {}
+        self.started_at: float | None = None
+        self.ready_at: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    async def run(self, steps: list[tuple[str, object]]) -> None:
+        """Await each ``(name, coroutine function)`` in turn, then mark the instance ready"""
+        self.state = WARMING
+        self.started_at = time.time()
+        try:
+            await asyncio.wait_for(self._run(steps), self.timeout)
+        except Exception as exc:
+            self.state = FAILED
+            self.error = f"{type(exc).__name__}: {exc}" if str(exc) else type(exc).__name__
+            logger.exception("Warm-up failed; /ready stays 503")
+            return
+        self.state = READY
+        self.ready_at = time.time()
+        logger.info("Warm-up finished in %.1f s: %s", self.ready_at - self.started_at, self.steps)
+
+    async def _run(self, steps: list[tuple[str, object]]) -> None:
+        for name, step in steps:
+            started = time.perf_counter()
+            await step()
+            self.steps[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'enabled': self.enabled,
+            'error': self.error,
+            'steps_ms': self.steps,
+            'started_at': self.started_at,
+            'ready_at': self.ready_at,
+        }
@@ -0,0 +1,274 @@
+"""Long-running batch OCR worker for pending verifications.
+
+Replaces one-row-per-cron-tick processing in the ``ocr-worker`` edge
+function. The worker claims up to ``OCR_WORKER_BATCH`` pending rows at a time
+(leased, see ``verifications.py``) and streams them through bounded stages:
+
+    claim -> download -> OCR + field extraction -> bulk write-back
+
+Each stage is a set of tasks joined by bounded queues, so downloads overlap
+OCR and a slow stage pushes back on the one before it instead of piling up
+claimed rows. Transient failures (storage 5xx, timeouts, a full pool) are
+retried with exponential backoff and jitter; anything else fails the row.
+
+Run from ``ocr_service/``:
+
+    OCR_WORKER_DB=postgresql://... python worker.py
+    OCR_WORKER_DB=sqlite:///local.db OCR_WORKER_FILES_DIR=./uploads python worker.py --drain
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import time
+import uuid
+from pathlib import Path
+
+# First, so the worker count and thread limits are pinned before Tesseract loads
+import concurrency  # noqa: F401
+import engines
+import storage
+from decode import MAX_UPLOAD_BYTES, ImageRejected, plan as plan_decode
+from pipeline import OCROptions, ocr_bytes
+from pool import WORKER, PoolFull, WorkerPool
+from verifications import COMPLETE, FAILED, Claim, Outcome, open_store
+
+logger = logging.getLogger("ocr_service.worker")
+
+# sqlite:///path or a Postgres DSN (the Supabase database URL)
+STORE_URL = os.getenv('OCR_WORKER_DB', os.getenv('DATABASE_URL', ''))
+# Read images from this directory instead of the storage bucket (local testing)
+FILES_DIR = os.getenv('OCR_WORKER_FILES_DIR', '')
+
+CLAIM_BATCH = int(os.getenv('OCR_WORKER_BATCH', '16'))
+LEASE_SECONDS = float(os.getenv('OCR_WORKER_LEASE_SECONDS', '300'))
+# Claims per row before a row whose lease keeps expiring is failed
+MAX_ATTEMPTS = int(os.getenv('OCR_WORKER_MAX_ATTEMPTS', '3'))
+# In-process retries of a transient failure, with delays of base * 2^n (+/- 50% jitter)
+RETRIES = int(os.getenv('OCR_WORKER_RETRIES', '4'))
+RETRY_BASE_SECONDS = float(os.getenv('OCR_WORKER_RETRY_BASE', '0.5'))
+DOWNLOADS = int(os.getenv('OCR_WORKER_DOWNLOADS', '8'))
+WRITE_BATCH = int(os.getenv('OCR_WORKER_WRITE_BATCH', '32'))
+FLUSH_SECONDS = float(os.getenv('OCR_WORKER_FLUSH_SECONDS', '1'))
+IDLE_SECONDS = float(os.getenv('OCR_WORKER_IDLE_SECONDS', '2'))
+
+
+class FileSource:
+    """Filesystem stand-in for the storage bucket"""
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def _read(self, path: str, max_bytes: int) -> bytes:
+        full = (self.root / path.lstrip('/')).resolve()
+        if not full.is_relative_to(self.root) or not full.is_file():
+            raise storage.StorageError(f"{path} not found", 404)
+        if full.stat().st_size > max_bytes:
+            raise storage.StorageError(f"{path} is larger than {max_bytes} bytes", 413)
+        return full.read_bytes()
+
+    async def fetch(self, path: str, max_bytes: int) -> bytes:
+        return await asyncio.to_thread(self._read, path, max_bytes)
+
+
+def is_transient(exc: Exception) -> bool:
+    if isinstance(exc, PoolFull):
+        return True
+    if isinstance(exc, storage.StorageError):
+        return exc.status_code >= 500
+    if isinstance(exc, ImageRejected):
+        return False
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+class BatchWorker:
+    def __init__(self, store, source, pool: WorkerPool, options: OCROptions | None = None,
+                 batch: int = CLAIM_BATCH, downloads: int = DOWNLOADS, write_batch: int = WRITE_BATCH):
+        self.store = store
+        self.source = source
+        self.pool = pool
+        self.options = options or OCROptions.create(extract=True)
+        self.batch = max(1, batch)
+        self.downloads = max(1, downloads)
+        self.write_batch = max(1, write_batch)
+        # Rows claimed but not written back; claims stop at twice the batch
+        self.capacity = 2 * self.batch
+        self.in_flight = 0
+        self.id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.counters = {'claimed': 0, 'complete': 0, 'failed': 0, 'retries': 0, 'lost_leases': 0}
+        self._stop: asyncio.Event | None = None
+        self._room: asyncio.Condition | None = None
+
+    def stop(self) -> None:
+        if self._stop:
+            self._stop.set()
+
+    async def _retrying(self, fn, *args):
+        for attempt in range(RETRIES + 1):
+            try:
+                return await fn(*args)
+            except Exception as exc:
+                if attempt == RETRIES or not is_transient(exc):
+                    raise
+                delay = exc.retry_after if isinstance(exc, PoolFull) else RETRY_BASE_SECONDS * 2 ** attempt
+                self.counters['retries'] += 1
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def _ocr(self, data: bytes):
+        cost = plan_decode(data).estimated_peak_bytes(self.options.preprocess)
+        return await self.pool.run(ocr_bytes, data, self.options, cost=cost, lane=WORKER)
+
+    def _failed(self, claim: Claim, exc: Exception) -> Outcome:
+        logger.warning("Verification %s failed: %s", claim.id, exc)
+        return Outcome(claim.id, FAILED, error=str(exc)[:500])
+
+    async def _claim(self, downloads: asyncio.Queue, drain: bool) -> None:
+        while not self._stop.is_set():
+            async with self._room:
+                await self._room.wait_for(lambda: self.in_flight < self.capacity)
+                room = self.capacity - self.in_flight
+            claims = await self._retrying(
+                asyncio.to_thread, self.store.claim, self.id, min(self.batch, room), LEASE_SECONDS, MAX_ATTEMPTS)
+            if not claims:
+                if drain:
+                    if self.in_flight == 0:
+                        return
+                    # Claim once more after the in-flight rows are written, then stop
+                    async with self._room:
+                        await self._room.wait_for(lambda: self.in_flight == 0)
+                    continue
+                try:
+                    await asyncio.wait_for(self._stop.wait(), IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.in_flight += len(claims)
+            self.counters['claimed'] += len(claims)
+            for claim in claims:
+                await downloads.put(claim)
+
+    async def _download(self, downloads: asyncio.Queue, recognize: asyncio.Queue, results: asyncio.Queue) -> None:
+        while (claim := await downloads.get()) is not None:
+            try:
+                data = await self._retrying(self.source.fetch, claim.file_path, MAX_UPLOAD_BYTES)
+            except Exception as exc:
+                await results.put(self._failed(claim, exc))
+                continue
+            await recognize.put((claim, data))
+
+    async def _recognize(self, recognize: asyncio.Queue, results: asyncio.Queue) -> None:
+        while (item := await recognize.get()) is not None:
+            claim, data = item
+            try:
+                output = await self._retrying(self._ocr, data)
+            except Exception as exc:
+                await results.put(self._failed(claim, exc))
+                continue
+            fields = output.fields or {}
+            await results.put(Outcome(
+                claim.id, COMPLETE, output.text,
+                id_number=fields.get('id_number'),
+                holder_name=fields.get('holder_name'),
+                id_type=fields.get('id_type'),
+            ))
+
+    async def _flush(self, outcomes: list[Outcome]) -> None:
+        started = time.perf_counter()
+        try:
+            written = await self._retrying(asyncio.to_thread, self.store.finish, self.id, outcomes)
+        except Exception:
+            # The leases expire and another claim picks these rows up again
+            logger.exception("Write-back of %d results failed", len(outcomes))
+            written = 0
+        else:
+            complete = sum(o.status == COMPLETE for o in outcomes)
+            self.counters['complete'] += complete
+            self.counters['failed'] += len(outcomes) - complete
+            # Rows whose lease expired and went to another worker are not overwritten
+            self.counters['lost_leases'] += len(outcomes) - written
+            logger.info("Wrote %d results (%d complete, %d failed) in %.0f ms",
+                        written, complete, len(outcomes) - complete, (time.perf_counter() - started) * 1000)
+        async with self._room:
+            self.in_flight -= len(outcomes)
+            self._room.notify_all()
+
+    async def _write(self, results: asyncio.Queue) -> None:
+        pending: list[Outcome] = []
+        while True:
+            try:
+                outcome = await asyncio.wait_for(results.get(), FLUSH_SECONDS if pending else None)
+            except asyncio.TimeoutError:
+                await self._flush(pending)
+                pending = []
+                continue
+            if outcome is None:
+                if pending:
+                    await self._flush(pending)
+                return
+            pending.append(outcome)
+            if len(pending) >= self.write_batch:
+                await self._flush(pending)
+                pending = []
+
+    async def run(self, drain: bool = False) -> dict:
+        """Process rows until stopped (or, with ``drain``, until none are pending)"""
+        self._stop = asyncio.Event()
+        self._room = asyncio.Condition()
+        downloads = asyncio.Queue(maxsize=self.batch)
+        recognize = asyncio.Queue(maxsize=self.pool.workers)
+        results = asyncio.Queue()
+
+        writer = asyncio.create_task(self._write(results))
+        downloaders = [asyncio.create_task(self._download(downloads, recognize, results))
+                       for _ in range(self.downloads)]
+        recognizers = [asyncio.create_task(self._recognize(recognize, results)) for _ in range(self.pool.workers)]
+        started = time.perf_counter()
+        try:
+            await self._claim(downloads, drain)
+        finally:
+            # Let everything already claimed finish, stage by stage
+            for _ in downloaders:
+                await downloads.put(None)
+            await asyncio.gather(*downloaders)
+            for _ in recognizers:
+                await recognize.put(None)
+            await asyncio.gather(*recognizers)
+            await results.put(None)
+            await writer
+        elapsed = time.perf_counter() - started
+        return {**self.counters, 'seconds': round(elapsed, 2),
+                'per_second': round((self.counters['complete'] + self.counters['failed']) / elapsed, 2)}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', default=STORE_URL, help='sqlite:///path or Postgres DSN (OCR_WORKER_DB)')
+    parser.add_argument('--files', default=FILES_DIR, help='read images from this directory (OCR_WORKER_FILES_DIR)')
+    parser.add_argument('--drain', action='store_true', help='exit once no rows are pending')
+    args = parser.parse_args()
+    if not args.store:
+        parser.error("set OCR_WORKER_DB (or DATABASE_URL) or pass --store")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    store = open_store(args.store)
+    source = FileSource(args.files) if args.files else storage
+    pool = WorkerPool.from_env(initializer=engines.warm)
+    worker = BatchWorker(store, source, pool)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    logger.info("Worker %s started: batch=%d workers=%d", worker.id, worker.batch, pool.workers)
+    try:
+        summary = await worker.run(drain=args.drain)
+    finally:
+        pool.shutdown()
+        store.close()
+    logger.info("Worker %s stopped: %s", worker.id, summary)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
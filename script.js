@@ -461,6 +461,8 @@ async function processFile(file) {
             status: 'processing',
             ocr_status: 'pending'  // Mark for OCR processing
         };
+        // Key for the OCR service's completion events; only its hash is stored on the row
+        const ocrEventsKey = await createOCREventsKey(verificationData);
         
         console.log('Creating verification record:', verificationData);
         const verification = await window.supabaseClient.createVerification(verificationData);
@@ -545,7 +547,7 @@ async function processFile(file) {
             showNotification('CNN analysis complete. Waiting for OCR processing...', 'info');
             
             // Start polling for OCR results (will call displayResults when complete)
-            startOCRPolling(verification.id);
+            startOCRPolling(verification.id, ocrEventsKey);
         } catch (cnnErr) {
             console.error('CNN analysis failed:', cnnErr);
             await window.supabaseClient.updateVerification(verification.id, {
@@ -814,14 +816,73 @@ function updateVerificationSteps(activeStep, status = 'active') {
     });
 }
 
-// Poll for OCR results (fallback if realtime doesn't work)
+// Wait for OCR results: completion event from the OCR service, or polling as the fallback
 let ocrPollingInterval = null;
+let ocrEventSource = null;
+let ocrIdleTimer = null;
+// A stream with no event by then gets one status read, in case the row was never
+// ingested (webhook missing or failed) and no event will ever come. Each further
+// read while the stream stays open waits twice as long, up to the cap.
+const OCR_EVENTS_IDLE_MS = 20000;
+const OCR_EVENTS_IDLE_MAX_MS = 160000;
+
+// Random key proving this page uploaded the verification; sets its SHA-256 on the new row
+async function createOCREventsKey(verificationData) {
+    if (!window.CONFIG?.ocr?.url || !window.crypto?.subtle || typeof EventSource === 'undefined') {
+        return null;
+    }
+    const toHex = bytes => Array.from(new Uint8Array(bytes), b => b.toString(16).padStart(2, '0')).join('');
+    const key = toHex(crypto.getRandomValues(new Uint8Array(32)));
+    verificationData.ocr_events_key_hash = toHex(await crypto.subtle.digest('SHA-256', new TextEncoder().encode(key)));
+    return key;
+}
 
-function startOCRPolling(verificationId) {
-    // Clear any existing polling
+// Subscribe to the OCR service's completion event; returns false when it is not configured
+function subscribeToOCR(verificationId, eventsKey, onComplete, onUnavailable) {
+    const baseUrl = window.CONFIG?.ocr?.url;
+    if (!baseUrl || !eventsKey || typeof EventSource === 'undefined') {
+        return false;
+    }
+    
+    const close = () => {
+        if (ocrEventSource) {
+            ocrEventSource.close();
+            ocrEventSource = null;
+        }
+    };
+    ocrEventSource = new EventSource(
+        `${baseUrl.replace(/\/$/, '')}/events/${encodeURIComponent(verificationId)}?token=${encodeURIComponent(eventsKey)}`
+    );
+    ocrEventSource.addEventListener('complete', () => {
+        console.log('OCR completed (via event)');
+        close();
+        onComplete();
+    });
+    // Stream timed out or the service is unreachable: go back to polling
+    ocrEventSource.addEventListener('timeout', () => {
+        close();
+        onUnavailable();
+    });
+    ocrEventSource.onerror = () => {
+        if (!ocrEventSource) return;
+        console.warn('OCR event stream failed, falling back to polling');
+        close();
+        onUnavailable();
+    };
+    return true;
+}
+
+function startOCRPolling(verificationId, eventsKey = null) {
+    // Clear any existing polling or subscription
     if (ocrPollingInterval) {
         clearInterval(ocrPollingInterval);
+        ocrPollingInterval = null;
+    }
+    if (ocrEventSource) {
+        ocrEventSource.close();
+        ocrEventSource = null;
     }
+    clearTimeout(ocrIdleTimer);
     
     let attempts = 0;
     const maxAttempts = 120; // Poll for 10 minutes (120 * 5 seconds) - OCR can take time
@@ -829,19 +890,43 @@ function startOCRPolling(verificationId) {
     // Check immediately first (in case OCR already completed)
     checkOCRStatus(verificationId);
     
-    ocrPollingInterval = setInterval(() => {
-        attempts++;
+    // One database read when the event arrives instead of one every 5 seconds. Polling
+    // resumes if the row is not final yet (e.g. another worker is still writing it).
+    const onComplete = () => {
         checkOCRStatus(verificationId);
-        
-        // Only stop if we've tried for a very long time (10 minutes)
-        if (attempts >= maxAttempts) {
-            console.log('OCR polling reached max attempts, but continuing to check...');
-            // Don't stop - keep checking, but less frequently
-            clearInterval(ocrPollingInterval);
-            // Continue with longer intervals (every 30 seconds)
-            ocrPollingInterval = setInterval(() => checkOCRStatus(verificationId), 30000);
-        }
-    }, 5000); // Poll every 5 seconds
+        startInterval();
+    };
+    if (subscribeToOCR(verificationId, eventsKey, onComplete, startInterval)) {
+        scheduleIdleCheck(OCR_EVENTS_IDLE_MS);
+        return;
+    }
+    startInterval();
+    
+    function scheduleIdleCheck(delay) {
+        ocrIdleTimer = setTimeout(() => {
+            // The stream has delivered, or polling has taken over
+            if (!ocrEventSource) return;
+            checkOCRStatus(verificationId);
+            scheduleIdleCheck(Math.min(delay * 2, OCR_EVENTS_IDLE_MAX_MS));
+        }, delay);
+    }
+    
+    function startInterval() {
+        if (ocrPollingInterval) return;
+        ocrPollingInterval = setInterval(() => {
+            attempts++;
+            checkOCRStatus(verificationId);
+            
+            // Only stop if we've tried for a very long time (10 minutes)
+            if (attempts >= maxAttempts) {
+                console.log('OCR polling reached max attempts, but continuing to check...');
+                // Don't stop - keep checking, but less frequently
+                clearInterval(ocrPollingInterval);
+                // Continue with longer intervals (every 30 seconds)
+                ocrPollingInterval = setInterval(() => checkOCRStatus(verificationId), 30000);
+            }
+        }, 5000); // Poll every 5 seconds
+    }
     
     async function checkOCRStatus(verificationId) {
         try {
@@ -858,9 +943,13 @@ function startOCRPolling(verificationId) {
             
             // If OCR is complete, fetch full verification and display results
             if (data.ocr_status === 'complete') {
-                console.log('OCR completed (via polling), fetching full verification data');
+                console.log('OCR completed, fetching full verification data');
                 clearInterval(ocrPollingInterval);
                 ocrPollingInterval = null;
+                if (ocrEventSource) {
+                    ocrEventSource.close();
+                    ocrEventSource = null;
+                }
                 
                 // Fetch the complete verification record with all data
                 try {
@@ -900,6 +989,10 @@ function startOCRPolling(verificationId) {
                 console.warn('OCR processing failed');
                 clearInterval(ocrPollingInterval);
                 ocrPollingInterval = null;
+                if (ocrEventSource) {
+                    ocrEventSource.close();
+                    ocrEventSource = null;
+                }
                 showNotification('OCR processing failed. Please try again.', 'error');
             } else {
                 // Still pending - update the message to show we're still waiting
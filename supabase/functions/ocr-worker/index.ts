@@ -3,6 +3,12 @@ import { createClient } from 'https://esm.sh/@supabase/supabase-js@2.38.5'
 const supabaseUrl = Deno.env.get('SUPABASE_URL')
 const serviceRoleKey = Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')
 const ocrServiceUrl = Deno.env.get('OCR_SERVICE_URL')
+// Time budget the OCR service gets per image
+const OCR_DEADLINE_MS = Number(Deno.env.get('OCR_DEADLINE_MS') ?? '60000')
+// Longest Retry-After waited out within one run; longer waits are left to the next cron tick
+const MAX_RETRY_WAIT_S = Number(Deno.env.get('OCR_MAX_RETRY_WAIT_S') ?? '10')
+// Back-pressure and gateway errors: the row stays pending and is tried again
+const TRANSIENT_STATUSES = [429, 502, 503, 504]
 
 if (!supabaseUrl || !serviceRoleKey) {
   console.error('Missing required environment variables')
@@ -76,12 +82,32 @@ Deno.serve(async (req) => {
     }
 
     console.log('Calling OCR service:', ocrServiceUrl)
-    const formData = new FormData()
-    formData.append('file', new Blob([fileData]), 'id.jpg')
+    // Ask the service to extract fields too; older deployments ignore the flag
+    const ocrUrl = new URL(ocrServiceUrl)
+    ocrUrl.searchParams.set('extract', 'true')
 
     let ocrResponse: Response
     try {
-      ocrResponse = await fetch(ocrServiceUrl, { method: 'POST', body: formData })
+      let waited = 0
+      while (true) {
+        const formData = new FormData()
+        formData.append('file', new Blob([fileData]), 'id.jpg')
+        // Cron-driven work yields to interactive uploads in the service's scheduler.
+        // The service returns its best partial result once the budget is spent;
+        // the abort covers a service that never answers at all.
+        ocrResponse = await fetch(ocrUrl, {
+          method: 'POST',
+          body: formData,
+          headers: { 'X-OCR-Priority': 'worker', 'X-OCR-Deadline-Ms': String(OCR_DEADLINE_MS) },
+          signal: AbortSignal.timeout(OCR_DEADLINE_MS + 10000),
+        })
+        const retryAfter = Number(ocrResponse.headers.get('Retry-After') ?? '1') || 1
+        if (ocrResponse.status !== 503 || waited + retryAfter > MAX_RETRY_WAIT_S) break
+        // The worker lane is full: wait as long as the service asks, then try again
+        await ocrResponse.body?.cancel()
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000))
+        waited += retryAfter
+      }
     } catch (fetchError) {
       console.error('OCR service fetch error:', fetchError)
       const errorMsg = fetchError instanceof Error ? fetchError.message : String(fetchError)
@@ -98,7 +124,18 @@ Deno.serve(async (req) => {
       })
     }
 
+    if (TRANSIENT_STATUSES.includes(ocrResponse.status)) {
+      // Busy, not broken: leave the row pending for the next run
+      const retryAfter = ocrResponse.headers.get('Retry-After') ?? '30'
+      console.warn('OCR service busy:', ocrResponse.status, await ocrResponse.text())
+      return new Response(JSON.stringify({ error: 'OCR service busy', status: ocrResponse.status }), {
+        status: 503,
+        headers: { 'Content-Type': 'application/json', 'Retry-After': retryAfter }
+      })
+    }
+
     if (!ocrResponse.ok) {
+      // A real rejection, e.g. 422 "retake photo" from the quality gate or an undecodable upload
       const errorText = await ocrResponse.text()
       console.error('OCR service error:', ocrResponse.status, errorText)
       await supabase
@@ -115,7 +152,13 @@ Deno.serve(async (req) => {
       })
     }
 
-    const { text } = await ocrResponse.json() as { text: string }
+    // Per-stage service time (queue, decode, preprocess, each PSM pass, ...) for the function logs
+    console.log('OCR service timing:', ocrResponse.headers.get('Server-Timing'))
+
+    const { text, fields } = await ocrResponse.json() as {
+      text: string
+      fields?: { id_type: string | null, id_number: string | null, holder_name: string | null } | null
+    }
 
     // Normalize text: fix common OCR errors
     let normalizedText = text
@@ -232,6 +275,13 @@ Deno.serve(async (req) => {
       holderName = holderName.replace(/\s*-\s*$/, '').replace(/\s+/g, ' ').trim()
     }
 
+    // Prefer the service's extraction when it found a field; keep ours as the fallback
+    if (fields) {
+      idNumber = fields.id_number ?? idNumber
+      holderName = fields.holder_name ?? holderName
+      idType = fields.id_type ?? idType
+    }
+
     await supabase
       .from('verifications')
       .update({
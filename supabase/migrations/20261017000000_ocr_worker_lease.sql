@@ -0,0 +1,13 @@
+-- Leasing columns for the batch OCR worker (ocr_service/worker.py).
+-- A worker claims pending rows by setting ocr_status = 'processing' and a lease;
+-- rows whose lease expires are claimed again, up to the worker's attempt limit.
+alter table public.verifications
+  add column if not exists ocr_attempts integer not null default 0,
+  add column if not exists ocr_lease_until timestamptz,
+  add column if not exists ocr_leased_by text,
+  add column if not exists ocr_error text;
+
+-- Claims scan pending (and expired processing) rows oldest first
+create index if not exists verifications_ocr_queue
+  on public.verifications (created_at)
+  where ocr_status in ('pending', 'processing');
@@ -0,0 +1,5 @@
+-- Completion events from the OCR service (ocr_service/events.py).
+-- The uploading page keeps a random key and stores only its SHA-256 here; the
+-- database webhook passes it to /ingest, and /events/{id}?token=<key> checks it.
+alter table public.verifications
+  add column if not exists ocr_events_key_hash text;